@@ -0,0 +1,71 @@
+"""Compare the reads of single objects with and without the response cache.
+
+Run it with ``python -m benchmarks.cache``.
+"""
+
+import argparse
+import json
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from denseedia.api import operations
+from denseedia.api.cache import response_cache
+from .common import populate, report, timeit, use_temporary_database
+
+
+def validated_path(get_model) -> bytes:
+    """Do what FastAPI does with a response_model."""
+    return JSONResponse(jsonable_encoder(get_model())).body
+
+
+def decoded(body: bytes):
+    """Decode a body, with the versions of an element sorted : the ORM doesn't order them."""
+    content = json.loads(body)
+    if "versions" in content:
+        content["versions"].sort(key=lambda version: version["id"])
+    return content
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--edia", type=int, default=10_000)
+    parser.add_argument("--versions", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    use_temporary_database()
+    populate(args.edia, args.edia, elements=0, versions=0)
+    # One edium with a long history
+    populate(1, 0, elements=5, versions=args.versions)
+    edium_id = args.edia + 1
+    element_id = 1
+
+    cases = [
+        (
+            f"/edium/{edium_id}",
+            lambda: validated_path(lambda: operations.get_one_edium(edium_id)),
+            lambda: operations.get_one_edium_body(edium_id),
+        ),
+        (
+            "/link/1",
+            lambda: validated_path(lambda: operations.get_one_link(1)),
+            lambda: operations.get_one_link_body(1),
+        ),
+        (
+            f"/element/{element_id}?versions=all",
+            lambda: validated_path(lambda: operations.get_one_element(element_id, "all")),
+            lambda: operations.get_one_element_body(element_id, "all"),
+        ),
+    ]
+    for (name, uncached, cached) in cases:
+        assert decoded(uncached()) == decoded(cached()), f"{name} : the outputs differ"
+        print(f"{name} ({args.reads} reads)")
+        report("  without cache (ORM + pydantic)", timeit(lambda: [uncached() for _ in range(args.reads)], args.repeat))
+        report("  with cache", timeit(lambda: [cached() for _ in range(args.reads)], args.repeat))
+    print(response_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
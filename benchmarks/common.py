@@ -0,0 +1,66 @@
+"""Define helpers shared by the benchmarks."""
+
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from denseedia import helpers
+from denseedia.storage import tables
+from denseedia.storage.tables import Edium, Element, Link, orm, Version
+
+KINDS = ["game", "music", "book", "anime", "website"]
+ELEMENT_NAMES = ["url", "comment", "rating", "year", "todo"]
+
+
+def use_temporary_database() -> Path:
+    """Bind the database to a new temporary file and return its path."""
+    file_path = Path(tempfile.mkdtemp(prefix="denseedia-bench-")) / "bench.db"
+    tables.use_database(file_path)
+    return file_path
+
+
+def populate(edia: int, links: int, elements: int, versions: int, seed: int = 0) -> None:
+    """Fill the database with random edia, links, elements and versions."""
+    rng = random.Random(seed)
+    with orm.db_session:
+        all_edia = [
+            Edium(title=f"Edium {index}", kind=rng.choice(KINDS))
+            for index in range(edia)
+        ]
+        orm.flush()
+        for _ in range(links):
+            Link(
+                start=rng.choice(all_edia),
+                end=rng.choice(all_edia),
+                directed=rng.random() < 0.8,
+                label=rng.choice(["", "origin", "sequel"]),
+            )
+        for edium in all_edia:
+            for name in ELEMENT_NAMES[:elements]:
+                element = Element(edium=edium, name=name)
+                for index in range(versions):
+                    Version(
+                        element=element,
+                        value_type=2,
+                        json=rng.randint(0, 100),
+                        last=index == versions - 1,
+                        creation_date=helpers.now(),
+                    )
+
+
+def timeit(func: Callable[[], object], repeat: int = 5) -> List[float]:
+    """Return the durations of several calls of ``func``, in milliseconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def report(name: str, durations: List[float]) -> None:
+    """Print the median and the best duration."""
+    print(f"{name:<40} median {statistics.median(durations):9.2f} ms   best {min(durations):9.2f} ms")
@@ -0,0 +1,54 @@
+"""Compare the ORM and the set-based deletion of heavily versioned edia.
+
+Run it with ``python -m benchmarks.deletions``.
+"""
+
+import argparse
+import time
+
+from denseedia import helpers
+from denseedia.storage import deletions
+from denseedia.storage.tables import Edium, Element, orm, Version
+from .common import use_temporary_database
+
+
+def create_edium(elements: int, versions: int) -> int:
+    with orm.db_session:
+        edium = Edium(title="Heavy")
+        for index in range(elements):
+            element = Element(edium=edium, name=f"element {index}")
+            for value in range(versions):
+                Version(element=element, value_type=2, json=value, last=value == versions - 1, creation_date=helpers.now())
+        orm.flush()
+        return edium.id
+
+
+def delete_with_orm(edium_id: int) -> str:
+    with orm.db_session:
+        edium = Edium[edium_id]
+        edium.bury()
+        edium.delete()
+    return ""
+
+
+def delete_set_based(edium_id: int) -> str:
+    with orm.db_session:
+        return f"({deletions.delete_edium(edium_id)})"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=20)
+    parser.add_argument("--versions", type=int, default=2000, help="Versions per element")
+    args = parser.parse_args()
+
+    use_temporary_database()
+    for (label, delete) in (("ORM", delete_with_orm), ("set-based", delete_set_based)):
+        edium_id = create_edium(args.elements, args.versions)
+        start = time.perf_counter()
+        details = delete(edium_id)
+        print(f"{label:<12}{(time.perf_counter() - start) * 1000:9.1f} ms   {details}")
+
+
+if __name__ == "__main__":
+    main()
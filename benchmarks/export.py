@@ -0,0 +1,47 @@
+"""Measure the graph export : time to the first chunk, total time and peak memory.
+
+Run it with ``python -m benchmarks.export``.
+"""
+
+import argparse
+import time
+import tracemalloc
+from typing import Optional as Opt
+
+from denseedia import models
+from denseedia.storage import export
+from .common import populate, use_temporary_database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--edia", type=int, default=100_000)
+    parser.add_argument("--links", type=int, default=300_000)
+    args = parser.parse_args()
+
+    use_temporary_database()
+    populate(args.edia, args.links, elements=0, versions=0)
+    for graph_format in models.GraphFormat.all_formats:
+        tracemalloc.start()
+        start = time.perf_counter()
+        chunks = export.export_graph(graph_format)
+        first: Opt[float] = None
+        size = 0
+        for chunk in chunks:
+            if first is None:
+                first = time.perf_counter() - start
+            size += len(chunk)
+        total = time.perf_counter() - start
+        if first is None:
+            # Nothing was yielded
+            first = total
+        (_, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{graph_format:<10} first chunk {first * 1000:7.2f} ms   total {total * 1000:9.1f} ms   "
+            f"{size / 1e6:6.1f} MB written   peak memory {peak / 1e6:5.2f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Compare the payload sizes and encode times of the response formats.
+
+Run it with ``python -m benchmarks.formats``. MessagePack and brotli are only
+measured if their packages are installed.
+"""
+
+import argparse
+import gzip
+import json
+
+from denseedia.api import operations
+from denseedia.api.compression import brotli_available
+from denseedia.api.responses import (
+    ColumnarJSONResponse,
+    MessagePackResponse,
+    msgpack_available,
+    TrustedJSONResponse,
+)
+from .common import populate, timeit, use_temporary_database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--edia", type=int, default=10_000)
+    parser.add_argument("--links", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    use_temporary_database()
+    populate(args.edia, args.links, elements=0, versions=0)
+    rows = operations.get_all_links_rows()
+
+    formats = {
+        "json": (TrustedJSONResponse, json.loads),
+        "columnar json": (ColumnarJSONResponse, json.loads),
+    }
+    if msgpack_available():
+        import msgpack
+        formats["msgpack"] = (MessagePackResponse, msgpack.unpackb)
+    compressions = {
+        "identity": lambda body: body,
+        "gzip": lambda body: gzip.compress(body, compresslevel=6),
+    }
+    if brotli_available():
+        import brotli
+        compressions["br"] = lambda body: brotli.compress(body, quality=8)
+
+    print(f"/link with {len(rows)} links")
+    print(f"{'format':<16}{'encoding':<10}{'size (kB)':>12}{'encode (ms)':>14}{'decode (ms)':>14}")
+    for (format_name, (response_class, decode)) in formats.items():
+        body = response_class(rows).body
+        encode_ms = min(timeit(lambda: response_class(rows).body, args.repeat))
+        decode_ms = min(timeit(lambda: decode(body), args.repeat))
+        for (compression_name, compress) in compressions.items():
+            compressed = compress(body)
+            compress_ms = min(timeit(lambda: compress(body), args.repeat))
+            print(
+                f"{format_name:<16}{compression_name:<10}{len(compressed) / 1000:>12.1f}"
+                f"{encode_ms + compress_ms:>14.2f}{decode_ms:>14.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Measure the graph analysis : loading the arrays, analysing, then a cached read.
+
+Run it with ``python -m benchmarks.graph``.
+"""
+
+import argparse
+
+from denseedia.storage import graph
+from denseedia.storage.tables import orm
+from .common import populate, report, timeit, use_temporary_database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--edia", type=int, default=100_000)
+    parser.add_argument("--links", type=int, default=300_000)
+    args = parser.parse_args()
+
+    use_temporary_database()
+    populate(args.edia, args.links, elements=0, versions=0)
+    with orm.db_session:
+        arrays = graph.load_arrays()
+        report("load the arrays", timeit(graph.load_arrays, repeat=3))
+        report("analyse", timeit(lambda: graph.analyse(arrays), repeat=3))
+        graph.cache.get(None, None)
+        report("cached stats", timeit(lambda: graph.cache.get(None, None).to_dict(10)))
+
+
+if __name__ == "__main__":
+    main()
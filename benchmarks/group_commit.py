@@ -0,0 +1,44 @@
+"""Compare the write throughput with and without group commit.
+
+Run it with ``python -m benchmarks.group_commit``.
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from denseedia import models
+from denseedia.api import operations, writes
+from .common import use_temporary_database
+
+
+def measure(threads: int, writes_per_thread: int) -> float:
+    """Return the number of writes per second made by concurrent threads."""
+    def work(thread_index: int) -> None:
+        for index in range(writes_per_thread):
+            body = models.CreateEdiumModel(title=f"Edium {thread_index}-{index}")
+            writes.run(operations.create_one_edium, body)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(work, range(threads)))
+    return threads * writes_per_thread / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--writes", type=int, default=50, help="Writes per thread")
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 1, 2, 5], help="In milliseconds")
+    args = parser.parse_args()
+
+    use_temporary_database()
+    for window in args.windows:
+        writes.use_group_commit(window / 1000)
+        label = "without group commit" if window == 0 else f"window {window} ms"
+        throughput = measure(args.threads, args.writes)
+        print(f"{label:<24}{throughput:>10.0f} writes/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Measure the space saved by the delta encoding of long string histories, and its read cost.
+
+Each note is edited many times, a few words at a time, then stored with a full
+value every ``interval`` versions. Run it with ``python -m benchmarks.histories``.
+"""
+
+import argparse
+import random
+
+from denseedia import models
+from denseedia.api import operations
+from denseedia.api.cache import response_cache
+from denseedia.storage import histories
+from denseedia.storage.tables import database, Edium, Element, orm, Version
+from .common import report, timeit, use_temporary_database
+
+WORDS = "the a note about some game music book that I liked because of its story and its sound".split()
+
+
+def edited_history(rng: random.Random, length: int, edits: int):
+    """Yield the successive values of a note of ``length`` words, edited a few words or a line at a time."""
+    lines = [[rng.choice(WORDS) for _ in range(12)] for _ in range(length // 12)]
+    for _ in range(edits):
+        if rng.random() < 0.1:
+            lines.insert(rng.randrange(len(lines) + 1), [rng.choice(WORDS) for _ in range(12)])
+        for _ in range(rng.randint(1, 3)):
+            line = rng.choice(lines)
+            line[rng.randrange(len(line))] = rng.choice(WORDS)
+        yield "\n".join(" ".join(line) for line in lines)
+
+
+def populate_notes(notes: int, words: int, edits: int) -> None:
+    rng = random.Random(0)
+    with orm.db_session:
+        for index in range(notes):
+            element = Element(edium=Edium(title=f"Noted {index}"), name="comment")
+            for value in edited_history(rng, words, edits):
+                element.create_version2("str", value)
+
+
+def stored_size() -> int:
+    with orm.db_session:
+        return database.select('SELECT SUM(length("json")) FROM "Version"')[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--notes", type=int, default=20)
+    parser.add_argument("--words", type=int, default=400)
+    parser.add_argument("--edits", type=int, default=200)
+    parser.add_argument("--intervals", type=int, nargs="+", default=[0, 8, 32, 128])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    use_temporary_database()
+    # Measure the reads, not the cache
+    response_cache.resize(0)
+    populate_notes(args.notes, args.words, args.edits)
+    with orm.db_session:
+        oldest = orm.min(v.id for v in Version if v.element.id == 1)
+    for interval in args.intervals:
+        with orm.db_session:
+            histories.encode_name("comment", interval)
+        print(f"interval {interval} : {stored_size() / 2 ** 20:.2f} MiB stored")
+
+        def read_oldest():
+            with orm.db_session:
+                Version[oldest].get_value()
+
+        def read_body(mode):
+            return lambda: operations.get_one_element_body(1, mode)
+
+        report("  GET /element/1?versions=all", timeit(read_body(models.VersionsMode.ALL), args.repeat))
+        report("  GET /element/1 (last version)", timeit(read_body(models.VersionsMode.SINGLE), args.repeat))
+        report("  oldest version (ORM)", timeit(read_oldest, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
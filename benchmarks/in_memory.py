@@ -0,0 +1,94 @@
+"""Compare the request latency of the file-backed and the in-memory modes.
+
+Run it with ``python -m benchmarks.in_memory``. Each mode runs in its own
+process, on a copy of the same database, with concurrent clients that call
+the operations of the endpoints : they mostly read and sometimes write.
+"""
+
+import argparse
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+from .common import populate, use_temporary_database
+
+
+def percentile(durations: List[float], ratio: float) -> float:
+    ordered = sorted(durations)
+    return ordered[min(len(ordered) - 1, int(ratio * len(ordered)))]
+
+
+def measure(file_path: Path, in_memory: bool, clients: int, requests: int, edia: int) -> None:
+    """Serve the file in one mode, and print the latency percentiles."""
+    from denseedia import models
+    from denseedia.api import operations
+    from denseedia.storage import snapshots, tables
+
+    if in_memory:
+        snapshots.use_memory_database(file_path, interval=3600)
+    else:
+        tables.use_database(file_path)
+
+    def work(client_index: int) -> List[float]:
+        rng = random.Random(client_index)
+        durations = []
+        for index in range(requests):
+            edium_id = rng.randint(1, edia)
+            start = time.perf_counter()
+            if index % 10 == 9:
+                operations.create_one_edium(models.CreateEdiumModel(title=f"New {client_index}-{index}"))
+            elif index % 2:
+                operations.get_elements_of_one_edium_rows(edium_id, models.VersionsMode.ALL)
+            else:
+                operations.get_one_edium(edium_id)
+            durations.append((time.perf_counter() - start) * 1000)
+        return durations
+
+    with ThreadPoolExecutor(clients) as executor:
+        durations = [duration for batch in executor.map(work, range(clients)) for duration in batch]
+    label = "in memory" if in_memory else "file"
+    print(
+        f"{label:<12}p50 {statistics.median(durations):7.2f} ms   "
+        f"p99 {percentile(durations, 0.99):7.2f} ms   ({len(durations)} requests)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per client")
+    parser.add_argument("--edia", type=int, default=5000)
+    parser.add_argument("--measure", choices=["file", "memory"], help=argparse.SUPPRESS)
+    parser.add_argument("--file", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        measure(args.file, args.measure == "memory", args.clients, args.requests, args.edia)
+        return
+
+    source = use_temporary_database()
+    populate(edia=args.edia, links=args.edia, elements=5, versions=3)
+    # Move the content of the WAL to the file before copying it
+    sqlite3.connect(str(source)).execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    for mode in ("file", "memory"):
+        copy = source.with_name(f"{mode}.db")
+        shutil.copyfile(source, copy)
+        subprocess.run([
+            sys.executable, "-m", "benchmarks.in_memory",
+            "--measure", mode,
+            "--file", str(copy),
+            "--clients", str(args.clients),
+            "--requests", str(args.requests),
+            "--edia", str(args.edia),
+        ], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Measure the ingestion of versions : one call per point against a bulk ingestion.
+
+A year of hourly points is backfilled for each element. The per-point path
+is only measured on a sample, and extrapolated. Run it with
+``python -m benchmarks.ingestion``.
+"""
+
+import argparse
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+from denseedia import models
+from denseedia.api import operations
+from denseedia.storage.tables import Element, orm
+from .common import populate, use_temporary_database
+
+HOURS_PER_YEAR = 365 * 24
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--elements", type=int, default=10)
+    parser.add_argument("--sample", type=int, default=500)
+    args = parser.parse_args()
+
+    use_temporary_database()
+    populate(args.elements, 0, elements=1, versions=1)
+    with orm.db_session:
+        element_ids = [element.id for element in Element.select()]
+    rng = random.Random(0)
+    start = datetime(2020, 1, 1)
+    points = [
+        (start + timedelta(hours=hour), 20 + 10 * math.sin(hour / 24 * 2 * math.pi) + rng.random())
+        for hour in range(HOURS_PER_YEAR)
+    ]
+    total = HOURS_PER_YEAR * len(element_ids)
+
+    begin = time.perf_counter()
+    for (_, value) in points[:args.sample]:
+        operations.create_one_version(element_ids[0], models.CreateVersionModel(value_type="float", value_json=value))
+    per_point = (time.perf_counter() - begin) / args.sample
+    print(f"one call per point     {per_point * 1e6:8.1f} µs per point   {per_point * total:8.1f} s for {total} points")
+
+    begin = time.perf_counter()
+    series = [
+        models.ElementVersionSeriesModel(element_id=element_id, value_type="float", points=points)
+        for element_id in element_ids
+    ]
+    validated = time.perf_counter()
+    operations.ingest_versions(series)
+    end = time.perf_counter()
+    print(
+        f"bulk ingestion         {(end - begin) / total * 1e6:8.1f} µs per point   {end - begin:8.1f} s for {total} points "
+        f"(validation {validated - begin:.1f} s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
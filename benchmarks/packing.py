@@ -0,0 +1,84 @@
+"""Measure the space saved by the compression of the large values, and its CPU cost.
+
+The same texts are written with several thresholds, each under its own
+element name, then read back whole, without their versions, and scanned by
+a filter. Run it with ``python -m benchmarks.packing``.
+"""
+
+import argparse
+import random
+from typing import List
+
+from denseedia import models
+from denseedia.api import operations
+from denseedia.api.cache import response_cache
+from denseedia.storage import packing
+from denseedia.storage.tables import database, orm
+from .common import report, timeit, use_temporary_database
+
+WORDS = "the a song about some night road light that I heard because of its chorus and its sound".split()
+SIZES = [200, 1000, 5000, 20000]
+
+
+def text(rng: random.Random, size: int) -> str:
+    lines: List[str] = []
+    length = 0
+    while length < size:
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 10))))
+        length += len(lines[-1])
+    return "\n".join(lines)
+
+
+def stored_size(name: str) -> int:
+    with orm.db_session:
+        return database.select(
+            'SELECT SUM(length(v."json") + COALESCE(length(v."packed"), 0)) FROM "Version" v '
+            'JOIN "Element" e ON v."element" = e."id" JOIN "ElementName" n ON e."name_ref" = n."id" '
+            'WHERE n."text" = $name',
+            {"name": name},
+        )[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--texts", type=int, default=400)
+    parser.add_argument("--thresholds", type=int, nargs="+", default=[0, 512, 2048, 8192])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    use_temporary_database()
+    response_cache.resize(0)
+    rng = random.Random(0)
+    texts = [text(rng, rng.choice(SIZES)) for _ in range(args.texts)]
+    edium_ids = [operations.create_one_edium(models.CreateEdiumModel(title=f"Song {n}")).id for n in range(len(texts))]
+    print(f"{len(texts)} texts of {sum(map(len, texts)) / 2 ** 20:.2f} MiB, compressed with {packing.codec}")
+    for threshold in args.thresholds:
+        packing.configure(threshold)
+        name = f"lyrics {threshold}"
+
+        def write():
+            return [
+                operations.create_one_element(edium_id, models.CreateElementModel(
+                    name=name,
+                    version=models.CreateVersionModel(value_type="str", value_json=value),
+                )).id
+                for (edium_id, value) in zip(edium_ids, texts)
+            ]
+
+        with orm.db_session:
+            start = database.select('SELECT COALESCE(MAX("id"), 0) FROM "Element"')[0]
+        report(f"threshold {threshold} : write", timeit(write, 1))
+        element_ids = range(start + 1, start + 1 + len(texts))
+        print(f"  {stored_size(name) / 2 ** 20:.2f} MiB stored")
+
+        def read(mode):
+            return lambda: [operations.get_one_element_body(element_id, mode) for element_id in element_ids]
+
+        report("  read with the value", timeit(read(models.VersionsMode.SINGLE), args.repeat))
+        report("  read without the versions", timeit(read(models.VersionsMode.NONE), args.repeat))
+        query = f"'{name}' ~ 'no such words'"
+        report("  filter scanning the values", timeit(lambda: operations.search_edia_by_filter(query, "id", 10, 0), args.repeat))
+
+
+if __name__ == "__main__":
+    main()
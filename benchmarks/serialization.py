@@ -0,0 +1,73 @@
+"""Compare the validated and the trusted serialization paths.
+
+Run it with ``python -m benchmarks.serialization``.
+"""
+
+import argparse
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import parse_obj_as
+
+from denseedia import models
+from denseedia.api import operations
+from denseedia.api.responses import TrustedJSONResponse
+from .common import populate, report, timeit, use_temporary_database
+
+
+def validated_path(model_type, get_content) -> bytes:
+    """Do what FastAPI does with a response_model."""
+    validated = parse_obj_as(model_type, get_content())
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def trusted_path(get_rows) -> bytes:
+    return TrustedJSONResponse(get_rows()).body
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--edia", type=int, default=10_000)
+    parser.add_argument("--links", type=int, default=20_000)
+    parser.add_argument("--versions", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    use_temporary_database()
+    populate(args.edia, args.links, elements=0, versions=0)
+    # One edium with a long history
+    populate(1, 0, elements=5, versions=args.versions)
+    edium_id = args.edia + 1
+
+    cases = [
+        (
+            "/edium",
+            lambda: validated_path(List[models.EdiumModel], operations.get_all_edia),
+            lambda: trusted_path(operations.get_all_edia_rows),
+        ),
+        (
+            "/link",
+            lambda: validated_path(List[models.LinkModel], operations.get_all_links),
+            lambda: trusted_path(operations.get_all_links_rows),
+        ),
+        (
+            f"/edium/{edium_id}/elements?versions=all",
+            lambda: validated_path(
+                List[models.ElementModel],
+                lambda: operations.get_elements_of_one_edium(edium_id, "all"),
+            ),
+            lambda: trusted_path(
+                lambda: operations.get_elements_of_one_edium_rows(edium_id, "all"),
+            ),
+        ),
+    ]
+    for (name, validated, trusted) in cases:
+        assert validated() == trusted(), f"{name} : the outputs differ"
+        print(name)
+        report("  validated (pydantic + jsonable_encoder)", timeit(validated, args.repeat))
+        report("  trusted (raw rows + json)", timeit(trusted, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Measure the trigram index : build, update by a write, fuzzy search and duplicate detection.
+
+Run it with ``python -m benchmarks.trigrams``. One edium out of 100 is a copy
+of another one with a typo.
+"""
+
+import argparse
+import random
+from typing import List
+
+from denseedia import models
+from denseedia.api import operations, writes
+from denseedia.storage import trigrams
+from denseedia.storage.tables import database, orm
+from .common import report, timeit, use_temporary_database
+
+# The English letter frequencies, for realistic trigram frequencies
+LETTERS = "etaoinshrdlcumwfgypbvkjxqz"
+LETTER_WEIGHTS = [
+    12.7, 9.1, 8.2, 7.5, 7.0, 6.7, 6.3, 6.1, 6.0, 4.3, 4.0, 2.8, 2.8,
+    2.4, 2.4, 2.2, 2.0, 2.0, 1.9, 1.5, 1.0, 0.8, 0.15, 0.15, 0.1, 0.07,
+]
+
+
+def make_word(rng: random.Random) -> str:
+    return "".join(rng.choices(LETTERS, LETTER_WEIGHTS, k=rng.randint(2, 9)))
+
+
+def insert_edia(count: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    vocabulary = [make_word(rng) for _ in range(20_000)]
+    # Like in natural language, a few words are much more frequent
+    weights = [1 / rank ** 0.5 for rank in range(1, len(vocabulary) + 1)]
+    titles: List[str] = []
+    for index in range(count):
+        if index % 100 == 99:
+            # A near duplicate of a previous title
+            title = list(rng.choice(titles))
+            title[rng.randrange(len(title))] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+            titles.append("".join(title))
+        else:
+            titles.append(" ".join(rng.choices(vocabulary, weights, k=rng.randint(2, 6))))
+    with orm.db_session:
+        database.get_connection().executemany(
+            'INSERT INTO "Edium" ("title", "kind", "creation_date", "updated_at") '
+            "VALUES (?, 'game', '2022-01-01 00:00:00.000000', '2022-01-01 00:00:00.000000')",
+            ((title,) for title in titles),
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--edia", type=int, default=100_000)
+    args = parser.parse_args()
+
+    use_temporary_database()
+    insert_edia(args.edia)
+    with orm.db_session:
+        report("build the index", timeit(trigrams.refresh, repeat=1))
+    titles = iter(f"renamed edium {number}" for number in range(1000))
+
+    def rename():
+        return writes.run(operations.modify_one_edium, 1, models.ModifyEdiumModel(title=next(titles)))
+
+    report("rename an edium, updating the index", timeit(rename, repeat=5))
+    with orm.db_session:
+        report("fuzzy search", timeit(lambda: trigrams.search("tormarel kasu"), repeat=5))
+        pairs = []
+        report("dedupe", timeit(lambda: pairs.append(len(trigrams.duplicates("game", 0.8))), repeat=1))
+    print(f"{pairs[0]} likely duplicate pairs among {args.edia} edia")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
 """Define the FastAPI app."""
 
-from typing import List, Tuple
+from datetime import datetime
+from typing import List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
-from . import operations
+from . import events, idle, launch, operations, responses, writes
+from .compression import CompressionMiddleware
 from .. import exceptions, models
+from ..constants import CHANGES_PAGE_SIZE, COMPRESSION_MINIMUM_SIZE, DELTA_INTERVAL
 
 app = FastAPI(title="DenseEdia")
 
@@ -17,6 +21,35 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
+app.add_middleware(idle.ActivityMiddleware)
+
+
+def expected_revision(
+    if_match: Optional[str] = Header(None, description='The expected revision of the element, like "3"'),
+    expected_revision: Optional[int] = Query(None, ge=0, description="The expected revision, instead of If-Match"),
+) -> Optional[int]:
+    """Return the revision of the element expected by a write, if any.
+
+    The write is refused with a 409 if the element is at another revision. The
+    If-Match header takes precedence over the query parameter.
+    """
+    if if_match is None:
+        return expected_revision
+    try:
+        return responses.parse_revision_header(if_match)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid If-Match header : {if_match!r}")
+
+
+@app.on_event("startup")
+def configure_worker() -> None:
+    launch.configure_worker()
+
+
+@app.on_event("shutdown")
+def shutdown_worker() -> None:
+    launch.shutdown_worker()
 
 
 @app.get(
@@ -24,11 +57,12 @@ app.add_middleware(
     operation_id="get_all_edia",
     summary="Get the list of all edia",
     response_model=List[models.EdiumModel],
+    responses=responses.LIST_RESPONSES,
     tags=["Edia"],
 )
-def get_all_edia() -> List[models.EdiumModel]:
+def get_all_edia(accept: Optional[str] = Header(None)) -> Response:
     """Get the list of all edia."""
-    return operations.get_all_edia()
+    return responses.negotiated_response(operations.get_all_edia_rows(), accept)
 
 
 @app.get(
@@ -38,10 +72,10 @@ def get_all_edia() -> List[models.EdiumModel]:
     response_model=models.EdiumModel,
     tags=["Edia"],
 )
-def get_one_edium(edium_id: int) -> models.EdiumModel:
+def get_one_edium(edium_id: int) -> Response:
     """Get one edium."""
     try:
-        return operations.get_one_edium(edium_id)
+        return responses.EncodedJSONResponse(operations.get_one_edium_body(edium_id))
     except exceptions.ObjectNotFound as err:
         raise HTTPException(status_code=404, detail=err.args[0])
 
@@ -55,7 +89,53 @@ def get_one_edium(edium_id: int) -> models.EdiumModel:
 )
 def create_one_edium(body: models.CreateEdiumModel) -> models.EdiumModel:
     """Create one edium."""
-    return operations.create_one_edium(body)
+    return writes.run(operations.create_one_edium, body)
+
+
+@app.patch(
+    path="/edium",
+    operation_id="modify_edia_by_filter",
+    summary="Modify all the edia matching a filter",
+    response_model=models.BulkResultModel,
+    tags=["Edia"],
+)
+def modify_edia_by_filter(
+    body: models.ModifyEdiumModel,
+    kind: Optional[str] = None,
+    title_contains: Optional[str] = None,
+    dry_run: bool = Query(False, description="Only count the matching edia"),
+) -> models.BulkResultModel:
+    """Set the title and/or the kind of all the edia matching the filters.
+
+    At least one filter, and a new title or kind, are needed. It's done in a
+    single statement, whatever the number of edia.
+    """
+    try:
+        return writes.run(operations.modify_edia_by_filter, kind, title_contains, body, dry_run)
+    except (exceptions.MissingFilter, exceptions.MissingModification) as err:
+        raise HTTPException(status_code=400, detail=err.args[0])
+
+
+@app.delete(
+    path="/edium",
+    operation_id="delete_edia_by_filter",
+    summary="Delete all the edia matching a filter",
+    response_model=models.BulkResultModel,
+    tags=["Edia"],
+)
+def delete_edia_by_filter(
+    kind: Optional[str] = None,
+    title_contains: Optional[str] = None,
+    dry_run: bool = Query(False, description="Only count the matching edia"),
+) -> models.BulkResultModel:
+    """Delete all the edia matching the filters, with their elements and links.
+
+    At least one filter is needed.
+    """
+    try:
+        return writes.run(operations.delete_edia_by_filter, kind, title_contains, dry_run)
+    except exceptions.MissingFilter as err:
+        raise HTTPException(status_code=400, detail=err.args[0])
 
 
 @app.patch(
@@ -68,7 +148,7 @@ def create_one_edium(body: models.CreateEdiumModel) -> models.EdiumModel:
 def modify_one_edium(edium_id: int, body: models.ModifyEdiumModel) -> models.EdiumModel:
     """Modify one edium."""
     try:
-        return operations.modify_one_edium(edium_id, body)
+        return writes.run(operations.modify_one_edium, edium_id, body)
     except exceptions.ObjectNotFound as err:
         raise HTTPException(status_code=404, detail=err.args[0])
 
@@ -83,24 +163,39 @@ def modify_one_edium(edium_id: int, body: models.ModifyEdiumModel) -> models.Edi
 def delete_one_edium(edium_id: int) -> models.EdiumModel:
     """Delete one edium."""
     try:
-        return operations.delete_one_edium(edium_id)
+        return writes.run(operations.delete_one_edium, edium_id)
     except exceptions.ObjectNotFound as err:
         raise HTTPException(status_code=404, detail=err.args[0])
 
 
+@app.get(
+    path="/kinds",
+    operation_id="get_kinds",
+    summary="Get the kinds of edia and their sizes",
+    response_model=List[models.KindModel],
+    tags=["Edia"],
+)
+def get_kinds() -> List[models.KindModel]:
+    """Get the kinds of edia and their sizes, from the biggest, without scanning the edia."""
+    return operations.get_kinds()
+
+
 @app.get(
     path="/edium/{edium_id}/elements",
     operation_id="get_elements_of_one_edium",
     summary="Get the elements of one edium and their versions",
     response_model=List[models.ElementModel],
+    responses=responses.LIST_RESPONSES,
     tags=["Elements"],
 )
 def get_elements_of_one_edium(
     edium_id: int,
     versions: models.VersionsMode.asType = Query(models.VersionsMode.NONE),
-) -> List[models.ElementModel]:
+    accept: Optional[str] = Header(None),
+) -> Response:
     """Get the elements of one edium and their versions."""
-    return operations.get_elements_of_one_edium(edium_id, mode=versions)
+    content = operations.get_elements_of_one_edium_rows(edium_id, mode=versions)
+    return responses.negotiated_response(content, accept)
 
 
 @app.get(
@@ -113,14 +208,62 @@ def get_elements_of_one_edium(
 def get_one_element(
     element_id: int,
     versions: models.VersionsMode.asType = Query(models.VersionsMode.NONE),
-) -> models.ElementModel:
+) -> Response:
     """Get one element and none, one or all of its versions."""
     try:
-        return operations.get_one_element(element_id, mode=versions)
+        return responses.EncodedJSONResponse(operations.get_one_element_body(element_id, mode=versions))
     except exceptions.ObjectNotFound as err:
         raise HTTPException(status_code=404, detail=err.args[0])
 
 
+@app.get(
+    path="/element/{element_id}/series",
+    operation_id="get_element_series",
+    summary="Get the numeric history of one element",
+    responses=responses.SERIES_RESPONSES,
+    tags=["Series"],
+)
+def get_element_series(
+    element_id: int,
+    bucket: Optional[int] = Query(None, ge=1, description="Bucket size in seconds"),
+    how: models.Aggregation.asType = Query(models.Aggregation.MEAN),
+    accept: Optional[str] = Header(None),
+) -> Response:
+    """Get the numeric history of one element.
+
+    The timestamps are UNIX timestamps in seconds. Only the INT and FLOAT
+    versions are used.
+    """
+    try:
+        content = operations.get_element_series(element_id, bucket, how)
+    except exceptions.ObjectNotFound as err:
+        raise HTTPException(status_code=404, detail=err.args[0])
+    return responses.series_response(content, accept)
+
+
+@app.get(
+    path="/series/{kind}/{element_name}",
+    operation_id="get_kind_series",
+    summary="Get the numeric history of one element name across the edia of a kind",
+    responses=responses.SERIES_RESPONSES,
+    tags=["Series"],
+)
+def get_kind_series(
+    kind: str,
+    element_name: str,
+    bucket: Optional[int] = Query(None, ge=1, description="Bucket size in seconds"),
+    how: models.Aggregation.asType = Query(models.Aggregation.MEAN),
+    accept: Optional[str] = Header(None),
+) -> Response:
+    """Get the numeric history of one element name across the edia of a kind.
+
+    The values are a matrix with one row per edium and one column per
+    timestamp, null when unknown.
+    """
+    content = operations.get_kind_series(kind, element_name, bucket, how)
+    return responses.series_response(content, accept)
+
+
 @app.post(
     path="/edium/{edium_id}/element",
     operation_id="create_one_element",
@@ -131,7 +274,7 @@ def get_one_element(
 def create_one_element(edium_id: int, body: models.CreateElementModel) -> models.ElementModel:
     """Create one element and its last version."""
     try:
-        return operations.create_one_element(edium_id, body)
+        return writes.run(operations.create_one_element, edium_id, body)
     except exceptions.ObjectNotFound as err:
         raise HTTPException(status_code=404, detail=err.args[0])
     except exceptions.DuplicateElementName as err:
@@ -145,12 +288,18 @@ def create_one_element(edium_id: int, body: models.CreateElementModel) -> models
     response_model=models.ElementModel,
     tags=["Elements"],
 )
-def modify_one_element(element_id: int, body: models.ModifyElementModel) -> models.ElementModel:
-    """Modify one edium."""
+def modify_one_element(
+    element_id: int,
+    body: models.ModifyElementModel,
+    revision: Optional[int] = Depends(expected_revision),
+) -> models.ElementModel:
+    """Modify one element."""
     try:
-        return operations.modify_one_element(element_id, body)
+        return writes.run(operations.modify_one_element, element_id, body, revision)
     except exceptions.ObjectNotFound as err:
         raise HTTPException(status_code=404, detail=err.args[0])
+    except exceptions.RevisionConflict as err:
+        raise HTTPException(status_code=409, detail=err.args[0])
 
 
 @app.delete(
@@ -160,12 +309,14 @@ def modify_one_element(element_id: int, body: models.ModifyElementModel) -> mode
     response_model=models.ElementModel,
     tags=["Elements"],
 )
-def delete_one_element(element_id: int) -> models.ElementModel:
+def delete_one_element(element_id: int, revision: Optional[int] = Depends(expected_revision)) -> models.ElementModel:
     """Delete one element."""
     try:
-        return operations.delete_one_element(element_id)
+        return writes.run(operations.delete_one_element, element_id, revision)
     except exceptions.ObjectNotFound as err:
         raise HTTPException(status_code=404, detail=err.args[0])
+    except exceptions.RevisionConflict as err:
+        raise HTTPException(status_code=409, detail=err.args[0])
 
 
 @app.post(
@@ -175,12 +326,67 @@ def delete_one_element(element_id: int) -> models.ElementModel:
     response_model=models.VersionModel,
     tags=["Elements"],
 )
-def create_one_version(element_id: int, body: models.CreateVersionModel) -> models.VersionModel:
-    """Create a new version for an element."""
+def create_one_version(
+    element_id: int,
+    body: models.CreateVersionModel,
+    revision: Optional[int] = Depends(expected_revision),
+) -> models.VersionModel:
+    """Create a new version for an element.
+
+    Each write to an element or its versions increments its ``revision``. Send
+    the revision read with ``If-Match`` to make sure nobody wrote it meanwhile :
+    the write is refused with a 409 otherwise, and the new revision is the
+    expected one plus one.
+    """
+    try:
+        return writes.run(operations.create_one_version, element_id, body, revision)
+    except exceptions.ObjectNotFound as err:
+        raise HTTPException(status_code=404, detail=err.args[0])
+    except exceptions.RevisionConflict as err:
+        raise HTTPException(status_code=409, detail=err.args[0])
+
+
+@app.post(
+    path="/element/{element_id}/versions",
+    operation_id="create_many_versions",
+    summary="Create many versions for an element, with their creation dates",
+    response_model=models.IngestionResultModel,
+    tags=["Elements"],
+)
+def create_many_versions(
+    element_id: int,
+    body: models.CreateVersionSeriesModel,
+    revision: Optional[int] = Depends(expected_revision),
+) -> models.IngestionResultModel:
+    """Create many versions for an element, from (creation date, value) points."""
+    # The points are validated already
+    series = models.ElementVersionSeriesModel.construct(element_id=element_id, expected_revision=revision, **dict(body))
+    try:
+        return writes.run(operations.ingest_versions, [series])
+    except exceptions.ObjectNotFound as err:
+        raise HTTPException(status_code=404, detail=err.args[0])
+    except exceptions.RevisionConflict as err:
+        raise HTTPException(status_code=409, detail=err.args[0])
+
+
+@app.post(
+    path="/versions",
+    operation_id="ingest_versions",
+    summary="Create many versions for many elements, with their creation dates",
+    response_model=models.IngestionResultModel,
+    tags=["Elements"],
+)
+def ingest_versions(body: List[models.ElementVersionSeriesModel]) -> models.IngestionResultModel:
+    """Create many versions for many elements, all the points being validated first.
+
+    Nothing is written if an element isn't at its ``expected_revision``.
+    """
     try:
-        return operations.create_one_version(element_id, body)
+        return writes.run(operations.ingest_versions, body)
     except exceptions.ObjectNotFound as err:
         raise HTTPException(status_code=404, detail=err.args[0])
+    except exceptions.RevisionConflict as err:
+        raise HTTPException(status_code=409, detail=err.args[0])
 
 
 @app.patch(
@@ -190,12 +396,18 @@ def create_one_version(element_id: int, body: models.CreateVersionModel) -> mode
     response_model=models.VersionModel,
     tags=["Elements"],
 )
-def modify_one_version(version_id: int, body: models.CreateVersionModel) -> models.VersionModel:
-    """Modify one version."""
+def modify_one_version(
+    version_id: int,
+    body: models.CreateVersionModel,
+    revision: Optional[int] = Depends(expected_revision),
+) -> models.VersionModel:
+    """Modify one version, the revision being the one of its element."""
     try:
-        return operations.modify_one_version(version_id, body)
+        return writes.run(operations.modify_one_version, version_id, body, revision)
     except exceptions.ObjectNotFound as err:
         raise HTTPException(status_code=404, detail=err.args[0])
+    except exceptions.RevisionConflict as err:
+        raise HTTPException(status_code=409, detail=err.args[0])
 
 
 @app.delete(
@@ -205,12 +417,14 @@ def modify_one_version(version_id: int, body: models.CreateVersionModel) -> mode
     response_model=models.VersionModel,
     tags=["Elements"],
 )
-def delete_one_version(version_id: int) -> models.VersionModel:
-    """Delete one version."""
+def delete_one_version(version_id: int, revision: Optional[int] = Depends(expected_revision)) -> models.VersionModel:
+    """Delete one version, the revision being the one of its element."""
     try:
-        return operations.delete_one_version(version_id)
+        return writes.run(operations.delete_one_version, version_id, revision)
     except exceptions.ObjectNotFound as err:
         raise HTTPException(status_code=404, detail=err.args[0])
+    except exceptions.RevisionConflict as err:
+        raise HTTPException(status_code=409, detail=err.args[0])
 
 
 @app.get(
@@ -218,11 +432,12 @@ def delete_one_version(version_id: int) -> models.VersionModel:
     operation_id="get_all_links",
     summary="Get the list of all links",
     response_model=List[models.LinkModel],
+    responses=responses.LIST_RESPONSES,
     tags=["Links"],
 )
-def get_all_links() -> List[models.LinkModel]:
+def get_all_links(accept: Optional[str] = Header(None)) -> Response:
     """Get the list of all links."""
-    return operations.get_all_links()
+    return responses.negotiated_response(operations.get_all_links_rows(), accept)
 
 
 @app.get(
@@ -232,10 +447,10 @@ def get_all_links() -> List[models.LinkModel]:
     response_model=models.LinkModel,
     tags=["Links"],
 )
-def get_one_link(link_id: int) -> models.LinkModel:
+def get_one_link(link_id: int) -> Response:
     """Get one link."""
     try:
-        return operations.get_one_link(link_id)
+        return responses.EncodedJSONResponse(operations.get_one_link_body(link_id))
     except exceptions.ObjectNotFound as err:
         raise HTTPException(status_code=404, detail=err.args[0])
 
@@ -260,11 +475,79 @@ def get_links_of_one_edium(edium_id: int) -> List[models.LinkModel]:
     tags=["Links"],
 )
 def create_one_link(body: models.CreateLinkModel) -> models.LinkModel:
-    """Create one link."""
+    """Create one link.
+
+    If the unique index of the links was added, an identical link is refused.
+    """
+    try:
+        return writes.run(operations.create_one_link, body)
+    except exceptions.ObjectNotFound as err:
+        raise HTTPException(status_code=404, detail=err.args[0])
+    except exceptions.DuplicateLink as err:
+        raise HTTPException(status_code=409, detail=err.args[0])
+
+
+@app.put(
+    path="/link",
+    operation_id="upsert_one_link",
+    summary="Get or create one link",
+    response_model=models.LinkModel,
+    status_code=201,
+    responses={200: {"description": "The link already existed", "model": models.LinkModel}},
+    tags=["Links"],
+)
+def upsert_one_link(body: models.CreateLinkModel, response: Response) -> models.LinkModel:
+    """Return the link with the same start, end, label and direction, created if needed.
+
+    It can be repeated safely. With the unique index of the links, it's a
+    single indexed statement.
+    """
     try:
-        return operations.create_one_link(body)
+        (link, created) = writes.run(operations.upsert_one_link, body)
     except exceptions.ObjectNotFound as err:
         raise HTTPException(status_code=404, detail=err.args[0])
+    if not created:
+        response.status_code = 200
+    return link
+
+
+@app.patch(
+    path="/link",
+    operation_id="modify_links_by_filter",
+    summary="Modify all the links matching a filter",
+    response_model=models.BulkResultModel,
+    tags=["Links"],
+)
+def modify_links_by_filter(
+    body: models.ModifyLinkModel,
+    label: Optional[str] = None,
+    dry_run: bool = Query(False, description="Only count the matching links"),
+) -> models.BulkResultModel:
+    """Relabel all the links with a label. The new label is needed."""
+    try:
+        return writes.run(operations.modify_links_by_filter, label, body, dry_run)
+    except (exceptions.MissingFilter, exceptions.MissingModification) as err:
+        raise HTTPException(status_code=400, detail=err.args[0])
+    except exceptions.DuplicateLink as err:
+        raise HTTPException(status_code=409, detail=err.args[0])
+
+
+@app.delete(
+    path="/link",
+    operation_id="delete_links_by_filter",
+    summary="Delete all the links matching a filter",
+    response_model=models.BulkResultModel,
+    tags=["Links"],
+)
+def delete_links_by_filter(
+    label: Optional[str] = None,
+    dry_run: bool = Query(False, description="Only count the matching links"),
+) -> models.BulkResultModel:
+    """Delete all the links with a label."""
+    try:
+        return writes.run(operations.delete_links_by_filter, label, dry_run)
+    except exceptions.MissingFilter as err:
+        raise HTTPException(status_code=400, detail=err.args[0])
 
 
 @app.patch(
@@ -277,9 +560,11 @@ def create_one_link(body: models.CreateLinkModel) -> models.LinkModel:
 def modify_one_link(link_id: int, body: models.ModifyLinkModel) -> models.LinkModel:
     """Modify one link."""
     try:
-        return operations.modify_one_link(link_id, body)
+        return writes.run(operations.modify_one_link, link_id, body)
     except exceptions.ObjectNotFound as err:
         raise HTTPException(status_code=404, detail=err.args[0])
+    except exceptions.DuplicateLink as err:
+        raise HTTPException(status_code=409, detail=err.args[0])
 
 
 @app.delete(
@@ -292,7 +577,184 @@ def modify_one_link(link_id: int, body: models.ModifyLinkModel) -> models.LinkMo
 def delete_one_link(link_id: int) -> models.LinkModel:
     """Delete one link."""
     try:
-        return operations.delete_one_link(link_id)
+        return writes.run(operations.delete_one_link, link_id)
+    except exceptions.ObjectNotFound as err:
+        raise HTTPException(status_code=404, detail=err.args[0])
+
+
+@app.get(
+    path="/changes",
+    operation_id="get_changes",
+    summary="Get the changes after a sequence number",
+    response_model=List[models.ChangeModel],
+    responses=responses.LIST_RESPONSES,
+    tags=["Changes"],
+)
+def get_changes(
+    since: int = Query(0, ge=0, description="Last sequence number already known"),
+    limit: int = Query(CHANGES_PAGE_SIZE, ge=1, le=CHANGES_PAGE_SIZE),
+    accept: Optional[str] = Header(None),
+) -> Response:
+    """Get the changes after a sequence number, oldest first.
+
+    Request again with the id of the last change as ``since`` until the list
+    is empty to catch up.
+    """
+    return responses.negotiated_response(operations.get_changes_rows(since, limit), accept)
+
+
+@app.get(
+    path="/changes/stream",
+    operation_id="stream_changes",
+    summary="Stream the changes as Server-Sent Events",
+    tags=["Changes"],
+)
+def stream_changes(
+    since: int = Query(0, ge=0, description="Last sequence number already known"),
+    last_event_id: Optional[int] = Header(None),
+) -> StreamingResponse:
+    """Stream the changes after a sequence number as Server-Sent Events.
+
+    The id of each event is the sequence number of the change. On reconnection,
+    the Last-Event-ID header takes precedence over ``since``.
+    """
+    if last_event_id is not None:
+        since = last_event_id
+    return StreamingResponse(
+        events.change_events(since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@app.get(
+    path="/sync",
+    operation_id="sync",
+    summary="Get what changed since a date",
+    response_model=models.SyncModel,
+    tags=["Changes"],
+)
+def sync(since: datetime = Query(..., description="The 'until' date of the previous sync")) -> Response:
+    """Get the edia, elements and links updated since a date, and the deleted ones.
+
+    The elements come with all their versions. Use the returned ``until`` date
+    as ``since`` for the next sync.
+    """
+    return responses.TrustedJSONResponse(operations.get_sync_rows(since))
+
+
+@app.get(
+    path="/search",
+    operation_id="search_edia_by_filter",
+    summary="Search the edia with a filter query",
+    response_model=List[models.EdiumModel],
+    tags=["Edia"],
+)
+def search_edia_by_filter(
+    q: str = Query(..., min_length=1, description="The filter, like 'kind = game and rating >= 8'"),
+    order: models.EdiumOrder.asType = Query(models.EdiumOrder.ID, description="The sort field, '-' for descending"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+) -> Response:
+    """Search the edia with a filter on their title, kind, dates, elements and links.
+
+    The filter is compiled to a single SQL query. See ``/search/explain`` for
+    the compiled query and the indexes it uses.
+    """
+    try:
+        return responses.TrustedJSONResponse(operations.search_edia_by_filter(q, order, limit, offset))
+    except exceptions.InvalidQuery as err:
+        raise HTTPException(status_code=400, detail=err.args[0])
+
+
+@app.get(
+    path="/search/explain",
+    operation_id="explain_filter",
+    summary="Show the SQL compiled from a filter query, and its plan",
+    response_model=models.QueryPlanModel,
+    tags=["Edia"],
+)
+def explain_filter(
+    q: str = Query(..., min_length=1),
+    order: models.EdiumOrder.asType = Query(models.EdiumOrder.ID),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+) -> models.QueryPlanModel:
+    """Show the SQL compiled from a filter query, and the query plan of SQLite."""
+    try:
+        return operations.explain_filter(q, order, limit, offset)
+    except exceptions.InvalidQuery as err:
+        raise HTTPException(status_code=400, detail=err.args[0])
+
+
+@app.get(
+    path="/search/similar",
+    operation_id="search_similar_edia",
+    summary="Search the edia with a similar title",
+    response_model=List[models.SimilarEdiumModel],
+    tags=["Edia"],
+)
+def search_similar_edia(
+    q: str = Query(..., min_length=1, description="The title to look for"),
+    kind: Optional[str] = None,
+    threshold: float = Query(0.3, gt=0, le=1, description="The minimal similarity"),
+    limit: int = Query(20, ge=1, le=1000),
+) -> Response:
+    """Search the edia by title similarity, the most similar first.
+
+    The similarity is the share of trigrams the titles have in common, so the
+    typos and the word order don't prevent a match.
+    """
+    return responses.TrustedJSONResponse(operations.search_similar_edia(q, kind, threshold, limit))
+
+
+@app.get(
+    path="/duplicates/{kind}",
+    operation_id="find_duplicates",
+    summary="Find the likely duplicate edia of a kind",
+    response_model=List[models.DuplicateModel],
+    tags=["Edia"],
+)
+def find_duplicates(
+    kind: str,
+    threshold: float = Query(0.6, gt=0, le=1, description="The minimal similarity"),
+) -> Response:
+    """Find the pairs of edia of a kind with similar titles, the most similar first."""
+    return responses.TrustedJSONResponse(operations.find_duplicates(kind, threshold))
+
+
+@app.get(
+    path="/federation/edium",
+    operation_id="search_federated_edia",
+    summary="Search the edia of all the attached files",
+    response_model=List[models.FederatedEdiumModel],
+    tags=["Federation"],
+)
+def search_federated_edia(
+    title: Optional[str] = Query(None, description="A part of the title"),
+    kind: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+) -> Response:
+    """Search the edia of the database and of the attached files, oldest first.
+
+    The ids of the attached files are prefixed with their namespace, like
+    ``team:42``.
+    """
+    return responses.TrustedJSONResponse(operations.search_federated_edia(title, kind, limit, offset))
+
+
+@app.get(
+    path="/federation/edium/{edium_id}/neighbors",
+    operation_id="get_federated_neighbors",
+    summary="Get the edia linked to an edium of any attached file",
+    response_model=List[models.NeighborModel],
+    tags=["Federation"],
+)
+def get_federated_neighbors(edium_id: str, depth: int = Query(1, ge=1, le=10)) -> Response:
+    """Get the edia up to ``depth`` links away from an edium, like ``team:42``."""
+    try:
+        return responses.TrustedJSONResponse(operations.get_federated_neighbors(edium_id, depth))
     except exceptions.ObjectNotFound as err:
         raise HTTPException(status_code=404, detail=err.args[0])
 
@@ -310,3 +772,196 @@ def most_used_elements(
 ) -> List[Tuple[str, int]]:
     """Get the most used elements names for a given edium kind."""
     return operations.most_used_elements(kind, max_count)
+
+
+@app.get(
+    path="/stats/cache",
+    operation_id="get_cache_stats",
+    summary="Get the size and the hit, miss and eviction counts of the response cache",
+    response_model=models.CacheStatsModel,
+    tags=["Stats"],
+)
+def get_cache_stats() -> models.CacheStatsModel:
+    """Get the statistics of the cache of the single edia, elements and links.
+
+    Each server process has its own cache, so the counts are the ones of the
+    process that answers.
+    """
+    return operations.get_cache_stats()
+
+
+@app.get(
+    path="/graph/stats",
+    operation_id="get_graph_stats",
+    summary="Get the connected components, the degree and PageRank rankings and the orphans",
+    response_model=models.GraphStatsModel,
+    tags=["Stats"],
+)
+def get_graph_stats(
+    label: Optional[str] = Query(None, description="Only the links with this label"),
+    kind: Optional[str] = Query(None, description="Only the edia of this kind, and the links between them"),
+    limit: int = Query(10, ge=1, le=1000, description="The length of the rankings"),
+) -> Response:
+    """Analyse the graph of the links.
+
+    The results are cached until an edium or a link is written.
+    """
+    return responses.TrustedJSONResponse(operations.get_graph_stats(label, kind, limit))
+
+
+@app.get(
+    path="/graph/export",
+    operation_id="export_graph",
+    summary="Export the graph as DOT, GraphML or an edge list",
+    response_class=StreamingResponse,
+    tags=["Stats"],
+)
+def export_graph(
+    graph_format: models.GraphFormat.asType = Query(models.GraphFormat.DOT, alias="format"),
+    kind: Optional[str] = Query(None, description="Only the edia of this kind"),
+    label: Optional[str] = Query(None, description="Only the links with this label"),
+    center: Optional[int] = Query(None, description="Only the edia up to `depth` links away from this one"),
+    depth: int = Query(1, ge=1, le=10),
+) -> StreamingResponse:
+    """Export the edia and the links for a graph tool.
+
+    The file is streamed as it's read from the database, so it starts at once.
+    """
+    try:
+        (chunks, media_type, file_name) = operations.export_graph(graph_format, kind, label, center, depth)
+    except exceptions.ObjectNotFound as err:
+        raise HTTPException(status_code=404, detail=err.args[0])
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{file_name}"'},
+    )
+
+
+@app.post(
+    path="/admin/backup",
+    operation_id="backup",
+    summary="Back up the database to a file",
+    response_model=models.BackupReportModel,
+    tags=["Admin"],
+)
+def backup(data: models.BackupModel) -> models.BackupReportModel:
+    """Back up the database to a file on the server, without stopping the writes.
+
+    The destination is a file name in the folder given to ``--backup-dir``,
+    maybe in a sub folder : without this option, it answers a 403. The copy is
+    checked with ``integrity_check`` if ``verify``, and gzipped if ``compress``.
+    """
+    try:
+        return operations.backup_database(data)
+    except exceptions.BackupRefused as err:
+        raise HTTPException(status_code=403, detail=err.args[0])
+    except exceptions.BackupFailed as err:
+        raise HTTPException(status_code=500, detail=err.args[0])
+
+
+@app.post(
+    path="/admin/merge-duplicate-links",
+    operation_id="merge_duplicate_links",
+    summary="Delete the duplicate links, and add or drop their unique index",
+    response_model=models.BulkResultModel,
+    tags=["Admin"],
+)
+def merge_duplicate_links(
+    dry_run: bool = Query(False, description="Only count the duplicate links"),
+    unique_index: Optional[bool] = Query(None, description="Add (true) or drop (false) the unique index afterwards"),
+) -> models.BulkResultModel:
+    """Delete the links identical to an older one : same start, end, label and direction.
+
+    With ``unique_index=true``, the duplicates are refused from then on.
+    """
+    return writes.run(operations.merge_duplicate_links, dry_run, unique_index)
+
+
+@app.post(
+    path="/admin/compact-history",
+    operation_id="compact_history",
+    summary="Store the string histories of an element name as deltas",
+    response_model=models.DeltaReportModel,
+    tags=["Admin"],
+)
+def compact_history(
+    name: str = Query(..., min_length=1, description="The name of the elements, like comment"),
+    interval: int = Query(DELTA_INTERVAL, ge=0, description="A full value every this many versions, 0 for none"),
+) -> models.DeltaReportModel:
+    """Store the older string versions of the elements of a name as deltas from the next version.
+
+    The next versions of these elements are encoded as they're written. The
+    values are rebuilt transparently, from at most ``interval - 1`` deltas.
+    """
+    try:
+        return writes.run(operations.encode_histories, name, interval)
+    except exceptions.ObjectNotFound as err:
+        raise HTTPException(status_code=404, detail=err.args[0])
+
+
+@app.post(
+    path="/admin/maintenance/analyze",
+    operation_id="analyze_database",
+    summary="Refresh the statistics of the query planner",
+    response_model=models.AnalyzeReportModel,
+    tags=["Admin"],
+)
+def analyze_database(
+    full: bool = Query(False, description="Analyse every table with ANALYZE, instead of PRAGMA optimize"),
+) -> models.AnalyzeReportModel:
+    """Refresh the statistics used by SQLite to choose the indexes.
+
+    By default, ``PRAGMA optimize`` only analyses the tables that need it.
+    """
+    return operations.analyze_database(full)
+
+
+@app.post(
+    path="/admin/maintenance/vacuum",
+    operation_id="vacuum_database",
+    summary="Free the unused pages of the database file",
+    response_model=models.VacuumReportModel,
+    tags=["Admin"],
+)
+def vacuum_database(
+    max_pages: Optional[int] = Query(None, ge=1, description="The maximum number of pages to free"),
+) -> models.VacuumReportModel:
+    """Give the unused pages back to the file system, in short steps between the writes.
+
+    The older files need ``maintenance vacuum --enable`` once, from the command
+    line, as it rewrites the whole file : until then, it answers a 409.
+    """
+    try:
+        return operations.vacuum_database(max_pages)
+    except exceptions.MaintenanceFailed as err:
+        raise HTTPException(status_code=409, detail=f"{err.args[0]} : run maintenance vacuum --enable")
+
+
+@app.post(
+    path="/admin/maintenance/check",
+    operation_id="check_database",
+    summary="Look for corruptions in the database file",
+    response_model=models.IntegrityReportModel,
+    tags=["Admin"],
+)
+def check_database(
+    full: bool = Query(False, description="Also check the indexes against their tables (slower)"),
+) -> models.IntegrityReportModel:
+    """Run ``PRAGMA quick_check``, or ``PRAGMA integrity_check`` if ``full``."""
+    return operations.check_database(full)
+
+
+@app.get(
+    path="/admin/maintenance/space",
+    operation_id="get_space_report",
+    summary="Get the space used by each table and index",
+    response_model=models.SpaceReportModel,
+    tags=["Admin"],
+)
+def get_space_report() -> models.SpaceReportModel:
+    """Return the pages used by each table and index, the biggest first, read with ``dbstat``."""
+    try:
+        return operations.get_space_report()
+    except exceptions.MaintenanceFailed as err:
+        raise HTTPException(status_code=409, detail=err.args[0])
@@ -0,0 +1,178 @@
+"""Keep the encoded JSON of the most read objects, in a bounded LRU cache.
+
+The single edia, elements and links are read with raw SQL and encoded on a
+miss, then served as bytes until they change. The write operations invalidate
+their objects at once. The change feed catches the writes of the other
+processes, and the objects changed in cascade, like the elements and the links
+of a deleted edium.
+
+With group commit, a write may be committed a bit after its invalidation : an
+object read meanwhile is cached with its old content, until the change feed
+invalidates it again. It's polled before each read, so the cache is never
+staler than the feed. An object read before an invalidation isn't kept.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional as Opt, Set, Tuple
+
+from .responses import encode_json
+from .. import models
+from ..constants import RESPONSE_CACHE_SIZE
+from ..storage import invalidation
+from ..storage.tables import database, orm
+
+# (table, object id, versions mode), the mode being empty but for the elements
+Key = Tuple[str, int, str]
+
+_ELEMENT_MODES = (models.VersionsMode.NONE, models.VersionsMode.SINGLE, models.VersionsMode.ALL)
+
+
+class _Entry(NamedTuple):
+    body: bytes
+    edia: Tuple[int, ...]  # The edia it depends on : the edium of an element, the ends of a link
+
+
+def _edia_of(table: str, content: Dict[str, Any]) -> Tuple[int, ...]:
+    if table == "element":
+        return (content["edium_id"],)
+    if table == "link":
+        return (content["start"], content["end"])
+    return ()
+
+
+class ResponseCache:
+    """Map the objects to their encoded JSON, the least recently used evicted first.
+
+    The size is the total length of the encoded objects, in bytes. A size of 0
+    disables the cache.
+    """
+
+    def __init__(self, max_size: int):
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.entries: "OrderedDict[Key, _Entry]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Incremented by each invalidation, so an object read before isn't kept
+        self.generation = 0
+
+    def fetch(self, table: str, object_id: int, mode: str, load: Callable[[], Opt[Dict[str, Any]]]) -> Opt[bytes]:
+        """Return the encoded object, loaded with ``load`` on a miss, or None if it doesn't exist."""
+        invalidation.watcher.poll()
+        key = (table, object_id, mode)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry.body
+            self.misses += 1
+            generation = self.generation
+        content = load()
+        if content is None:
+            return None
+        body = encode_json(content)
+        with self.lock:
+            if self.generation == generation and len(body) <= self.max_size:
+                self._put(key, _Entry(body, _edia_of(table, content)))
+        return body
+
+    def _put(self, key: Key, entry: _Entry) -> None:
+        self._pop(key)
+        self.entries[key] = entry
+        self.size += len(entry.body)
+        self._shrink()
+
+    def _shrink(self) -> None:
+        while self.size > self.max_size:
+            (_, evicted) = self.entries.popitem(last=False)
+            self.size -= len(evicted.body)
+            self.evictions += 1
+
+    def _pop(self, key: Key) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry.body)
+
+    def invalidate(self, table: str, object_ids: Iterable[int]) -> None:
+        """Forget some objects of a table, with all their versions modes."""
+        modes = _ELEMENT_MODES if table == "element" else ("",)
+        with self.lock:
+            self.generation += 1
+            for object_id in object_ids:
+                for mode in modes:
+                    self._pop((table, object_id, mode))
+
+    def invalidate_deleted_edia(self, edium_ids: Iterable[int]) -> None:
+        """Forget some deleted edia, with their elements and their links."""
+        deleted = set(edium_ids)
+        with self.lock:
+            self.generation += 1
+            for (key, entry) in list(self.entries.items()):
+                if (key[0] == "edium" and key[1] in deleted) or not deleted.isdisjoint(entry.edia):
+                    self._pop(key)
+
+    def clear(self, tables: Opt[Iterable[str]] = None) -> None:
+        """Forget all the objects of some tables, or of all of them."""
+        with self.lock:
+            self.generation += 1
+            if tables is None:
+                self.entries.clear()
+                self.size = 0
+                return
+            tables = set(tables)
+            for key in [key for key in self.entries if key[0] in tables]:
+                self._pop(key)
+
+    def resize(self, max_size: int) -> None:
+        """Change the max size, evicting the objects that don't fit anymore."""
+        with self.lock:
+            self.max_size = max_size
+            self._shrink()
+
+    def on_changes(self, events: List[invalidation.ChangeEvent]) -> None:
+        """Invalidate the objects changed according to the change feed."""
+        changed: Dict[str, Set[int]] = {"edium": set(), "element": set(), "link": set()}
+        deleted_edia: Set[int] = set()
+        versions: Set[int] = set()
+        for event in events:
+            if event.table == "version":
+                versions.add(event.object_id)
+            elif event.table == "edium" and event.operation == models.ChangeOperation.DELETE:
+                deleted_edia.add(event.object_id)
+            elif event.table in changed and event.operation != models.ChangeOperation.CREATE:
+                changed[event.table].add(event.object_id)
+        if versions:
+            # Only the element of a version matters, and it's unknown once deleted
+            with orm.db_session:
+                found = database.select(
+                    'SELECT "id", "element" FROM "Version" WHERE "id" IN (SELECT value FROM json_each($ids))',
+                    {"ids": json.dumps(sorted(versions))},
+                )
+            if len(found) < len(versions):
+                self.clear(["element"])
+            changed["element"].update(element_id for (_, element_id) in found)
+        for (table, object_ids) in changed.items():
+            if object_ids:
+                self.invalidate(table, object_ids)
+        if deleted_edia:
+            self.invalidate_deleted_edia(deleted_edia)
+
+    def stats(self) -> models.CacheStatsModel:
+        with self.lock:
+            return models.CacheStatsModel(
+                entries=len(self.entries),
+                size=self.size,
+                max_size=self.max_size,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+            )
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+invalidation.watcher.subscribe(response_cache.on_changes)
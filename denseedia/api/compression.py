@@ -0,0 +1,147 @@
+"""Define a middleware that compresses the responses.
+
+It honours the ``Accept-Encoding`` header of the request, with brotli (only if
+the ``brotli`` package is installed) or gzip. It works like the GZipMiddleware
+of Starlette, but the streamed responses are flushed after each chunk, so they
+still arrive chunk by chunk.
+"""
+
+import zlib
+from typing import Optional as Opt
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .responses import parse_quality_header, parse_refused_values
+
+
+def brotli_available() -> bool:
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        # 16 + MAX_WBITS asks zlib for a gzip header
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, level: int):
+        import brotli
+        # Brotli levels go up to 11, gzip ones to 9
+        self.compressor = brotli.Compressor(quality=min(11, level + 2))
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.finish()
+
+
+def choose_encoder_class(accept_encoding: Opt[str]):
+    """Return the encoder class preferred by the client, or None.
+
+    The ``*`` wildcard stands for gzip, unless the client refused it with ``gzip;q=0``.
+    """
+    refused = parse_refused_values(accept_encoding)
+    for coding in parse_quality_header(accept_encoding):
+        if coding == "br" and brotli_available():
+            return BrotliEncoder
+        if coding == "gzip" or (coding == "*" and "gzip" not in refused):
+            return GzipEncoder
+    return None
+
+
+class CompressionMiddleware:
+    """Compress the responses bigger than ``minimum_size`` bytes."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, level: int = 6) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            encoder_class = choose_encoder_class(headers.get("Accept-Encoding"))
+            if encoder_class is not None:
+                responder = _CompressionResponder(self.app, encoder_class(self.level), self.minimum_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class _CompressionResponder:
+    def __init__(self, app: ASGIApp, encoder, minimum_size: int) -> None:
+        self.app = app
+        self.encoder = encoder
+        self.minimum_size = minimum_size
+        self.send: Send = _unattached_send
+        self.initial_message: Message = {}
+        self.started = False
+        self.active = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Wait for the first body chunk to know if it's worth compressing
+            self.initial_message = message
+            return
+        if message_type != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self.started:
+            self.started = True
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            already_encoded = "content-encoding" in headers
+            if already_encoded or (len(body) < self.minimum_size and not more_body):
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+            self.active = True
+            headers["Content-Encoding"] = self.encoder.name
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                body = self.encoder.finish(body)
+                headers["Content-Length"] = str(len(body))
+                message["body"] = body
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+            await self.send(self.initial_message)
+        elif not self.active:
+            await self.send(message)
+            return
+
+        if more_body:
+            message["body"] = self.encoder.compress(body)
+        else:
+            message["body"] = self.encoder.finish(body)
+        await self.send(message)
+
+
+async def _unattached_send(message: Message) -> None:
+    raise RuntimeError("send awaitable not set")  # pragma: no cover
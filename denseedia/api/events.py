@@ -0,0 +1,38 @@
+"""Define the Server-Sent Events stream of the change feed."""
+
+import asyncio
+import json
+import time
+from typing import AsyncIterator
+
+from starlette.concurrency import run_in_threadpool
+
+from . import operations
+from ..constants import CHANGES_KEEP_ALIVE_INTERVAL, CHANGES_PAGE_SIZE, CHANGES_POLL_INTERVAL
+
+
+def format_event(change: dict) -> str:
+    """Format a change as an SSE event, with its sequence number as id."""
+    data = json.dumps(change, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {change['id']}\nevent: change\ndata: {data}\n\n"
+
+
+async def change_events(since: int) -> AsyncIterator[str]:
+    """Yield the changes after ``since``, then the new ones as they come.
+
+    The database is polled, so the changes made by other processes are seen
+    too. A comment is sent regularly to keep the connection alive.
+    """
+    last_sent = time.monotonic()
+    while True:
+        changes = await run_in_threadpool(operations.get_changes_rows, since, CHANGES_PAGE_SIZE)
+        for change in changes:
+            yield format_event(change)
+            since = change["id"]
+        if changes:
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent > CHANGES_KEEP_ALIVE_INTERVAL:
+            yield ": keep-alive\n\n"
+            last_sent = time.monotonic()
+        if len(changes) < CHANGES_PAGE_SIZE:
+            await asyncio.sleep(CHANGES_POLL_INTERVAL)
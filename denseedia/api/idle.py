@@ -0,0 +1,101 @@
+"""Run the light maintenance of the database while the server is idle.
+
+The server is idle when no request started for ``MAINTENANCE_IDLE_DELAY``
+seconds. Then, at most once per interval, a background thread refreshes the
+statistics of the query planner with ``PRAGMA optimize``, frees the unused
+pages with the incremental vacuum, and runs a quick integrity check. The
+vacuum stops between two steps as soon as a request arrives.
+"""
+
+import threading
+import time
+from typing import Optional as Opt
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from ..constants import MAINTENANCE_IDLE_DELAY
+from ..logger import logger
+from ..storage import maintenance
+
+
+class Activity:
+    """Remember when the last request started."""
+
+    def __init__(self):
+        self.last_request = time.monotonic()
+
+    def touch(self) -> None:
+        self.last_request = time.monotonic()
+
+    def idle_for(self) -> float:
+        return time.monotonic() - self.last_request
+
+
+activity = Activity()
+
+
+class ActivityMiddleware:
+    """Record the start of each request in ``activity``."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            activity.touch()
+        await self.app(scope, receive, send)
+
+
+class IdleMaintenance:
+    """Run the maintenance tasks every ``interval`` seconds at most, when idle."""
+
+    def __init__(self, interval: float, idle_delay: float = MAINTENANCE_IDLE_DELAY):
+        self.interval = interval
+        self.idle_delay = idle_delay
+        self.stopped = threading.Event()
+        self.last_run = time.monotonic()
+        self.thread: Opt[threading.Thread] = None
+
+    def is_idle(self) -> bool:
+        return activity.idle_for() >= self.idle_delay
+
+    def run(self) -> None:
+        """Run the tasks now."""
+        maintenance.analyze()
+        if maintenance.incremental_vacuum_enabled():
+            maintenance.incremental_vacuum(keep_going=self.is_idle)
+        maintenance.check_integrity()
+        self.last_run = time.monotonic()
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self._work, name="idle-maintenance", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _work(self) -> None:
+        while not self.stopped.wait(min(self.interval, self.idle_delay)):
+            if time.monotonic() - self.last_run < self.interval or not self.is_idle():
+                continue
+            try:
+                self.run()
+            except Exception:
+                logger.exception("The idle maintenance of the database failed")
+                self.last_run = time.monotonic()
+
+
+scheduler: Opt[IdleMaintenance] = None
+
+
+def use_idle_maintenance(interval: float) -> None:
+    """Run the maintenance when idle, every ``interval`` seconds at most. An interval of 0 disables it."""
+    global scheduler
+    if scheduler is not None:
+        scheduler.stop()
+        scheduler = None
+    if interval > 0:
+        scheduler = IdleMaintenance(interval)
+        scheduler.start()
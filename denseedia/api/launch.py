@@ -1,12 +1,130 @@
 """Provide a function to run the FastAPI."""
 
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional as Opt
+
 import uvicorn
 
-from .app import app
-from ..constants import API_PORT
+from . import idle, writes
+from .cache import response_cache
+from ..constants import (
+    API_HOST,
+    API_PORT,
+    GROUP_COMMIT_MAX_BATCH,
+    RESPONSE_CACHE_SIZE,
+    SNAPSHOT_INTERVAL,
+    VALUE_COMPRESSION_THRESHOLD,
+)
+from ..storage import backup, federation, packing, snapshots, tables, trigrams
+from ..storage.tables import orm
+
+# The worker processes get their settings from the environment
+ENV_DATABASE = "DENSEEDIA_DATABASE"
+ENV_IN_MEMORY = "DENSEEDIA_IN_MEMORY"
+ENV_SNAPSHOT_INTERVAL = "DENSEEDIA_SNAPSHOT_INTERVAL"
+ENV_ATTACHED = "DENSEEDIA_ATTACHED"
+ENV_GROUP_COMMIT_WINDOW = "DENSEEDIA_GROUP_COMMIT_WINDOW"
+ENV_GROUP_COMMIT_MAX_BATCH = "DENSEEDIA_GROUP_COMMIT_MAX_BATCH"
+ENV_CACHE_SIZE = "DENSEEDIA_CACHE_SIZE"
+ENV_MAINTENANCE_INTERVAL = "DENSEEDIA_MAINTENANCE_INTERVAL"
+ENV_COMPRESSION_THRESHOLD = "DENSEEDIA_COMPRESSION_THRESHOLD"
+ENV_BACKUP_DIRECTORY = "DENSEEDIA_BACKUP_DIRECTORY"
+
+
+def launch_server(
+    file_path: Path,
+    host: str = API_HOST,
+    port: int = API_PORT,
+    workers: int = 1,
+    backlog: int = 2048,
+    timeout_keep_alive: int = 5,
+    group_commit_window: float = 0,
+    group_commit_max_batch: int = GROUP_COMMIT_MAX_BATCH,
+    in_memory: bool = False,
+    snapshot_interval: float = SNAPSHOT_INTERVAL,
+    attached: Opt[Dict[str, Path]] = None,
+    cache_size: int = RESPONSE_CACHE_SIZE,
+    maintenance_interval: float = 0,
+    compression_threshold: int = VALUE_COMPRESSION_THRESHOLD,
+    backup_directory: Opt[Path] = None,
+) -> None:
+    """Run the FastApi server.
+
+    With several ``workers``, each process opens the database file on its own.
+    With a ``group_commit_window`` (in seconds), the concurrent writes of a
+    process are committed together. With ``in_memory``, the database is served
+    from RAM and saved to its file every ``snapshot_interval`` seconds : it
+    needs a single worker. The ``attached`` files are read with the federated
+    endpoints, by namespace. Each process caches up to ``cache_size`` bytes of
+    encoded objects. With a ``maintenance_interval`` (in seconds), each process
+    maintains the database while it's idle, at most once per interval. The
+    values whose JSON takes at least ``compression_threshold`` bytes are stored
+    compressed. The backups asked over HTTP are written in ``backup_directory``,
+    and refused without it.
+    """
+    if in_memory and workers > 1:
+        raise ValueError("The in-memory mode needs a single worker")
+    packing.configure(compression_threshold)
+    if not in_memory and tables.database.provider is None:
+        # Create the tables and build the trigram index once, before the
+        # workers start : the writes only update it then
+        tables.use_database(file_path)
+        with orm.db_session:
+            trigrams.refresh()
+    os.environ[ENV_DATABASE] = str(file_path)
+    os.environ[ENV_IN_MEMORY] = "1" if in_memory else ""
+    os.environ[ENV_SNAPSHOT_INTERVAL] = str(snapshot_interval)
+    os.environ[ENV_ATTACHED] = json.dumps({
+        namespace: str(file_path) for (namespace, file_path) in (attached or {}).items()
+    })
+    os.environ[ENV_GROUP_COMMIT_WINDOW] = str(group_commit_window)
+    os.environ[ENV_GROUP_COMMIT_MAX_BATCH] = str(group_commit_max_batch)
+    os.environ[ENV_CACHE_SIZE] = str(cache_size)
+    os.environ[ENV_MAINTENANCE_INTERVAL] = str(maintenance_interval)
+    os.environ[ENV_COMPRESSION_THRESHOLD] = str(compression_threshold)
+    os.environ[ENV_BACKUP_DIRECTORY] = "" if backup_directory is None else str(backup_directory)
+    print(f"Documentation page at http://{host}:{port}/docs")
+    uvicorn.run(
+        "denseedia.api.app:app",
+        host=host,
+        port=port,
+        workers=workers,
+        backlog=backlog,
+        timeout_keep_alive=timeout_keep_alive,
+    )
+
+
+def configure_worker() -> None:
+    """Prepare the current server process, from the environment.
+
+    The database is bound if it's not already (in the worker processes).
+    """
+    packing.configure(int(os.environ.get(ENV_COMPRESSION_THRESHOLD, VALUE_COMPRESSION_THRESHOLD)))
+    if tables.database.provider is None and ENV_DATABASE in os.environ:
+        file_path = Path(os.environ[ENV_DATABASE])
+        if os.environ.get(ENV_IN_MEMORY):
+            interval = float(os.environ.get(ENV_SNAPSHOT_INTERVAL, SNAPSHOT_INTERVAL))
+            snapshots.use_memory_database(file_path, interval)
+            with orm.db_session:
+                trigrams.refresh()
+        else:
+            tables.use_database(file_path)
+    for (namespace, other_file) in json.loads(os.environ.get(ENV_ATTACHED, "{}")).items():
+        federation.attach(namespace, Path(other_file))
+    writes.use_group_commit(
+        float(os.environ.get(ENV_GROUP_COMMIT_WINDOW, 0)),
+        int(os.environ.get(ENV_GROUP_COMMIT_MAX_BATCH, GROUP_COMMIT_MAX_BATCH)),
+    )
+    response_cache.resize(int(os.environ.get(ENV_CACHE_SIZE, RESPONSE_CACHE_SIZE)))
+    idle.use_idle_maintenance(float(os.environ.get(ENV_MAINTENANCE_INTERVAL, 0)))
+    backup_directory = os.environ.get(ENV_BACKUP_DIRECTORY)
+    backup.configure(Path(backup_directory) if backup_directory else None)
 
 
-def launch_server() -> None:
-    """Run the FastApi server."""
-    print(f"Documentation page at http://localhost:{API_PORT}/docs")
-    uvicorn.run(app, port=API_PORT)
+def shutdown_worker() -> None:
+    """Stop the idle maintenance, and save the in-memory database, if there's one."""
+    idle.use_idle_maintenance(0)
+    if snapshots.snapshotter is not None:
+        snapshots.snapshotter.stop()
@@ -1,8 +1,33 @@
-from collections import Counter
-from typing import Dict, List, Optional, Tuple
-
-from .. import exceptions, models
-from ..storage.tables import Edium, Element, Link, orm, Version
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from . import writes
+from .cache import response_cache
+from .. import exceptions, helpers, models
+from ..storage import (
+    backup,
+    bulk,
+    deletions,
+    export,
+    federation,
+    filters,
+    graph,
+    histories,
+    ingestion,
+    links,
+    maintenance,
+    names,
+    revisions,
+    rows,
+    series,
+    trigrams,
+)
+from ..storage.tables import Edium, Element, Kind, Link, orm, record_change, Version
+
+CREATE: models.ChangeOperation.asType = models.ChangeOperation.CREATE
+MODIFY: models.ChangeOperation.asType = models.ChangeOperation.MODIFY
+DELETE: models.ChangeOperation.asType = models.ChangeOperation.DELETE
 
 
 def get_all_edia() -> List[models.EdiumModel]:
@@ -12,6 +37,19 @@ def get_all_edia() -> List[models.EdiumModel]:
         return [edium.to_model() for edium in edia]
 
 
+def get_kinds() -> List[models.KindModel]:
+    """Return the kinds and their sizes, from the biggest."""
+    with orm.db_session:
+        kinds = Kind.select().order_by(orm.desc(Kind.size), Kind.name)[:]
+        return [kind.to_model() for kind in kinds]
+
+
+def get_all_edia_rows() -> List[Dict[str, Any]]:
+    """Return a list of all edia as trusted dicts, ready to be encoded."""
+    with orm.db_session:
+        return rows.edia()
+
+
 def get_one_edium(edium_id: int) -> models.EdiumModel:
     """Return an edium as a model."""
     with orm.db_session:
@@ -21,11 +59,24 @@ def get_one_edium(edium_id: int) -> models.EdiumModel:
         return edium.to_model()
 
 
+def get_one_edium_body(edium_id: int) -> bytes:
+    """Return an edium encoded in JSON, from the response cache if possible."""
+    def load() -> Optional[Dict[str, Any]]:
+        with orm.db_session:
+            return rows.one_edium(edium_id)
+
+    body = response_cache.fetch("edium", edium_id, "", load)
+    if body is None:
+        raise exceptions.ObjectNotFound("edium", edium_id)
+    return body
+
+
 def create_one_edium(body: models.CreateEdiumModel) -> models.EdiumModel:
     """Create and return one edium."""
     with orm.db_session:
         edium = Edium(**body.dict())
-        orm.commit()
+        orm.flush()
+        record_change("edium", edium.id, CREATE)
         return edium.to_model()
 
 
@@ -37,20 +88,26 @@ def modify_one_edium(edium_id: int, data: models.ModifyEdiumModel) -> models.Edi
             raise exceptions.ObjectNotFound("edium", edium_id)
         for (key, val) in data.dict(exclude_unset=True).items():
             setattr(edium, key, val)
-        orm.commit()
+        edium.updated_at = helpers.now()
+        record_change("edium", edium_id, MODIFY)
+        orm.flush()
         content = edium.to_model()
+    response_cache.invalidate("edium", [edium_id])
     return content
 
 
+@writes.alone
 def delete_one_edium(edium_id: int) -> models.EdiumModel:
     """Delete an edium and return its model."""
     with orm.db_session:
-        edium = Edium.get(id=edium_id)
-        if edium is None:
+        # Read with SQL too, to keep the deleted objects out of Pony's cache
+        row = rows.one_edium(edium_id)
+        if row is None:
             raise exceptions.ObjectNotFound("edium", edium_id)
-        content = edium.to_model()
-        edium.delete()
-    return content
+        deletions.delete_edium(edium_id)
+        record_change("edium", edium_id, DELETE)
+    response_cache.invalidate_deleted_edia([edium_id])
+    return models.EdiumModel(**row)
 
 
 def get_elements_of_one_edium(edium_id: int, mode: models.VersionsMode.asType) -> List[models.ElementModel]:
@@ -93,6 +150,15 @@ def get_elements_of_one_edium(edium_id: int, mode: models.VersionsMode.asType) -
     return list(content.values())
 
 
+def get_elements_of_one_edium_rows(edium_id: int, mode: models.VersionsMode.asType) -> List[Dict[str, Any]]:
+    """Return the elements of an Edium as trusted dicts, ready to be encoded.
+
+    It's the fast counterpart of ``get_elements_of_one_edium``.
+    """
+    with orm.db_session:
+        return rows.elements_of_one_edium(edium_id, mode)
+
+
 def get_one_element(element_id: int, mode: models.VersionsMode.asType) -> models.ElementModel:
     """Return one element.
 
@@ -116,6 +182,53 @@ def get_one_element(element_id: int, mode: models.VersionsMode.asType) -> models
     return content
 
 
+def get_one_element_body(element_id: int, mode: models.VersionsMode.asType) -> bytes:
+    """Return one element and none, one or all of its versions encoded in JSON.
+
+    It's read from the response cache if possible.
+    """
+    def load() -> Optional[Dict[str, Any]]:
+        with orm.db_session:
+            return rows.one_element(element_id, mode)
+
+    body = response_cache.fetch("element", element_id, mode, load)
+    if body is None:
+        raise exceptions.ObjectNotFound("element", element_id)
+    return body
+
+
+def get_element_series(
+    element_id: int,
+    bucket: Optional[int] = None,
+    how: models.Aggregation.asType = models.Aggregation.MEAN,
+) -> series.Series:
+    """Return the numeric history of an element as NumPy arrays.
+
+    The values are aggregated in buckets of ``bucket`` seconds if given.
+    """
+    with orm.db_session:
+        if not Element.exists(id=element_id):
+            raise exceptions.ObjectNotFound("element", element_id)
+        content = series.element_series(element_id)
+    if bucket is not None:
+        content = series.resample(content, bucket, how)
+    return content
+
+
+def get_kind_series(
+    kind: str,
+    element_name: str,
+    bucket: Optional[int] = None,
+    how: models.Aggregation.asType = models.Aggregation.MEAN,
+) -> series.SeriesMatrix:
+    """Return the numeric history of an element name across the edia of a kind.
+
+    The result is a matrix with one row per edium, aligned in time.
+    """
+    with orm.db_session:
+        return series.kind_matrix(kind, element_name, bucket, how)
+
+
 def create_one_element(edium_id: int, data: models.CreateElementModel) -> models.ElementModel:
     """Create one element and its last version."""
     with orm.db_session:
@@ -127,80 +240,156 @@ def create_one_element(edium_id: int, data: models.CreateElementModel) -> models
 
         element = Element(edium=edium, name=data.name)
         version = element.create_version2(data.version.value_type, data.version.value_json)
-        orm.commit()
+        orm.flush()
+        record_change("element", element.id, CREATE)
+        record_change("version", version.id, CREATE)
         content = element.to_model()
         content.versions = [version.to_model()]
     return content
 
 
-def modify_one_element(element_id: int, data: models.ModifyElementModel) -> models.ElementModel:
-    """Modify an element and return its model."""
+def modify_one_element(
+    element_id: int,
+    data: models.ModifyElementModel,
+    expected_revision: Optional[int] = None,
+) -> models.ElementModel:
+    """Modify an element and return its model.
+
+    With an ``expected_revision``, a RevisionConflict is raised if the element
+    isn't at this revision anymore.
+    """
     with orm.db_session:
         element = Element.get(id=element_id)
         if element is None:
             raise exceptions.ObjectNotFound("element", element_id)
+        element.bump_revision(expected_revision)
         for (key, val) in data.dict(exclude_unset=True).items():
             setattr(element, key, val)
-        orm.commit()
+        element.updated_at = helpers.now()
+        record_change("element", element_id, MODIFY)
+        orm.flush()
         content = element.to_model()
+    response_cache.invalidate("element", [element_id])
     return content
 
 
-def delete_one_element(element_id: int) -> models.ElementModel:
-    """Delete an element and return its model."""
+@writes.alone
+def delete_one_element(element_id: int, expected_revision: Optional[int] = None) -> models.ElementModel:
+    """Delete an element and return its model, if it's at the expected revision when given."""
     with orm.db_session:
-        element = Element.get(id=element_id)
-        if element is None:
+        if expected_revision is not None:
+            revisions.bump(element_id, expected_revision)
+        row = rows.one_element(element_id, models.VersionsMode.NONE)
+        if row is None:
             raise exceptions.ObjectNotFound("element", element_id)
-        content = element.to_model()
-        element.delete()
-    return content
-
-
-def create_one_version(element_id: int, data: models.CreateVersionModel) -> models.VersionModel:
-    """Create a new version for an element."""
+        deletions.delete_element(element_id)
+        record_change("element", element_id, DELETE)
+    response_cache.invalidate("element", [element_id])
+    return models.ElementModel(**row)
+
+
+def create_one_version(
+    element_id: int,
+    data: models.CreateVersionModel,
+    expected_revision: Optional[int] = None,
+) -> models.VersionModel:
+    """Create a new version for an element, if it's at the expected revision when given."""
     with orm.db_session:
         element: Optional[Element] = Element.get(id=element_id)
         if element is None:
             raise exceptions.ObjectNotFound("element", element_id)
 
-        version = element.create_version2(data.value_type, data.value_json)
-        orm.commit()
+        version = element.create_version2(data.value_type, data.value_json, expected_revision)
+        orm.flush()
+        record_change("version", version.id, CREATE)
         content = version.to_model()
+    response_cache.invalidate("element", [element_id])
     return content
 
 
-def modify_one_version(version_id: int, data: models.CreateVersionModel) -> models.VersionModel:
-    """Modify a version and return its model."""
+@writes.alone
+def ingest_versions(series: List[models.ElementVersionSeriesModel]) -> models.IngestionResultModel:
+    """Create many versions at once, with their own creation dates."""
+    with orm.db_session:
+        result = ingestion.ingest_versions(
+            (item.element_id, item.value_type, item.points, item.expected_revision) for item in series
+        )
+    response_cache.invalidate("element", [item.element_id for item in series])
+    return result
+
+
+def modify_one_version(
+    version_id: int,
+    data: models.CreateVersionModel,
+    expected_revision: Optional[int] = None,
+) -> models.VersionModel:
+    """Modify a version and return its model, if its element is at the expected revision when given."""
     with orm.db_session:
         version: Optional[Version] = Version.get(id=version_id)
         if version is None:
             raise exceptions.ObjectNotFound("version", version_id)
+        version.element.bump_revision(expected_revision)
 
         v_type: models.ValueType.asType = data.value_type
         v_json = data.value_json
         # Same trick that in Element.create_version2
         if v_type == models.ValueType.NONE:
             v_json = ""
+        # The previous version may be a delta from this one
+        version.expand_previous()
         version.value_type = models.ValueType.to_id(v_type)
-        version.json = v_json
+        version.store(v_json)
+        version.delta = False
+        version.element.updated_at = helpers.now()
+        record_change("version", version_id, MODIFY)
 
-        orm.commit()
+        orm.flush()
         content = version.to_model()
+    response_cache.invalidate("element", [content.element_id])
     return content
 
 
-def delete_one_version(version_id: int) -> models.VersionModel:
-    """Delete a version and return its model."""
+def delete_one_version(version_id: int, expected_revision: Optional[int] = None) -> models.VersionModel:
+    """Delete a version and return its model, if its element is at the expected revision when given."""
     with orm.db_session:
         version = Version.get(id=version_id)
         if version is None:
             raise exceptions.ObjectNotFound("version", version_id)
+        version.element.bump_revision(expected_revision)
         content = version.to_model()
+        version.element.updated_at = helpers.now()
+        version.expand_previous()
         version.delete()
+        record_change("version", version_id, DELETE)
+    response_cache.invalidate("element", [content.element_id])
     return content
 
 
+@writes.alone
+def modify_edia_by_filter(
+    kind: Optional[str],
+    title_contains: Optional[str],
+    data: models.ModifyEdiumModel,
+    dry_run: bool,
+) -> models.BulkResultModel:
+    """Modify all the edia matching a filter."""
+    with orm.db_session:
+        count = bulk.modify_edia(kind, title_contains, data.title, data.kind, dry_run)
+    if not dry_run:
+        response_cache.clear(["edium"])
+    return models.BulkResultModel(count=count, dry_run=dry_run)
+
+
+@writes.alone
+def delete_edia_by_filter(kind: Optional[str], title_contains: Optional[str], dry_run: bool) -> models.BulkResultModel:
+    """Delete all the edia matching a filter, with their elements and links."""
+    with orm.db_session:
+        count = bulk.delete_edia(kind, title_contains, dry_run)
+    if not dry_run:
+        response_cache.clear()
+    return models.BulkResultModel(count=count, dry_run=dry_run)
+
+
 def get_all_links() -> List[models.LinkModel]:
     """Return a list of all links as models."""
     with orm.db_session:
@@ -208,6 +397,12 @@ def get_all_links() -> List[models.LinkModel]:
         return [link.to_model() for link in links]
 
 
+def get_all_links_rows() -> List[Dict[str, Any]]:
+    """Return a list of all links as trusted dicts, ready to be encoded."""
+    with orm.db_session:
+        return rows.links()
+
+
 def get_one_link(link_id: int) -> models.LinkModel:
     """Return a link as a model."""
     with orm.db_session:
@@ -217,6 +412,18 @@ def get_one_link(link_id: int) -> models.LinkModel:
         return link.to_model()
 
 
+def get_one_link_body(link_id: int) -> bytes:
+    """Return a link encoded in JSON, from the response cache if possible."""
+    def load() -> Optional[Dict[str, Any]]:
+        with orm.db_session:
+            return rows.one_link(link_id)
+
+    body = response_cache.fetch("link", link_id, "", load)
+    if body is None:
+        raise exceptions.ObjectNotFound("link", link_id)
+    return body
+
+
 def get_links_of_one_edium(edium_id: int) -> List[models.LinkModel]:
     """Return the links in which an edium appears."""
     with orm.db_session:
@@ -246,10 +453,23 @@ def create_one_link(data: models.CreateLinkModel) -> models.LinkModel:
             directed=data.directed,
             label=data.label,
         )
-        orm.commit()
+        try:
+            orm.flush()
+        except orm.TransactionIntegrityError:
+            raise exceptions.DuplicateLink(data.start, data.end, data.label)
+        record_change("link", link.id, CREATE)
         return link.to_model()
 
 
+def upsert_one_link(data: models.CreateLinkModel) -> Tuple[models.LinkModel, bool]:
+    """Return the link with these values, created if needed, and whether it was created."""
+    with orm.db_session:
+        (link_id, created) = links.upsert_link(data.start, data.end, data.directed, data.label)
+        if created:
+            record_change("link", link_id, CREATE)
+        return Link[link_id].to_model(), created
+
+
 def modify_one_link(link_id: int, data: models.ModifyLinkModel) -> models.LinkModel:
     """Modify a link and return its model."""
     with orm.db_session:
@@ -258,8 +478,14 @@ def modify_one_link(link_id: int, data: models.ModifyLinkModel) -> models.LinkMo
             raise exceptions.ObjectNotFound("link", link_id)
         for (key, val) in data.dict(exclude_unset=True).items():
             setattr(link, key, val)
-        orm.commit()
+        link.updated_at = helpers.now()
+        record_change("link", link_id, MODIFY)
+        try:
+            orm.flush()
+        except orm.TransactionIntegrityError:
+            raise exceptions.DuplicateLink(link.start.id, link.end.id, link.label)
         content = link.to_model()
+    response_cache.invalidate("link", [link_id])
     return content
 
 
@@ -270,16 +496,181 @@ def delete_one_link(link_id: int) -> models.LinkModel:
         if link is None:
             raise exceptions.ObjectNotFound("link", link_id)
         content = link.to_model()
+        link.bury()
         link.delete()
+        record_change("link", link_id, DELETE)
+    response_cache.invalidate("link", [link_id])
     return content
 
 
+@writes.alone
+def modify_links_by_filter(label: Optional[str], data: models.ModifyLinkModel, dry_run: bool) -> models.BulkResultModel:
+    """Modify all the links matching a filter."""
+    with orm.db_session:
+        count = bulk.modify_links(label, data.label, dry_run)
+    if not dry_run:
+        response_cache.clear(["link"])
+    return models.BulkResultModel(count=count, dry_run=dry_run)
+
+
+@writes.alone
+def delete_links_by_filter(label: Optional[str], dry_run: bool) -> models.BulkResultModel:
+    """Delete all the links matching a filter."""
+    with orm.db_session:
+        count = bulk.delete_links(label, dry_run)
+    if not dry_run:
+        response_cache.clear(["link"])
+    return models.BulkResultModel(count=count, dry_run=dry_run)
+
+
+@writes.alone
+def merge_duplicate_links(dry_run: bool, unique_index: Optional[bool]) -> models.BulkResultModel:
+    """Delete the duplicate links, then add or drop the unique index if asked."""
+    with orm.db_session:
+        count = bulk.merge_duplicate_links(dry_run)
+        if not dry_run and unique_index is not None:
+            if unique_index:
+                links.add_unique_index()
+            else:
+                links.drop_unique_index()
+    if not dry_run:
+        response_cache.clear(["link"])
+    return models.BulkResultModel(count=count, dry_run=dry_run)
+
+
+def get_changes_rows(since: int, limit: int) -> List[Dict[str, Any]]:
+    """Return the changes after the sequence number ``since`` as trusted dicts."""
+    with orm.db_session:
+        return rows.changes(since, limit)
+
+
+def get_sync_rows(since: datetime) -> Dict[str, Any]:
+    """Return what changed since a date, as trusted dicts.
+
+    The updated edia, elements (with all their versions) and links are
+    returned, with the tombstones of the deleted ones. ``until`` is the date to
+    use as ``since`` for the next sync. As the dates are precise to the second,
+    a row may be returned twice by consecutive syncs.
+    """
+    if since.tzinfo is not None:
+        # The dates are stored as naive local dates
+        since = since.astimezone().replace(tzinfo=None)
+    with orm.db_session:
+        until = helpers.now()
+        return {
+            "until": rows.timestamp_to_iso(rows.datetime_to_timestamp(until)),
+            "edia": rows.edia(since),
+            "elements": rows.elements_since(since),
+            "links": rows.links(since),
+            "tombstones": rows.tombstones(since),
+        }
+
+
+@writes.alone
+def encode_histories(name: str, interval: int) -> models.DeltaReportModel:
+    """Store the string histories of the elements of a name as deltas, or whole again below 2."""
+    with orm.db_session:
+        return histories.encode_name(name, interval)
+
+
+def search_edia_by_filter(text: str, order: models.EdiumOrder.asType, limit: int, offset: int) -> List[Dict[str, Any]]:
+    """Return a page of the edia matching a filter query, as trusted dicts."""
+    with orm.db_session:
+        return filters.search(text, order, limit, offset)
+
+
+def explain_filter(text: str, order: models.EdiumOrder.asType, limit: int, offset: int) -> models.QueryPlanModel:
+    """Return the SQL compiled from a filter query, and its plan."""
+    with orm.db_session:
+        return filters.explain(text, order, limit, offset)
+
+
+def search_similar_edia(query: str, kind: Optional[str], threshold: float, limit: int) -> List[Dict[str, Any]]:
+    """Return the edia with a title similar to the query, as trusted dicts."""
+    with orm.db_session:
+        return trigrams.search(query, kind, threshold, limit)
+
+
+def find_duplicates(kind: str, threshold: float) -> List[Dict[str, Any]]:
+    """Return the pairs of edia of a kind with similar titles, as trusted dicts."""
+    with orm.db_session:
+        pairs = trigrams.duplicates(kind, threshold)
+        edia = rows.edia_by_ids(sorted({edium_id for pair in pairs for edium_id in pair[:2]}))
+    return [
+        {"first": edia[pair.first_id], "second": edia[pair.second_id], "similarity": pair.similarity}
+        for pair in pairs
+    ]
+
+
+def search_federated_edia(
+    in_title: Optional[str],
+    kind: Optional[str],
+    limit: int,
+    offset: int,
+) -> List[Dict[str, Any]]:
+    """Return a page of the edia of the bound and the attached files, as trusted dicts."""
+    return federation.search_edia(in_title, kind, limit, offset)
+
+
+def get_federated_neighbors(edium_id: str, depth: int) -> List[Dict[str, Any]]:
+    """Return the edia linked to a namespaced edium, as trusted dicts."""
+    return federation.neighbors(edium_id, depth)
+
+
+def get_graph_stats(label: Optional[str], kind: Optional[str], limit: int) -> Dict[str, Any]:
+    """Return the analysis of the links, as a trusted dict."""
+    with orm.db_session:
+        return graph.cache.get(label, kind).to_dict(limit)
+
+
+def export_graph(
+    graph_format: models.GraphFormat.asType,
+    kind: Optional[str],
+    label: Optional[str],
+    center: Optional[int],
+    depth: int,
+) -> Tuple[Iterator[str], str, str]:
+    """Return an iterator on the chunks of the exported graph, its media type and a file name."""
+    formatter = export.FORMATTERS[graph_format]
+    chunks = export.export_graph(graph_format, kind, label, center, depth)
+    return chunks, formatter.media_type, f"denseedia.{formatter.extension}"
+
+
 def most_used_elements(kind: str, max_count: int) -> List[Tuple[str, int]]:
     """Return the most used element names for an edium kind.
     The return format is a tuple (element_name, count).
     """
-    # I tried to make it purely SQL, but I can't do it with Pony.
     with orm.db_session:
-        query = orm.select(e.elements.name for e in Edium if e.kind == kind).without_distinct()
-        counter: Counter = Counter(query)
-    return counter.most_common(max_count)
+        return names.most_used(kind, max_count)
+
+
+def get_cache_stats() -> models.CacheStatsModel:
+    """Return the size and the hit, miss and eviction counts of the response cache."""
+    return response_cache.stats()
+
+
+def backup_database(data: models.BackupModel) -> models.BackupReportModel:
+    """Back up the database to a file of the backup folder, while the server runs."""
+    destination = backup.resolve_destination(data.destination)
+    report = backup.backup(destination, compress=data.compress, verify=data.verify)
+    return models.BackupReportModel(**{**report._asdict(), "destination": str(report.destination)})
+
+
+def analyze_database(full: bool) -> models.AnalyzeReportModel:
+    """Refresh the statistics of the query planner."""
+    return maintenance.analyze(full)
+
+
+def vacuum_database(max_pages: Optional[int]) -> models.VacuumReportModel:
+    """Free the unused pages of the database file."""
+    return maintenance.incremental_vacuum(max_pages)
+
+
+def check_database(full: bool) -> models.IntegrityReportModel:
+    """Look for corruptions in the database file."""
+    return maintenance.check_integrity(full)
+
+
+def get_space_report() -> models.SpaceReportModel:
+    """Return the space used by each table and index of the database file."""
+    return maintenance.space_report()
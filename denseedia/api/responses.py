@@ -0,0 +1,200 @@
+"""Define the responses of the trusted serialization path.
+
+The list endpoints may be encoded in several formats, chosen with the
+``Accept`` header of the request :
+
+- ``application/json`` (default) : a list of objects, byte-identical to the
+  validated path.
+- ``application/vnd.denseedia.columnar+json`` : an object with the field names
+  in ``columns``, and one array of values per object in ``rows``.
+- ``application/msgpack`` : the same list of objects as JSON, encoded with
+  MessagePack. It's only available if the ``msgpack`` package is installed.
+"""
+
+import json
+from typing import Any, Dict, List, Optional as Opt, Set, Union
+
+from fastapi import Response
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNAR_MEDIA_TYPE = "application/vnd.denseedia.columnar+json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+BINARY_MEDIA_TYPE = "application/octet-stream"
+_MSGPACK_ALIASES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+
+# To document the alternative formats in the OpenAPI schema
+LIST_RESPONSES: Dict[Union[int, str], Dict[str, Any]] = {
+    200: {
+        "content": {
+            COLUMNAR_MEDIA_TYPE: {},
+            MSGPACK_MEDIA_TYPE: {},
+        },
+    },
+}
+SERIES_RESPONSES: Dict[Union[int, str], Dict[str, Any]] = {
+    200: {
+        "content": {
+            BINARY_MEDIA_TYPE: {},
+        },
+    },
+}
+
+
+def _weighted_values(value: Opt[str]):
+    """Yield the (quality, position, value) of the values of an Accept-like header."""
+    if not value:
+        return
+    for (position, item) in enumerate(value.split(",")):
+        (token, *params) = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if token:
+            yield (quality, position, token.lower())
+
+
+def parse_quality_header(value: Opt[str]) -> List[str]:
+    """Return the values of an Accept-like header, the preferred first.
+
+    The values with a quality of 0 are dropped.
+    """
+    weighted = [(-quality, position, token) for (quality, position, token) in _weighted_values(value) if quality > 0]
+    return [token for (_, _, token) in sorted(weighted)]
+
+
+def parse_refused_values(value: Opt[str]) -> Set[str]:
+    """Return the values of an Accept-like header explicitly refused, with a quality of 0."""
+    return {token for (quality, _, token) in _weighted_values(value) if quality <= 0}
+
+
+def parse_revision_header(value: str) -> Opt[int]:
+    """Return the revision of an ``If-Match`` header, like ``"3"``, or None for ``*``.
+
+    A ValueError is raised if it's not a revision.
+    """
+    value = value.strip()
+    if value == "*":
+        return None
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        value = value[1:-1]
+    revision = int(value)
+    if revision < 0:
+        raise ValueError(f"Invalid revision : {revision}")
+    return revision
+
+
+def msgpack_available() -> bool:
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def to_columnar(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Convert a list of dicts with the same keys to the columnar layout.
+
+    The nested lists of dicts (like the versions of an element) are converted
+    too.
+    """
+    if not rows:
+        return {"columns": [], "rows": []}
+    return {
+        "columns": list(rows[0]),
+        "rows": [
+            [
+                to_columnar(value) if isinstance(value, list) else value
+                for value in row.values()
+            ]
+            for row in rows
+        ],
+    }
+
+
+def encode_json(content: Any) -> bytes:
+    """Encode trusted content with the same options as the default FastAPI response.
+
+    The standard library encoder is used, because the faster ones don't format
+    the floats the same way.
+    """
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class TrustedJSONResponse(Response):
+    """A JSON response for content that doesn't need any validation.
+
+    The content must only be made of JSON-compatible types, like the dicts of
+    ``storage.rows``. The output is byte-identical to the validated path.
+    """
+    media_type = JSON_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+class EncodedJSONResponse(Response):
+    """A JSON response for content encoded already, like the cached objects."""
+    media_type = JSON_MEDIA_TYPE
+
+
+class ColumnarJSONResponse(TrustedJSONResponse):
+    """A JSON response that uses arrays instead of repeated keys."""
+    media_type = COLUMNAR_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return super().render(to_columnar(content))
+
+
+class MessagePackResponse(Response):
+    """A MessagePack response for trusted content."""
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        import msgpack
+        return msgpack.packb(content, use_bin_type=True)
+
+
+def negotiated_response(rows: List[Dict[str, Any]], accept: Opt[str]) -> Response:
+    """Encode trusted rows in the format preferred by the ``Accept`` header.
+
+    JSON is used when no supported format is requested.
+    """
+    for media_type in parse_quality_header(accept):
+        if media_type == COLUMNAR_MEDIA_TYPE:
+            response: Response = ColumnarJSONResponse(rows)
+            break
+        if media_type in _MSGPACK_ALIASES and msgpack_available():
+            response = MessagePackResponse(rows)
+            break
+        if media_type in (JSON_MEDIA_TYPE, "application/*", "*/*"):
+            response = TrustedJSONResponse(rows)
+            break
+    else:
+        response = TrustedJSONResponse(rows)
+    response.headers["Vary"] = "Accept"
+    return response
+
+
+def series_response(content, accept: Opt[str]) -> Response:
+    """Encode a Series or a SeriesMatrix in JSON, or packed if asked."""
+    for media_type in parse_quality_header(accept):
+        if media_type == BINARY_MEDIA_TYPE:
+            response = Response(content.pack(), media_type=BINARY_MEDIA_TYPE)
+            break
+        if media_type in (JSON_MEDIA_TYPE, "application/*", "*/*"):
+            response = TrustedJSONResponse(content.to_dict())
+            break
+    else:
+        response = TrustedJSONResponse(content.to_dict())
+    response.headers["Vary"] = "Accept"
+    return response
@@ -0,0 +1,191 @@
+"""Run the write operations, possibly grouped in shared transactions.
+
+Without group commit, each write runs in its own transaction, like before.
+With group commit, the writes submitted by the request threads during a short
+window are applied by one worker thread in a single transaction, so SQLite
+syncs the file once for the whole group.
+
+Each write runs in a savepoint, so a failing write is rolled back alone and
+its caller gets its exception, while the others are committed. Pony can't
+forget the objects of a write that failed after modifying some of them : in
+this (rare) case, the transaction is rolled back and the successful writes of
+the group are replayed.
+
+The set-based writes, marked with ``alone``, change the rows with raw SQL,
+behind Pony's back : the objects loaded by the writes before them would be
+stale after them. So a group is split around them, each part in its own
+transaction.
+
+Each transaction of writes also refreshes the indexes derived from the change
+feed, like the trigrams of the titles, so the reads don't have to.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional as Opt, Set, Tuple, TypeVar
+
+from ..logger import logger
+from ..storage import trigrams
+from ..storage.tables import database, orm
+
+T = TypeVar("T")
+F = TypeVar("F", bound=Callable[..., Any])
+
+_alone_writes: Set[Callable[..., Any]] = set()
+
+
+def alone(func: F) -> F:
+    """Mark a write operation that doesn't share Pony's cache with the others of its group."""
+    _alone_writes.add(func)
+    return func
+
+
+class _Write(NamedTuple):
+    func: Callable[..., Any]
+    args: Tuple[Any, ...]
+    future: Future
+
+
+def _split(writes: List[_Write]) -> Iterator[List[_Write]]:
+    """Split a group around its writes that run alone."""
+    part: List[_Write] = []
+    for write in writes:
+        if write.func in _alone_writes:
+            if part:
+                yield part
+                part = []
+            yield [write]
+        else:
+            part.append(write)
+    if part:
+        yield part
+
+
+class WriteCoordinator:
+    """Collect the writes of many threads and commit them together.
+
+    A group is committed when ``window`` seconds have passed since its first
+    write, or when it holds ``max_batch`` writes.
+    """
+
+    def __init__(self, window: float, max_batch: int = 256):
+        self.window = window
+        self.max_batch = max_batch
+        self.queue: "queue.Queue[_Write]" = queue.Queue()
+        self.thread = threading.Thread(target=self._work, name="write-coordinator", daemon=True)
+        self.thread.start()
+
+    def submit(self, func: Callable[..., T], *args: Any) -> T:
+        """Run ``func(*args)`` in the next group and return its result.
+
+        It blocks until the group is committed, and raises the exception of
+        ``func`` if it failed.
+        """
+        future: Future = Future()
+        self.queue.put(_Write(func, args, future))
+        return future.result()
+
+    def _collect(self) -> List[_Write]:
+        writes = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(writes) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                writes.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return writes
+
+    def _work(self) -> None:
+        while True:
+            for writes in _split(self._collect()):
+                try:
+                    results = self._apply(writes)
+                except Exception as exc:
+                    # The commit itself failed : no write has been saved
+                    logger.exception("The group commit of %s writes failed", len(writes))
+                    for write in writes:
+                        write.future.set_exception(exc)
+                    continue
+                for (write, (result, error)) in zip(writes, results):
+                    if error is None:
+                        write.future.set_result(result)
+                    else:
+                        write.future.set_exception(error)
+
+    def _apply(self, writes: List[_Write]) -> List[Tuple[Any, Opt[BaseException]]]:
+        """Apply the writes in one transaction, each in a savepoint.
+
+        Return a (result, exception) pair for each write.
+        """
+        results: List[Tuple[Any, Opt[BaseException]]] = []
+        with orm.db_session:
+            index = 0
+            while index < len(writes):
+                write = writes[index]
+                connection = database.get_connection()
+                changes_before = connection.total_changes
+                database.execute("SAVEPOINT group_write")
+                try:
+                    result = write.func(*write.args)
+                    orm.flush()
+                except Exception as exc:
+                    results.append((None, exc))
+                    # Checked before any other query, as Pony flushes first
+                    pony_cache = database._get_cache()
+                    if pony_cache.modified or connection.total_changes != changes_before:
+                        # Pony still holds the objects of the failed write :
+                        # start again without it.
+                        logger.info("Replay the group commit without a failed write")
+                        orm.rollback()
+                        results = self._replay(writes[:index], results)
+                    else:
+                        database.execute("ROLLBACK TO SAVEPOINT group_write")
+                        database.execute("RELEASE SAVEPOINT group_write")
+                else:
+                    database.execute("RELEASE SAVEPOINT group_write")
+                    results.append((result, None))
+                index += 1
+            trigrams.refresh()
+        return results
+
+    @staticmethod
+    def _replay(
+        writes: List[_Write],
+        results: List[Tuple[Any, Opt[BaseException]]],
+    ) -> List[Tuple[Any, Opt[BaseException]]]:
+        """Run again the writes that succeeded, after a rollback.
+
+        If one of them fails this time, the whole group fails.
+        """
+        replayed = []
+        for (write, (result, exc)) in zip(writes, results):
+            if exc is None:
+                result = write.func(*write.args)
+                orm.flush()
+            replayed.append((result, exc))
+        replayed.append(results[-1])
+        return replayed
+
+
+_coordinator: Opt[WriteCoordinator] = None
+
+
+def use_group_commit(window: float, max_batch: int = 256) -> None:
+    """Group the next writes in shared transactions. A window of 0 disables it."""
+    global _coordinator
+    _coordinator = WriteCoordinator(window, max_batch) if window > 0 else None
+
+
+def run(func: Callable[..., T], *args: Any) -> T:
+    """Run a write operation, grouped with others if group commit is enabled."""
+    if _coordinator is None:
+        with orm.db_session:
+            result = func(*args)
+            trigrams.refresh()
+        return result
+    return _coordinator.submit(func, *args)
@@ -4,17 +4,27 @@ import datetime
 import functools
 import logging
 from pathlib import Path
-from typing import Optional as Opt, Sequence as Seq
+from typing import Any, Dict, Iterator, Optional as Opt, Sequence as Seq
 
 import click
 
 from . import operations
-from .. import exceptions, helpers
+from .. import exceptions, helpers, models
 from ..api.launch import launch_server
-from ..constants import DEFAULT_FILE_NAME
+from ..constants import (
+    API_HOST,
+    API_PORT,
+    DEFAULT_FILE_NAME,
+    DELTA_INTERVAL,
+    FEDERATION_PAGE_SIZE,
+    GROUP_COMMIT_MAX_BATCH,
+    RESPONSE_CACHE_SIZE,
+    SNAPSHOT_INTERVAL,
+    VALUE_COMPRESSION_THRESHOLD,
+)
 from ..customtypes import SupportedValue, ValueType
 from ..logger import logger
-from ..storage import tables
+from ..storage import backup, export, federation, maintenance, packing, tables
 
 
 def translate_exceptions(func):
@@ -22,7 +32,14 @@ def translate_exceptions(func):
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
-        except exceptions.ObjectNotFound as exc:
+        except (
+            exceptions.ObjectNotFound,
+            exceptions.MissingFilter,
+            exceptions.MissingModification,
+            exceptions.DuplicateLink,
+            exceptions.InvalidQuery,
+            exceptions.RevisionConflict,
+        ) as exc:
             raise click.UsageError(exc.args[0])
         except exceptions.ValueTypeChange as exc:
             msg = (
@@ -38,10 +55,46 @@ def edium_as_string(edium: tables.Edium) -> str:
     return f"Edium n°{edium.id}: {edium.title} ({edium.kind})"
 
 
+def federated_edium_as_string(edium: Dict[str, Any]) -> str:
+    return f"Edium n°{edium['id']}: {edium['title']} ({edium['kind']})"
+
+
+def all_federated_edia(in_title: Opt[str], kind: Opt[str]) -> Iterator[Dict[str, Any]]:
+    """Yield the matching edia of all the files, page by page."""
+    offset = 0
+    while True:
+        page = federation.search_edia(in_title, kind, limit=FEDERATION_PAGE_SIZE, offset=offset)
+        yield from page
+        if len(page) < FEDERATION_PAGE_SIZE:
+            return
+        offset += len(page)
+
+
 @click.group()
 @click.option("-f", "--file", type=click.Path(), help="Target file")
 @click.option("-v", "--verbose", count=True, help="Increase the verbosity")
-def main_group(file: Opt[str], verbose: int) -> None:
+@click.option(
+    "-a",
+    "--attach",
+    multiple=True,
+    metavar="NAMESPACE=FILE",
+    help="Read another file too, with its ids prefixed by the namespace (repeatable)",
+)
+@click.option(
+    "--compress-above",
+    type=click.IntRange(min=0),
+    default=VALUE_COMPRESSION_THRESHOLD,
+    show_default=True,
+    help="Store the values whose JSON takes at least this many bytes compressed (0 to disable)",
+)
+@click.pass_context
+def main_group(
+    context: click.Context,
+    file: Opt[str],
+    verbose: int,
+    attach: Seq[str],
+    compress_above: int,
+) -> None:
     # Set the logger verbosity
     if verbose >= 2:
         logger.setLevel(logging.DEBUG)
@@ -50,12 +103,209 @@ def main_group(file: Opt[str], verbose: int) -> None:
     # Use the proper file
     file_name: str = file or DEFAULT_FILE_NAME
     file_path = Path().joinpath(file_name).absolute().resolve()
-    tables.use_database(file_path)
+    # Before the migrations, which compress the values already there
+    packing.configure(compress_above)
+    if context.invoked_subcommand != "start-server":
+        # The server binds the database itself, maybe in memory
+        tables.use_database(file_path)
+    context.ensure_object(dict)
+    context.obj["file_path"] = file_path
+    context.obj["compress_above"] = compress_above
+    # Attach the other files
+    for item in attach:
+        (namespace, _, other_file) = item.partition("=")
+        try:
+            federation.attach(namespace, Path(other_file).absolute().resolve())
+        except (ValueError, FileNotFoundError) as exc:
+            raise click.BadParameter(str(exc), param_hint="--attach")
+
+
+@main_group.command(
+    name="start-server",
+    help="""Start the API server.
+
+    With --in-memory, the database file is loaded in RAM at startup and every
+    query is served from there. The changes are saved back to the file every
+    --snapshot-interval seconds, and when the server stops. If the server is
+    killed or crashes, the changes made since the last snapshot are lost. The
+    file itself always holds a consistent state. The reads wait for the write
+    in progress, so they never see what isn't committed. This mode needs a
+    single worker, and other processes must not write to the file meanwhile.
+    """,
+)
+@click.option("--host", default=API_HOST, show_default=True, help="Address to bind")
+@click.option("--port", type=int, default=API_PORT, show_default=True, help="Port to bind")
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of server processes",
+)
+@click.option(
+    "--backlog",
+    type=click.IntRange(min=1),
+    default=2048,
+    show_default=True,
+    help="Max number of connections waiting to be accepted",
+)
+@click.option(
+    "--keep-alive",
+    type=click.IntRange(min=1),
+    default=5,
+    show_default=True,
+    help="Seconds to keep an idle connection open",
+)
+@click.option(
+    "--group-commit-window",
+    type=click.FloatRange(min=0),
+    default=0,
+    show_default=True,
+    help="Commit the concurrent writes together, waiting up to this many milliseconds (0 to disable)",
+)
+@click.option(
+    "--group-commit-max-batch",
+    type=click.IntRange(min=1),
+    default=GROUP_COMMIT_MAX_BATCH,
+    show_default=True,
+    help="Max number of writes committed together",
+)
+@click.option("--in-memory", is_flag=True, help="Serve the database from RAM (see above)")
+@click.option(
+    "--snapshot-interval",
+    type=click.FloatRange(min=0, min_open=True),
+    default=SNAPSHOT_INTERVAL,
+    show_default=True,
+    help="Seconds between the snapshots to the file, with --in-memory",
+)
+@click.option(
+    "--cache-size",
+    type=click.FloatRange(min=0),
+    default=RESPONSE_CACHE_SIZE / 2 ** 20,
+    show_default=True,
+    help="MiB of encoded edia, elements and links cached by each server process (0 to disable)",
+)
+@click.option(
+    "--maintenance-interval",
+    type=click.FloatRange(min=0),
+    default=0,
+    show_default=True,
+    help="Seconds between two maintenances of the database while the server is idle (0 to disable)",
+)
+@click.option(
+    "--backup-dir",
+    type=click.Path(exists=True, file_okay=False, writable=True),
+    help="Folder of the backups asked with POST /admin/backup, which are refused without it",
+)
+@click.pass_context
+def start_server(
+    context: click.Context,
+    host: str,
+    port: int,
+    workers: int,
+    backlog: int,
+    keep_alive: int,
+    group_commit_window: float,
+    group_commit_max_batch: int,
+    in_memory: bool,
+    snapshot_interval: float,
+    cache_size: float,
+    maintenance_interval: float,
+    backup_dir: Opt[str],
+):
+    if in_memory and workers > 1:
+        raise click.UsageError("--in-memory needs a single worker")
+    launch_server(
+        context.obj["file_path"],
+        host=host,
+        port=port,
+        workers=workers,
+        backlog=backlog,
+        timeout_keep_alive=keep_alive,
+        group_commit_window=group_commit_window / 1000,
+        group_commit_max_batch=group_commit_max_batch,
+        in_memory=in_memory,
+        snapshot_interval=snapshot_interval,
+        attached=federation.attached(),
+        cache_size=int(cache_size * 2 ** 20),
+        maintenance_interval=maintenance_interval,
+        compression_threshold=context.obj["compress_above"],
+        backup_directory=None if backup_dir is None else Path(backup_dir).absolute(),
+    )
 
 
-@main_group.command(name="start-server", help="Start the API server")
-def start_server():
-    launch_server()
+@main_group.command(name="backup", help="Back up the database, even while the server runs")
+@click.argument("destination", type=click.Path(dir_okay=False, writable=True))
+@click.option("-z", "--compress", is_flag=True, help="Compress the copy with gzip")
+@click.option(
+    "--verify/--no-verify",
+    default=True,
+    show_default=True,
+    help="Check the copy with SQLite's integrity_check",
+)
+def backup_database(destination: str, compress: bool, verify: bool) -> None:
+    def show_progress(copied: int, total: int) -> None:
+        click.echo(f"\rCopied {copied}/{total} pages ({copied / max(total, 1):.0%})", nl=False)
+
+    try:
+        report = backup.backup(Path(destination), compress=compress, verify=verify, progress=show_progress)
+    except exceptions.BackupFailed as exc:
+        click.echo()
+        raise click.ClickException(exc.args[0])
+    click.echo()
+    click.echo(f"Saved {report.size} bytes to {report.destination} in {report.duration:.1f} s")
+
+
+@main_group.group("maintenance", help="Maintain the database file, even while the server runs")
+def maintenance_group():
+    pass
+
+
+@maintenance_group.command(name="analyze", help="Refresh the statistics of the query planner")
+@click.option("--full", is_flag=True, help="Analyse every table with ANALYZE, instead of PRAGMA optimize")
+def maintenance_analyze(full: bool) -> None:
+    report = maintenance.analyze(full)
+    click.echo(f"Analysed in {report.duration:.2f} s")
+
+
+@maintenance_group.command(name="vacuum", help="Free the unused pages of the file, in short steps")
+@click.option("-n", "--max-pages", type=click.IntRange(min=1), help="Max number of pages to free")
+@click.option("--enable", is_flag=True, help="Enable the incremental vacuum first, which rewrites the whole file")
+def maintenance_vacuum(max_pages: Opt[int], enable: bool) -> None:
+    try:
+        if enable and not maintenance.incremental_vacuum_enabled():
+            maintenance.enable_incremental_vacuum()
+            click.echo("Enabled the incremental vacuum")
+        report = maintenance.incremental_vacuum(max_pages)
+    except exceptions.MaintenanceFailed as exc:
+        raise click.ClickException(f"{exc.args[0]} : use --enable")
+    click.echo(f"Freed {report.freed_pages} pages in {report.duration:.2f} s, {report.free_pages} are left")
+
+
+@maintenance_group.command(name="check", help="Look for corruptions")
+@click.option("--full", is_flag=True, help="Also check the indexes against their tables (slower)")
+def maintenance_check(full: bool) -> None:
+    report = maintenance.check_integrity(full)
+    for problem in report.problems:
+        click.echo(problem)
+    if not report.ok:
+        raise click.ClickException(f"Found {len(report.problems)} problem(s)")
+    click.echo(f"No problem found in {report.duration:.2f} s")
+
+
+@maintenance_group.command(name="space", help="Show the space used by each table and index")
+def maintenance_space() -> None:
+    try:
+        report = maintenance.space_report()
+    except exceptions.MaintenanceFailed as exc:
+        raise click.ClickException(exc.args[0])
+    for usage in report.objects:
+        click.echo(f"{usage.size:>12} bytes {usage.pages:>8} pages {usage.unused:>12} unused  {usage.type} {usage.name}")
+    click.echo(
+        f"{report.size} bytes in {report.pages} pages of {report.page_size} bytes, "
+        f"{report.free_pages} free, incremental vacuum {'on' if report.incremental_vacuum else 'off'}"
+    )
 
 
 @main_group.command(name="add-edium", help="Create a new Edium")
@@ -88,12 +338,19 @@ def add_edium(
 @click.argument("edium1_id", type=int)
 @click.argument("edium2_id", type=int)
 @click.option("-l", "--label", help="Label of the link")
+@translate_exceptions
 def add_link(edium1_id: int, edium2_id: int, label: str):
-    operations.create_link(edium1_id, edium2_id, label)
+    (link_id, created) = operations.create_link(edium1_id, edium2_id, label)
+    if not created:
+        click.echo(f"These Edia are already linked by the link n°{link_id}")
 
 
 @main_group.command(name="list", help="List all Edia")
 def list_edia() -> None:
+    if federation.attached():
+        for federated_edium in all_federated_edia(None, None):
+            click.echo(federated_edium_as_string(federated_edium))
+        return
     # Fetch all Edia
     edia = operations.get_all_edia()
     # Print them
@@ -101,17 +358,262 @@ def list_edia() -> None:
         click.echo(edium_as_string(edium))
 
 
+@main_group.command(name="kinds", help="List the kinds of Edia and their sizes")
+def list_kinds() -> None:
+    for kind in operations.get_kinds():
+        click.echo(f"{kind.size:>8}  {kind.name}")
+
+
 @main_group.command(name="search", help="Search for Edia")
 @click.option("-t", "--title", "in_title", help="Part of the title of the Edia")
 @click.option("-k", "--kind", help="Kind of the Edia")
-def search_edia(in_title: Opt[str], kind: Opt[str]) -> None:
+@click.option("-z", "--fuzzy", is_flag=True, help="Rank the Edia by title similarity, allowing typos")
+def search_edia(in_title: Opt[str], kind: Opt[str], fuzzy: bool) -> None:
     if in_title is None and kind is None:
         raise click.UsageError("Please provide an option")
+    if fuzzy:
+        if in_title is None:
+            raise click.UsageError("Please provide the title to look for")
+        for (edium, score) in operations.search_similar_edia(in_title, kind, threshold=0.3):
+            click.echo(f"{score:4.0%}  {edium_as_string(edium)}")
+        return
+    if federation.attached():
+        for federated_edium in all_federated_edia(in_title, kind):
+            click.echo(federated_edium_as_string(federated_edium))
+        return
     edia = operations.search_edia(in_title, kind)
     for edium in edia:
         click.echo(edium_as_string(edium))
 
 
+@main_group.command(name="filter", help="Search for Edia with a filter, like 'kind = game and rating >= 8'")
+@click.argument("text")
+@click.option(
+    "-o", "--order", type=click.Choice([f"{sign}{order}" for order in models.EdiumOrder.all_orders for sign in ("", "-")]), default=models.EdiumOrder.ID,
+    help="Sort field, with a leading '-' for descending",
+)
+@click.option("-n", "--limit", type=int, default=100, show_default=True, help="Maximum number of Edia")
+@click.option("--explain", is_flag=True, help="Show the compiled SQL query and its plan instead")
+@translate_exceptions
+def filter_edia(text: str, order: models.EdiumOrder.asType, limit: int, explain: bool) -> None:
+    if explain:
+        plan = operations.explain_filter(text, order, limit)
+        click.echo(plan.sql)
+        click.echo(plan.params)
+        for step in plan.plan:
+            click.echo(step)
+        return
+    for edium in operations.filter_edia(text, order, limit):
+        click.echo(edium_as_string(edium))
+
+
+def report_bulk(count: int, dry_run: bool, table: str, action: str) -> None:
+    if dry_run:
+        click.echo(f"{count} {table} would be {action}")
+    else:
+        click.echo(f"{count} {table} {action}")
+
+
+@main_group.command(name="edit-edia", help="Edit all the Edia matching the filters")
+@click.option("-k", "--kind", help="Kind of the Edia")
+@click.option("-t", "--title-contains", help="Part of the title of the Edia")
+@click.option("--set-title", help="New title")
+@click.option("--set-kind", help="New kind")
+@click.option("-n", "--dry-run", is_flag=True, help="Only count the matching Edia")
+@translate_exceptions
+def edit_edia(
+    kind: Opt[str],
+    title_contains: Opt[str],
+    set_title: Opt[str],
+    set_kind: Opt[str],
+    dry_run: bool,
+) -> None:
+    if set_title is None and set_kind is None:
+        raise click.UsageError("Please provide --set-title or --set-kind")
+    count = operations.modify_edia_by_filter(kind, title_contains, set_title, set_kind, dry_run)
+    report_bulk(count, dry_run, "edia", "modified")
+
+
+@main_group.command(name="delete-edia", help="Delete all the Edia matching the filters")
+@click.option("-k", "--kind", help="Kind of the Edia")
+@click.option("-t", "--title-contains", help="Part of the title of the Edia")
+@click.option("-n", "--dry-run", is_flag=True, help="Only count the matching Edia")
+@click.option("-y", "--yes", is_flag=True, help="Don't ask for confirmation")
+@translate_exceptions
+def delete_edia(kind: Opt[str], title_contains: Opt[str], dry_run: bool, yes: bool) -> None:
+    if not dry_run and not yes:
+        count = operations.delete_edia_by_filter(kind, title_contains, dry_run=True)
+        click.confirm(f"Remove {count} Edia and all their history ?", abort=True)
+    count = operations.delete_edia_by_filter(kind, title_contains, dry_run)
+    report_bulk(count, dry_run, "edia", "deleted")
+
+
+@main_group.command(name="edit-links", help="Relabel all the links with a label")
+@click.argument("label")
+@click.argument("new_label")
+@click.option("-n", "--dry-run", is_flag=True, help="Only count the matching links")
+@translate_exceptions
+def edit_links(label: str, new_label: str, dry_run: bool) -> None:
+    count = operations.modify_links_by_filter(label, new_label, dry_run)
+    report_bulk(count, dry_run, "links", "modified")
+
+
+@main_group.command(name="delete-links", help="Delete all the links with a label")
+@click.argument("label")
+@click.option("-n", "--dry-run", is_flag=True, help="Only count the matching links")
+@click.option("-y", "--yes", is_flag=True, help="Don't ask for confirmation")
+def delete_links(label: str, dry_run: bool, yes: bool) -> None:
+    if not dry_run and not yes:
+        count = operations.delete_links_by_filter(label, dry_run=True)
+        click.confirm(f"Remove {count} links ?", abort=True)
+    count = operations.delete_links_by_filter(label, dry_run)
+    report_bulk(count, dry_run, "links", "deleted")
+
+
+@main_group.command(name="merge-links", help="Delete the links identical to an older one")
+@click.option("-n", "--dry-run", is_flag=True, help="Only count the duplicate links")
+@click.option(
+    "--unique-index/--no-unique-index",
+    default=None,
+    help="Then refuse the duplicate links from now on, or allow them again",
+)
+def merge_links(dry_run: bool, unique_index: Opt[bool]) -> None:
+    count = operations.merge_duplicate_links(dry_run, unique_index)
+    report_bulk(count, dry_run, "duplicate links", "deleted")
+    if unique_index is not None and not dry_run:
+        click.echo("The duplicate links are now refused" if unique_index else "The duplicate links are allowed again")
+
+
+@main_group.command(name="compact-history", help="Store the string histories of an element name as deltas")
+@click.argument("name")
+@click.option(
+    "-i",
+    "--interval",
+    type=click.IntRange(min=0),
+    default=DELTA_INTERVAL,
+    show_default=True,
+    help="Keep a full value every this many versions (0 to store them all whole again)",
+)
+@translate_exceptions
+def compact_history(name: str, interval: int) -> None:
+    report = operations.encode_histories(name, interval)
+    click.echo(
+        f"{report.deltas}/{report.versions} versions of {report.elements} element(s) stored as deltas : "
+        f"{report.size_before} -> {report.size_after} bytes"
+    )
+
+
+@main_group.command(name="dedupe", help="Find the likely duplicate Edia of a kind")
+@click.argument("kind")
+@click.option(
+    "-s",
+    "--threshold",
+    type=click.FloatRange(min=0, max=1, min_open=True),
+    default=0.6,
+    show_default=True,
+    help="Minimal title similarity",
+)
+def dedupe(kind: str, threshold: float) -> None:
+    pairs = operations.find_duplicates(kind, threshold)
+    for (first, second, score) in pairs:
+        click.echo(f"{score:4.0%}  {edium_as_string(first)}")
+        click.echo(f"      {edium_as_string(second)}")
+    click.echo(f"{len(pairs)} likely duplicate pair(s)")
+
+
+@main_group.command(name="neighbors", help="List the Edia linked to an Edium, like 42 or team:42")
+@click.argument("edium_id")
+@click.option("-d", "--depth", type=click.IntRange(min=1), default=1, show_default=True, help="Max number of links")
+@translate_exceptions
+def list_neighbors(edium_id: str, depth: int) -> None:
+    for neighbor in federation.neighbors(edium_id, depth):
+        click.echo(f"{'  ' * (neighbor['distance'] - 1)}{federated_edium_as_string(neighbor)}")
+
+
+@main_group.command(name="export-graph", help="Export the Edia and the links for a graph tool")
+@click.option(
+    "-F",
+    "--format",
+    "graph_format",
+    type=click.Choice(models.GraphFormat.all_formats),
+    default=models.GraphFormat.DOT,
+    show_default=True,
+    help="File format",
+)
+@click.option("-o", "--output", type=click.Path(dir_okay=False, writable=True), default="-", help="Target file")
+@click.option("-k", "--kind", help="Only the Edia of this kind")
+@click.option("-l", "--label", help="Only the links with this label")
+@click.option("-c", "--center", type=int, help="Only the Edia up to DEPTH links away from this one")
+@click.option("-d", "--depth", type=click.IntRange(min=1), default=1, show_default=True, help="Max number of links")
+@translate_exceptions
+def export_graph(
+    graph_format: models.GraphFormat.asType,
+    output: str,
+    kind: Opt[str],
+    label: Opt[str],
+    center: Opt[int],
+    depth: int,
+) -> None:
+    chunks = export.export_graph(graph_format, kind, label, center, depth)
+    with click.open_file(output, "w", encoding="utf-8") as file:
+        for chunk in chunks:
+            file.write(chunk)
+
+
+@main_group.group("graph", help="Analyse the graph of the links")
+@click.option("-l", "--label", help="Only the links with this label")
+@click.option("-k", "--kind", help="Only the Edia of this kind, and the links between them")
+@click.option("-n", "--limit", type=click.IntRange(min=1), default=10, show_default=True, help="Length of the lists")
+@click.pass_context
+def graph_group(context: click.Context, label: Opt[str], kind: Opt[str], limit: int):
+    context.ensure_object(dict)
+    context.obj["analysis"] = operations.analyse_graph(label, kind)
+    context.obj["limit"] = limit
+
+
+def echo_ranking(ranking: Seq[Dict[str, Any]], value_format: str) -> None:
+    edia = operations.get_edia(rank["edium_id"] for rank in ranking)
+    for rank in ranking:
+        click.echo(f"{rank['value']:{value_format}}  {edium_as_string(edia[rank['edium_id']])}")
+
+
+@graph_group.command(name="components", help="List the biggest connected components")
+@click.pass_context
+def graph_components(context: click.Context) -> None:
+    analysis = context.obj["analysis"]
+    components = analysis.component_sizes(context.obj["limit"])
+    edia = operations.get_edia(component["id"] for component in components)
+    for component in components:
+        click.echo(f"{component['size']:>8} edia, like {edium_as_string(edia[component['id']])}")
+    click.echo(f"{len(set(analysis.components.tolist()))} component(s), {len(analysis.edium_ids)} edia")
+
+
+@graph_group.command(name="degrees", help="List the Edia with the most incoming and outgoing links")
+@click.pass_context
+def graph_degrees(context: click.Context) -> None:
+    analysis = context.obj["analysis"]
+    click.echo("Incoming links :")
+    echo_ranking(analysis.ranking(analysis.in_degrees, context.obj["limit"]), ">6")
+    click.echo("Outgoing links :")
+    echo_ranking(analysis.ranking(analysis.out_degrees, context.obj["limit"]), ">6")
+
+
+@graph_group.command(name="pagerank", help="List the Edia with the highest PageRank")
+@click.pass_context
+def graph_pagerank(context: click.Context) -> None:
+    analysis = context.obj["analysis"]
+    echo_ranking(analysis.ranking(analysis.pagerank, context.obj["limit"]), ".6f")
+
+
+@graph_group.command(name="orphans", help="List the Edia without links")
+@click.pass_context
+def graph_orphans(context: click.Context) -> None:
+    orphans = context.obj["analysis"].orphans()
+    for edium in operations.get_edia(orphans).values():
+        click.echo(edium_as_string(edium))
+    click.echo(f"{len(orphans)} orphan(s)")
+
+
 @main_group.group("edium", help="Operations on an Edium")
 @click.argument("edium_id", type=int)
 @click.pass_context
@@ -228,7 +730,8 @@ def edium_edit(
 @translate_exceptions
 def edium_delete(context: click.Context) -> None:
     edium_id: int = context.obj["edium_id"]
-    operations.delete_edium(edium_id)
+    report = operations.delete_edium(edium_id)
+    click.echo(f"Deleted {report}")
 
 
 @edium_group.command(name="history", help="Show the history of an element")
@@ -1,11 +1,24 @@
 """Define functions that link the ORM classes and the frontend (CLI or API)."""
 
-from typing import List, Optional as Opt, Tuple
+from typing import Dict, Iterable, List, Optional as Opt, Tuple
 
-from .. import exceptions
+from .. import exceptions, helpers, models
 from ..customtypes import ElementSummary, SupportedValue, ValueType
 from ..logger import logger
-from ..storage.tables import Edium, Element, Link, orm, Version
+from ..storage import bulk, deletions, filters, graph, histories, links, trigrams
+from ..storage.tables import Edium, Element, Kind, Link, orm, record_change, Version
+
+CREATE: models.ChangeOperation.asType = models.ChangeOperation.CREATE
+MODIFY: models.ChangeOperation.asType = models.ChangeOperation.MODIFY
+DELETE: models.ChangeOperation.asType = models.ChangeOperation.DELETE
+
+
+def _record_new_element(element: Element) -> None:
+    """Add the creation of an element and its versions to the change feed."""
+    orm.flush()
+    record_change("element", element.id, CREATE)
+    for version in element.versions:
+        record_change("version", version.id, CREATE)
 
 
 def _compare_element_types(
@@ -38,10 +51,12 @@ def create_edium(
 
     with orm.db_session:
         edium = Edium(title=title, kind=kind)
+        orm.flush()
+        record_change("edium", edium.id, CREATE)
         if url is not None:
-            edium.create_element("url", url)
+            _record_new_element(edium.create_element("url", url))
         if comment is not None:
-            edium.create_element("comment", comment)
+            _record_new_element(edium.create_element("comment", comment))
 
 
 def get_all_edia() -> List[Edium]:
@@ -50,6 +65,12 @@ def get_all_edia() -> List[Edium]:
         return Edium.select()[:]
 
 
+def get_kinds() -> List[Kind]:
+    """Return the kinds of Edia, from the biggest."""
+    with orm.db_session:
+        return Kind.select().order_by(orm.desc(Kind.size), Kind.name)[:]
+
+
 def search_edia(in_title: Opt[str], kind: Opt[str]) -> List[Edium]:
     """Return a list of Edia of the given kind, with the given string in title.
     """
@@ -63,6 +84,52 @@ def search_edia(in_title: Opt[str], kind: Opt[str]) -> List[Edium]:
     return rv
 
 
+def filter_edia(text: str, order: models.EdiumOrder.asType, limit: int) -> List[Edium]:
+    """Return the Edia matching a filter query."""
+    with orm.db_session:
+        return [Edium[found["id"]] for found in filters.search(text, order, limit)]
+
+
+def explain_filter(text: str, order: models.EdiumOrder.asType, limit: int) -> models.QueryPlanModel:
+    """Return the SQL compiled from a filter query, and its plan."""
+    with orm.db_session:
+        return filters.explain(text, order, limit)
+
+
+def _refresh_trigrams() -> None:
+    """Bring the trigram index up to date, as the writes of the CLI don't."""
+    with orm.db_session:
+        trigrams.refresh()
+
+
+def search_similar_edia(query: str, kind: Opt[str], threshold: float) -> List[Tuple[Edium, float]]:
+    """Return the Edia with a title similar to the query, with their similarity."""
+    _refresh_trigrams()
+    with orm.db_session:
+        return [(Edium[found["id"]], found["similarity"]) for found in trigrams.search(query, kind, threshold)]
+
+
+def find_duplicates(kind: str, threshold: float) -> List[Tuple[Edium, Edium, float]]:
+    """Return the pairs of Edia of a kind with similar titles."""
+    _refresh_trigrams()
+    with orm.db_session:
+        return [
+            (Edium[pair.first_id], Edium[pair.second_id], pair.similarity)
+            for pair in trigrams.duplicates(kind, threshold)
+        ]
+
+
+def analyse_graph(label: Opt[str], kind: Opt[str]) -> graph.GraphAnalysis:
+    """Analyse the graph of the links, without cache as the process is short-lived."""
+    with orm.db_session:
+        return graph.analyse(graph.load_arrays(label, kind))
+
+
+def get_edia(edium_ids: Iterable[int]) -> Dict[int, Edium]:
+    with orm.db_session:
+        return {edium_id: Edium[edium_id] for edium_id in edium_ids}
+
+
 def get_one_edium_details(
     edium_id: int
 ) -> Tuple[Edium, List[ElementSummary], List[Link]]:
@@ -94,7 +161,13 @@ def set_element_value(
                 element_name,
                 element_value
             )
-        edium.set_element_value(element_name, element_value)
+        is_new_element = edium.get_element_by_name(element_name) is None
+        version = edium.set_element_value(element_name, element_value)
+        if is_new_element:
+            _record_new_element(version.element)
+        else:
+            orm.flush()
+            record_change("version", version.id, CREATE)
 
 
 def edit_edium(edium_id: int, new_title: Opt[str], new_kind: Opt[str]) -> None:
@@ -107,15 +180,18 @@ def edit_edium(edium_id: int, new_title: Opt[str], new_kind: Opt[str]) -> None:
             edium.title = new_title
         if new_kind is not None:
             edium.kind = new_kind
+        edium.updated_at = helpers.now()
+        record_change("edium", edium_id, MODIFY)
 
 
-def delete_edium(edium_id: int) -> None:
-    """Delete an Edium from the database."""
+def delete_edium(edium_id: int) -> deletions.DeletionReport:
+    """Delete an Edium from the database, and return what was deleted."""
     with orm.db_session:
-        edium: Edium = Edium.get(id=edium_id)
-        if edium is None:
+        if not Edium.exists(id=edium_id):
             raise exceptions.ObjectNotFound("Edium", edium_id)
-        edium.delete()
+        report = deletions.delete_edium(edium_id)
+        record_change("edium", edium_id, DELETE)
+    return report
 
 
 def get_element_versions(
@@ -133,22 +209,35 @@ def get_element_versions(
         return element, list(query)
 
 
-def create_link(edium1_id: int, edium2_id: int, label: Opt[str]) -> None:
-    """Link two Edia together."""
+def create_link(edium1_id: int, edium2_id: int, label: Opt[str]) -> Tuple[int, bool]:
+    """Link two Edia together, unless they already are with this label.
+
+    Return the id of the link, and whether it was created.
+    """
     label = "" if label is None else label
     with orm.db_session:
-        edium1: Edium = Edium[edium1_id]
-        if edium1 is None:
-            raise exceptions.ObjectNotFound("Edium", edium1_id)
-        edium2: Edium = Edium[edium2_id]
-        if edium2 is None:
-            raise exceptions.ObjectNotFound("Edium", edium2_id)
-        Link(
-            start=edium1,
-            end=edium2,
-            label=label,
-            directed=True
-        )
+        (link_id, created) = links.upsert_link(edium1_id, edium2_id, True, label)
+        if created:
+            record_change("link", link_id, CREATE)
+    return link_id, created
+
+
+def merge_duplicate_links(dry_run: bool, unique_index: Opt[bool]) -> int:
+    """Delete the duplicate links, then add or drop the unique index if asked."""
+    with orm.db_session:
+        count = bulk.merge_duplicate_links(dry_run)
+        if not dry_run and unique_index is not None:
+            if unique_index:
+                links.add_unique_index()
+            else:
+                links.drop_unique_index()
+    return count
+
+
+def encode_histories(name: str, interval: int) -> models.DeltaReportModel:
+    """Store the string histories of the elements of a name as deltas, or whole again below 2."""
+    with orm.db_session:
+        return histories.encode_name(name, interval)
 
 
 def get_one_link_details(link_id: int) -> Link:
@@ -169,6 +258,8 @@ def edit_link(link_id: int, new_label: Opt[str]) -> None:
             raise exceptions.ObjectNotFound("link", link_id)
         if new_label is not None:
             link.label = new_label
+        link.updated_at = helpers.now()
+        record_change("link", link_id, MODIFY)
 
 
 def delete_link(link_id: int) -> None:
@@ -177,4 +268,36 @@ def delete_link(link_id: int) -> None:
         link: Link = Link.get(id=link_id)
         if link is None:
             raise exceptions.ObjectNotFound("link", link_id)
+        link.bury()
         link.delete()
+        record_change("link", link_id, DELETE)
+
+
+def modify_edia_by_filter(
+    kind: Opt[str],
+    title_contains: Opt[str],
+    new_title: Opt[str],
+    new_kind: Opt[str],
+    dry_run: bool,
+) -> int:
+    """Modify the matching edia, and return their count."""
+    with orm.db_session:
+        return bulk.modify_edia(kind, title_contains, new_title, new_kind, dry_run)
+
+
+def delete_edia_by_filter(kind: Opt[str], title_contains: Opt[str], dry_run: bool) -> int:
+    """Delete the matching edia, and return their count."""
+    with orm.db_session:
+        return bulk.delete_edia(kind, title_contains, dry_run)
+
+
+def modify_links_by_filter(label: str, new_label: str, dry_run: bool) -> int:
+    """Relabel the matching links, and return their count."""
+    with orm.db_session:
+        return bulk.modify_links(label, new_label, dry_run)
+
+
+def delete_links_by_filter(label: str, dry_run: bool) -> int:
+    """Delete the matching links, and return their count."""
+    with orm.db_session:
+        return bulk.delete_links(label, dry_run)
@@ -4,4 +4,36 @@ from pathlib import Path
 
 ROOT_PATH = Path(__file__).parent.parent
 DEFAULT_FILE_NAME = "db.db"
+API_HOST: str = "127.0.0.1"
 API_PORT: int = 59130
+# How long a connection waits for the lock of another process, in milliseconds
+SQLITE_BUSY_TIMEOUT: int = 5000
+# Responses smaller than this (in bytes) are not compressed
+COMPRESSION_MINIMUM_SIZE: int = 1024
+# Change feed : max changes per response, and polling period of the SSE stream
+CHANGES_PAGE_SIZE: int = 1000
+CHANGES_POLL_INTERVAL: float = 0.5
+CHANGES_KEEP_ALIVE_INTERVAL: float = 15.0
+# Group commit : max writes per transaction (the window is given at launch)
+GROUP_COMMIT_MAX_BATCH: int = 256
+# In-memory mode : period of the snapshots to the file, in seconds
+SNAPSHOT_INTERVAL: float = 60.0
+# Backups : pages copied per step, and pause between the steps in seconds
+BACKUP_PAGES_PER_STEP: int = 1024
+BACKUP_STEP_PAUSE: float = 0.005
+# Federation : edia read per page when listing all the attached files
+FEDERATION_PAGE_SIZE: int = 1000
+# Graph export : rows read from the cursor and sent per chunk
+EXPORT_CHUNK_ROWS: int = 1000
+# Response cache : max size of the encoded objects kept by each server process, in bytes
+RESPONSE_CACHE_SIZE: int = 32 * 1024 * 1024
+# Maintenance : pages freed per step of the incremental vacuum, and pause between the steps in seconds
+VACUUM_PAGES_PER_STEP: int = 256
+VACUUM_STEP_PAUSE: float = 0.01
+# Idle maintenance : seconds without any request before the server runs it
+MAINTENANCE_IDLE_DELAY: float = 30.0
+# Version deltas : default number of versions between two full values of a string history
+DELTA_INTERVAL: int = 32
+# Versions : values whose JSON takes at least this many bytes are stored compressed (0 to disable), and the level
+VALUE_COMPRESSION_THRESHOLD: int = 2048
+VALUE_COMPRESSION_LEVEL: int = 6
@@ -1,6 +1,6 @@
 """Define some exceptions."""
 
-from typing import Union
+from typing import Optional, Union
 
 
 class DenseEdiaException(Exception):
@@ -34,3 +34,68 @@ class ValueTypeChange(DenseEdiaException):
 class UnsupportedTypeException(DenseEdiaException):
     def __init__(self, value):
         super().__init__(f"Type not supported : {type(value)}")
+
+
+class MissingFilter(DenseEdiaException):
+    def __init__(self, table: str):
+        super().__init__(f"At least one filter is needed to select the {table} rows")
+        self.table = table
+
+
+class MissingModification(DenseEdiaException):
+    def __init__(self, table: str):
+        super().__init__(f"At least one new value is needed to modify the {table} rows")
+        self.table = table
+
+
+class DuplicateLink(DenseEdiaException):
+    def __init__(self, start: int, end: int, label: str):
+        super().__init__(f"A link from {start} to {end} with the label '{label}' already exists")
+        self.start = start
+        self.end = end
+        self.label = label
+
+
+class RevisionConflict(DenseEdiaException):
+    def __init__(self, element_id: int, expected: Optional[int], actual: Optional[int] = None):
+        if actual is None:
+            msg = f"Element '{element_id}' was modified by another write at the same time"
+        else:
+            msg = f"Element '{element_id}' is at revision {actual}, not {expected}"
+        super().__init__(msg)
+        self.element_id = element_id
+        self.expected = expected
+        self.actual = actual
+
+
+class BrokenHistory(DenseEdiaException):
+    def __init__(self, element_id: int, version_id: int):
+        super().__init__(
+            f"The version {version_id} of the element {element_id} is stored as a delta, "
+            "but no next version holds a full value to rebuild it from"
+        )
+        self.element_id = element_id
+        self.version_id = version_id
+
+
+class InvalidQuery(DenseEdiaException):
+    def __init__(self, reason: str, position: int):
+        super().__init__(f"{reason} (at character {position + 1})")
+        self.reason = reason
+        self.position = position
+
+
+class BackupFailed(DenseEdiaException):
+    pass
+
+
+class BackupRefused(DenseEdiaException):
+    pass
+
+
+class MaintenanceFailed(DenseEdiaException):
+    pass
+
+
+class CompressionUnavailable(DenseEdiaException):
+    pass
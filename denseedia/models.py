@@ -1,7 +1,7 @@
 """Define the models."""
 
 from datetime import datetime
-from typing import Any, List, Literal, Optional
+from typing import Any, Dict, Final, List, Literal, Optional, Tuple
 
 from pydantic import BaseModel, Field, root_validator
 
@@ -20,7 +20,9 @@ class ElementModel(BaseModel):
     edium_id: int
     name: str
     creation_date: datetime
+    updated_at: datetime
     todo: bool
+    revision: int  # Incremented by each write to the element or its versions
     versions: List[VersionModel]
 
 
@@ -29,6 +31,70 @@ class EdiumModel(BaseModel):
     title: str
     kind: Optional[str]
     creation_date: datetime
+    updated_at: datetime
+
+
+class SimilarEdiumModel(EdiumModel):
+    similarity: float  # Between 0 and 1
+
+
+class KindModel(BaseModel):
+    name: str
+    size: int  # Number of edia
+
+
+class QueryPlanModel(BaseModel):
+    sql: str
+    params: Dict[str, Any]
+    plan: List[str]  # The steps of SQLite, indented under their parent
+
+
+class DuplicateModel(BaseModel):
+    first: EdiumModel
+    second: EdiumModel
+    similarity: float
+
+
+class GraphRankModel(BaseModel):
+    edium_id: int
+    value: float
+
+
+class GraphComponentModel(BaseModel):
+    id: int  # The smallest edium id of the component
+    size: int
+
+
+class GraphStatsModel(BaseModel):
+    edia: int
+    links: int
+    component_count: int
+    components: List[GraphComponentModel]
+    in_degree: List[GraphRankModel]
+    out_degree: List[GraphRankModel]
+    pagerank: List[GraphRankModel]
+    orphans: List[int]
+
+
+class CacheStatsModel(BaseModel):
+    entries: int
+    size: int  # Total length of the cached responses, in bytes
+    max_size: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class FederatedEdiumModel(BaseModel):
+    id: str  # Prefixed with the namespace of its file, like "team:42"
+    title: str
+    kind: Optional[str]
+    creation_date: datetime
+    updated_at: datetime
+
+
+class NeighborModel(FederatedEdiumModel):
+    distance: int
 
 
 class LinkModel(BaseModel):
@@ -37,6 +103,29 @@ class LinkModel(BaseModel):
     end: int = Field(ge=1)
     directed: bool
     label: str
+    updated_at: datetime
+
+
+class TombstoneModel(BaseModel):
+    table: str
+    object_id: int
+    deletion_date: datetime
+
+
+class SyncModel(BaseModel):
+    until: datetime
+    edia: List[EdiumModel]
+    elements: List[ElementModel]
+    links: List[LinkModel]
+    tombstones: List[TombstoneModel]
+
+
+class ChangeModel(BaseModel):
+    id: int
+    table: str
+    object_id: int
+    operation: str
+    creation_date: datetime
 
 
 class CreateEdiumModel(BaseModel):
@@ -50,12 +139,47 @@ class ModifyEdiumModel(BaseModel):
 
 
 class VersionsMode:
-    NONE = "none"
-    SINGLE = "single"
-    ALL = "all"
+    NONE: Final = "none"
+    SINGLE: Final = "single"
+    ALL: Final = "all"
     asType = Literal["none", "single", "all"]
 
 
+class ChangeOperation:
+    CREATE: Final = "create"
+    MODIFY: Final = "modify"
+    DELETE: Final = "delete"
+    asType = Literal["create", "modify", "delete"]
+
+
+class Aggregation:
+    MEAN: Final = "mean"
+    MIN: Final = "min"
+    MAX: Final = "max"
+    LAST: Final = "last"
+    COUNT: Final = "count"
+    asType = Literal["mean", "min", "max", "last", "count"]
+
+
+class GraphFormat:
+    DOT: Final = "dot"
+    GRAPHML: Final = "graphml"
+    EDGELIST: Final = "edgelist"
+    asType = Literal["dot", "graphml", "edgelist"]
+    all_formats: List[asType] = [DOT, GRAPHML, EDGELIST]
+
+
+class EdiumOrder:
+    """The orders of the search results, descending with a leading "-"."""
+    ID = "id"
+    TITLE = "title"
+    KIND = "kind"
+    CREATED = "created"
+    UPDATED = "updated"
+    all_orders = [ID, TITLE, KIND, CREATED, UPDATED]
+    asType = Literal["id", "-id", "title", "-title", "kind", "-kind", "created", "-created", "updated", "-updated"]
+
+
 class ValueType:
     NONE = "none"
     BOOL = "bool"
@@ -75,6 +199,29 @@ class ValueType:
         return cls.all_types[index]
 
 
+def value_matches_type(v_type: ValueType.asType, v_json: Any) -> bool:
+    """Return whether a JSON value is valid for a value type."""
+    if v_type == ValueType.NONE:
+        return v_json is None
+    if v_type == ValueType.BOOL:
+        return isinstance(v_json, bool)
+    if v_type == ValueType.INT:
+        return isinstance(v_json, int)
+    if v_type == ValueType.FLOAT:
+        return isinstance(v_json, int) or isinstance(v_json, float)
+    if v_type == ValueType.STR:
+        return isinstance(v_json, str)
+    if v_type == ValueType.DATETIME:
+        if not isinstance(v_json, str):
+            return False
+        try:
+            datetime.fromisoformat(v_json)
+        except ValueError:
+            return False
+        return True
+    raise TypeError(f"Unknown type : '{v_type}'")
+
+
 class CreateVersionModel(BaseModel):
     value_type: ValueType.asType
     value_json: Any
@@ -82,42 +229,33 @@ class CreateVersionModel(BaseModel):
     @root_validator(skip_on_failure=True)
     def type_and_value_must_match(cls, values):
         v_type, v_json = values.get('value_type'), values.get('value_json')
-        if v_type == ValueType.NONE:
-            if v_json is not None:
-                raise ValueError(f"Type '{v_type}' and value {v_json!r} are not compatible")
-            return values
-
-        if v_type == ValueType.BOOL:
-            if not isinstance(v_json, bool):
-                raise ValueError(f"Type '{v_type}' and value {v_json!r} are not compatible")
-            return values
-
-        if v_type == ValueType.INT:
-            if not isinstance(v_json, int):
-                raise ValueError(f"Type '{v_type}' and value {v_json!r} are not compatible")
-            return values
-
-        if v_type == ValueType.FLOAT:
-            if not isinstance(v_json, int) and not isinstance(v_json, float):
-                raise ValueError(f"Type '{v_type}' and value {v_json!r} are not compatible")
-            return values
-
-        if v_type == ValueType.STR:
-            if not isinstance(v_json, str):
-                raise ValueError(f"Type '{v_type}' and value {v_json!r} are not compatible")
-            return values
-
-        if v_type == ValueType.DATETIME:
-            if isinstance(v_json, str):
-                try:
-                    datetime.fromisoformat(v_json)
-                    return values
-                except ValueError:
-                    raise ValueError(f"Type '{v_type}' and value {v_json!r} are not compatible")
-            else:
-                raise ValueError(f"Type '{v_type}' and value {v_json!r} are not compatible")
-
-        raise TypeError(f"Unknown type : '{v_type}'")
+        if not value_matches_type(v_type, v_json):
+            raise ValueError(f"Type '{v_type}' and value {v_json!r} are not compatible")
+        return values
+
+
+class CreateVersionSeriesModel(BaseModel):
+    """Many versions of one element, as (creation date, value) points."""
+    value_type: ValueType.asType
+    points: List[Tuple[datetime, Any]] = Field(min_items=1)
+
+    @root_validator(skip_on_failure=True)
+    def types_and_values_must_match(cls, values):
+        v_type = values.get('value_type')
+        for (index, (_, v_json)) in enumerate(values.get('points')):
+            if not value_matches_type(v_type, v_json):
+                raise ValueError(f"Point {index} : type '{v_type}' and value {v_json!r} are not compatible")
+        return values
+
+
+class ElementVersionSeriesModel(CreateVersionSeriesModel):
+    element_id: int
+    expected_revision: Optional[int] = None
+
+
+class IngestionResultModel(BaseModel):
+    elements: int
+    versions: int
 
 
 class CreateElementModel(BaseModel):
@@ -138,3 +276,69 @@ class CreateLinkModel(BaseModel):
 
 class ModifyLinkModel(BaseModel):
     label: Optional[str]
+
+
+class BulkResultModel(BaseModel):
+    count: int  # Number of affected rows, or matching rows with dry_run
+    dry_run: bool
+
+
+class BackupModel(BaseModel):
+    destination: str = Field(min_length=1)
+    compress: bool = False
+    verify: bool = True
+
+
+class BackupReportModel(BaseModel):
+    destination: str
+    pages: int
+    size: int
+    duration: float
+    compressed: bool
+    verified: bool
+
+
+class AnalyzeReportModel(BaseModel):
+    full: bool  # ANALYZE, or else PRAGMA optimize
+    duration: float
+
+
+class VacuumReportModel(BaseModel):
+    freed_pages: int
+    free_pages: int  # The unused pages left in the file
+    duration: float
+
+
+class IntegrityReportModel(BaseModel):
+    full: bool  # integrity_check, or else quick_check
+    ok: bool
+    problems: List[str]
+    duration: float
+
+
+class SpaceUsageModel(BaseModel):
+    name: str
+    type: str  # "table" or "index"
+    table: str
+    pages: int
+    size: int  # In bytes
+    unused: int  # Bytes unused in the pages
+
+
+class SpaceReportModel(BaseModel):
+    page_size: int
+    pages: int
+    free_pages: int
+    size: int  # In bytes
+    incremental_vacuum: bool
+    objects: List[SpaceUsageModel]
+
+
+class DeltaReportModel(BaseModel):
+    name: str
+    interval: int  # A full value every this many versions, or no delta below 2
+    elements: int
+    versions: int
+    deltas: int  # Number of versions stored as a delta
+    size_before: int  # Bytes of the stored values
+    size_after: int
@@ -0,0 +1,161 @@
+"""Back up the database while it's being used, with the SQLite backup API.
+
+The pages are copied in small steps. The source connection keeps a single
+read transaction for the whole copy : in WAL mode, the writers go on
+meanwhile, and the copy is the consistent state of the database when the
+backup started. The copy is written next to the destination, then checked,
+compressed if asked, and moved to the destination at last.
+
+The backups asked over HTTP are only written in the folder given to
+``configure``, so a client can't overwrite any other file of the server.
+"""
+
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple, Optional as Opt, Set, Tuple
+
+from . import snapshots
+from .. import exceptions
+from ..constants import BACKUP_PAGES_PER_STEP, BACKUP_STEP_PAUSE
+from ..logger import logger
+from .tables import database
+
+# Called with the number of pages copied and the total number of pages
+Progress = Callable[[int, int], None]
+
+# Set by configure() : the folder of the backups asked over HTTP, or None to refuse them
+directory: Opt[Path] = None
+
+
+class BackupReport(NamedTuple):
+    destination: Path
+    pages: int
+    size: int  # In bytes, once compressed
+    duration: float  # In seconds
+    compressed: bool
+    verified: bool
+
+
+@contextmanager
+def _open_source() -> Iterator[Tuple[sqlite3.Connection, int]]:
+    """Yield a connection to the bound database, and the pages per step to copy."""
+    snapshotter = snapshots.snapshotter
+    if snapshotter is not None:
+        # Copy the in-memory database at once, between two writes : it's fast,
+        # and its shared cache doesn't let the writers go on anyway
+        with snapshotter.lock:
+            database.provider.acquire_lock()
+            try:
+                yield snapshotter.keeper, -1
+            finally:
+                database.provider.release_lock()
+        return
+    source = sqlite3.connect(database.provider.pool.filename, isolation_level=None)
+    try:
+        source.execute("BEGIN")
+        # Start the read transaction now, so each step reads the same state
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        yield source, BACKUP_PAGES_PER_STEP
+    finally:
+        source.close()
+
+
+def configure(new_directory: Opt[Path]) -> None:
+    """Write the backups asked over HTTP in ``new_directory``, or refuse them if None."""
+    global directory
+    directory = None if new_directory is None else new_directory.resolve()
+
+
+def _database_files() -> Set[Path]:
+    """Return the files of the bound database : the database itself, its WAL and its journals."""
+    snapshotter = snapshots.snapshotter
+    file_path = snapshotter.file_path if snapshotter is not None else Path(database.provider.pool.filename)
+    file_path = file_path.resolve()
+    return {file_path.with_name(file_path.name + suffix) for suffix in ("", "-wal", "-shm", "-journal")}
+
+
+def resolve_destination(name: str) -> Path:
+    """Return the path of a backup asked over HTTP, inside the configured folder.
+
+    A BackupRefused is raised if these backups are disabled, or if the name
+    leads out of the folder or to the database itself.
+    """
+    if directory is None:
+        raise exceptions.BackupRefused("The backups over HTTP are disabled : start the server with --backup-dir")
+    destination = (directory / name).resolve()
+    if directory not in destination.parents:
+        raise exceptions.BackupRefused(f"The destination must be inside the backup folder : '{name}'")
+    if destination in _database_files():
+        raise exceptions.BackupRefused(f"The destination is the database itself : '{name}'")
+    return destination
+
+
+def check_integrity(file_path: Path) -> None:
+    """Raise a BackupFailed if SQLite finds a problem in a database file."""
+    connection = sqlite3.connect(str(file_path))
+    try:
+        problems = [row[0] for row in connection.execute("PRAGMA integrity_check")]
+    finally:
+        connection.close()
+    if problems != ["ok"]:
+        raise exceptions.BackupFailed(f"The copy is corrupted : {'; '.join(problems[:5])}")
+
+
+def backup(
+    destination: Path,
+    compress: bool = False,
+    verify: bool = True,
+    progress: Opt[Progress] = None,
+) -> BackupReport:
+    """Copy the bound database to ``destination``, gzipped if ``compress``.
+
+    With ``verify``, the copy is checked with ``integrity_check`` before being
+    moved to the destination.
+    """
+    start = time.perf_counter()
+    partial = destination.with_name(destination.name + ".partial")
+    total_pages = 0
+
+    def report_progress(_, remaining: int, total: int) -> None:
+        nonlocal total_pages
+        total_pages = total
+        if progress is not None:
+            progress(total - remaining, total)
+
+    try:
+        target = sqlite3.connect(str(partial))
+        try:
+            with _open_source() as (source, pages_per_step):
+                source.backup(target, pages=pages_per_step, progress=report_progress, sleep=BACKUP_STEP_PAUSE)
+        finally:
+            target.close()
+        if verify:
+            check_integrity(partial)
+        if compress:
+            compressed = partial.with_name(partial.name + ".gz")
+            with partial.open("rb") as raw, gzip.open(compressed, "wb") as packed:
+                shutil.copyfileobj(raw, packed)
+            partial.unlink()
+            partial = compressed
+        os.replace(partial, destination)
+    except sqlite3.Error as err:
+        raise exceptions.BackupFailed(str(err)) from err
+    finally:
+        if partial.exists():
+            partial.unlink()
+
+    report = BackupReport(
+        destination=destination,
+        pages=total_pages,
+        size=destination.stat().st_size,
+        duration=time.perf_counter() - start,
+        compressed=compress,
+        verified=verify,
+    )
+    logger.info("Backed up %s pages to %s in %.1f s", report.pages, destination, report.duration)
+    return report
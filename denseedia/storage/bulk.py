@@ -0,0 +1,146 @@
+"""Modify or delete all the edia or links matching a filter, in a few statements.
+
+Each function runs a handful of set-based statements, whatever the number of
+matching rows. The changes and tombstones are recorded for every affected
+row, like with the single-object operations. The functions are meant to be
+used inside a ``db_session`` : everything happens in its transaction.
+
+With ``dry_run``, they only count the matching rows.
+"""
+
+from typing import Any, Dict, Optional as Opt, Tuple
+
+from . import deletions, links
+from .. import exceptions, helpers, models
+from .rows import datetime_to_timestamp
+from .tables import database
+
+
+def _edium_condition(kind: Opt[str], title_contains: Opt[str]) -> Tuple[str, Dict[str, Any]]:
+    """Return the SQL condition on the "Edium" table, and its parameters."""
+    conditions = []
+    params: Dict[str, Any] = {}
+    if kind is not None:
+        conditions.append('"kind" = $kind')
+        params["kind"] = kind
+    if title_contains is not None:
+        # Case sensitive, like the search
+        conditions.append('instr("title", $title_contains) > 0')
+        params["title_contains"] = title_contains
+    if not conditions:
+        raise exceptions.MissingFilter("edium")
+    return " AND ".join(conditions), params
+
+
+def _link_condition(label: Opt[str]) -> Tuple[str, Dict[str, Any]]:
+    """Return the SQL condition on the "Link" table, and its parameters."""
+    if label is None:
+        raise exceptions.MissingFilter("link")
+    return '"label" = $label', {"label": label}
+
+
+def _count(table: str, where: str, params: Dict[str, Any]) -> int:
+    return database.select(f'SELECT COUNT(*) FROM "{table}" WHERE {where}', params)[0]
+
+
+def _record_changes(table: str, where: str, params: Dict[str, Any], operation: str) -> int:
+    """Record a change for each matching row, and return their count."""
+    return database.execute(
+        'INSERT INTO "Change" ("table", "object_id", "operation", "creation_date") '
+        f'SELECT $change_table, "id", $operation, $now FROM "{table}" WHERE {where} ORDER BY "id"',
+        {**params, "change_table": table.lower(), "operation": operation},
+    ).rowcount
+
+
+def modify_edia(
+    kind: Opt[str],
+    title_contains: Opt[str],
+    new_title: Opt[str],
+    new_kind: Opt[str],
+    dry_run: bool = False,
+) -> int:
+    """Set the title and/or the kind of the matching edia, and return their count."""
+    (where, params) = _edium_condition(kind, title_contains)
+    if new_title is None and new_kind is None:
+        raise exceptions.MissingModification("edium")
+    if dry_run:
+        return _count("Edium", where, params)
+    assignments = ['"updated_at" = $now']
+    if new_title is not None:
+        assignments.append('"title" = $new_title')
+    if new_kind is not None:
+        assignments.append('"kind" = $new_kind')
+    params = {**params, "now": datetime_to_timestamp(helpers.now()), "new_title": new_title, "new_kind": new_kind}
+    # Recorded first, as the new values may not match the filter anymore
+    _record_changes("Edium", where, params, models.ChangeOperation.MODIFY)
+    return database.execute(f'UPDATE "Edium" SET {", ".join(assignments)} WHERE {where}', params).rowcount
+
+
+def delete_edia(kind: Opt[str], title_contains: Opt[str], dry_run: bool = False) -> int:
+    """Delete the matching edia with their elements and links, and return their count."""
+    (where, params) = _edium_condition(kind, title_contains)
+    if dry_run:
+        return _count("Edium", where, params)
+    _record_changes("Edium", where, {**params, "now": datetime_to_timestamp(helpers.now())}, models.ChangeOperation.DELETE)
+    return deletions.delete_edia(where, params).counts["Edium"]
+
+
+def modify_links(label: Opt[str], new_label: Opt[str], dry_run: bool = False) -> int:
+    """Set the label of the matching links, and return their count."""
+    (where, params) = _link_condition(label)
+    if new_label is None:
+        raise exceptions.MissingModification("link")
+    if dry_run:
+        return _count("Link", where, params)
+    params = {**params, "now": datetime_to_timestamp(helpers.now()), "new_label": new_label}
+    if links.has_unique_index():
+        # The matching links are unique, but one may exist with the new label already
+        conflict = database.select(
+            'SELECT l."start", l."end" FROM "Link" l '
+            f'WHERE {where} AND EXISTS (SELECT 1 FROM "Link" k WHERE k."start" = l."start" '
+            'AND k."end" = l."end" AND k."directed" = l."directed" AND k."label" = $new_label) LIMIT 1',
+            params,
+        )
+        if conflict:
+            (start, end) = conflict[0]
+            raise exceptions.DuplicateLink(start, end, new_label)
+    _record_changes("Link", where, params, models.ChangeOperation.MODIFY)
+    return database.execute(
+        f'UPDATE "Link" SET "label" = $new_label, "updated_at" = $now WHERE {where}',
+        params,
+    ).rowcount
+
+
+def _delete_links(where: str, params: Dict[str, Any]) -> int:
+    params = {**params, "now": datetime_to_timestamp(helpers.now())}
+    _record_changes("Link", where, params, models.ChangeOperation.DELETE)
+    database.execute(
+        'INSERT INTO "Tombstone" ("table", "object_id", "deletion_date") '
+        f'SELECT \'link\', "id", $now FROM "Link" WHERE {where} ORDER BY "id"',
+        params,
+    )
+    return database.execute(f'DELETE FROM "Link" WHERE {where}', params).rowcount
+
+
+def delete_links(label: Opt[str], dry_run: bool = False) -> int:
+    """Delete the matching links, and return their count."""
+    (where, params) = _link_condition(label)
+    if dry_run:
+        return _count("Link", where, params)
+    return _delete_links(where, params)
+
+
+# The links with the same start, end, label and direction as an older one
+_DUPLICATE_LINKS = (
+    '"id" IN (SELECT "id" FROM ('
+    '  SELECT "id", ROW_NUMBER() OVER (PARTITION BY "start", "end", "label", "directed" ORDER BY "id") AS "rank" '
+    '  FROM "Link"'
+    ') WHERE "rank" > 1)'
+)
+
+
+def merge_duplicate_links(dry_run: bool = False) -> int:
+    """Delete the duplicates of the links, keeping the oldest, and return their count."""
+    if dry_run:
+        return _count("Link", _DUPLICATE_LINKS, {})
+    return _delete_links(_DUPLICATE_LINKS, {})
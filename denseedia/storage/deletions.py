@@ -0,0 +1,90 @@
+"""Delete the edia and the elements with set-based statements.
+
+Deleting an entity with Pony loads all its related objects first, then
+deletes them one row at a time. Here, a few ``DELETE ... WHERE`` statements
+remove the rows in dependency order (versions, elements, links, then the
+edium), after recording the same tombstones as the ``bury()`` methods. The
+functions are meant to be used inside a ``db_session`` : everything happens in
+its transaction.
+"""
+
+import time
+from typing import Dict, NamedTuple
+
+from .. import helpers
+from ..logger import logger
+from .rows import datetime_to_timestamp
+from .tables import database
+
+
+class DeletionReport(NamedTuple):
+    counts: Dict[str, int]  # Deleted rows, by table
+    duration: float  # In seconds
+
+    def __str__(self) -> str:
+        counts = ", ".join(f"{count} {table.lower()}(s)" for (table, count) in self.counts.items())
+        return f"{counts} in {self.duration * 1000:.1f} ms"
+
+
+def _execute(sql: str, params: Dict[str, object]) -> int:
+    """Run a statement and return the number of rows it changed."""
+    return database.execute(sql, params).rowcount
+
+
+def delete_edia(where: str, params: Dict[str, object]) -> DeletionReport:
+    """Delete the edia matching a condition, with their elements, versions and links.
+
+    The condition applies to the "Edium" table, and may use ``params``.
+    """
+    start = time.perf_counter()
+    params = {**params, "now": datetime_to_timestamp(helpers.now())}
+    edia = f'SELECT "id" FROM "Edium" WHERE {where}'
+    _execute(
+        'INSERT INTO "Tombstone" ("table", "object_id", "deletion_date") '
+        f'SELECT \'element\', "id", $now FROM "Element" WHERE "edium" IN ({edia}) ORDER BY "id"',
+        params,
+    )
+    _execute(
+        'INSERT INTO "Tombstone" ("table", "object_id", "deletion_date") '
+        f'SELECT \'link\', "id", $now FROM "Link" WHERE "start" IN ({edia}) OR "end" IN ({edia}) ORDER BY "id"',
+        params,
+    )
+    _execute(
+        'INSERT INTO "Tombstone" ("table", "object_id", "deletion_date") '
+        f'SELECT \'edium\', "id", $now FROM "Edium" WHERE {where} ORDER BY "id"',
+        params,
+    )
+    counts = {
+        "Version": _execute(
+            f'DELETE FROM "Version" WHERE "element" IN (SELECT "id" FROM "Element" WHERE "edium" IN ({edia}))',
+            params,
+        ),
+        "Element": _execute(f'DELETE FROM "Element" WHERE "edium" IN ({edia})', params),
+        "Link": _execute(f'DELETE FROM "Link" WHERE "start" IN ({edia}) OR "end" IN ({edia})', params),
+        "Edium": _execute(f'DELETE FROM "Edium" WHERE {where}', params),
+    }
+    return DeletionReport(counts, time.perf_counter() - start)
+
+
+def delete_edium(edium_id: int) -> DeletionReport:
+    """Delete an edium with its elements, their versions and its links."""
+    report = delete_edia('"id" = $edium_id', {"edium_id": edium_id})
+    logger.info("Deleted the edium %s : %s", edium_id, report)
+    return report
+
+
+def delete_element(element_id: int) -> DeletionReport:
+    """Delete an element with its versions."""
+    start = time.perf_counter()
+    params = {"element_id": element_id, "now": datetime_to_timestamp(helpers.now())}
+    _execute(
+        'INSERT INTO "Tombstone" ("table", "object_id", "deletion_date") VALUES (\'element\', $element_id, $now)',
+        params,
+    )
+    counts = {
+        "Version": _execute('DELETE FROM "Version" WHERE "element" = $element_id', params),
+        "Element": _execute('DELETE FROM "Element" WHERE "id" = $element_id', params),
+    }
+    report = DeletionReport(counts, time.perf_counter() - start)
+    logger.info("Deleted the element %s : %s", element_id, report)
+    return report
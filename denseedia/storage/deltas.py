@@ -0,0 +1,91 @@
+"""Encode a string as the edits that rebuild it from another string.
+
+A delta is a list of edits : a ``[start, end]`` pair copies this slice of the
+base, and a string is inserted as is. The texts are compared line by line,
+then the common start and end of the replaced lines are copied too, so a typo
+fixed in a long paragraph costs a few bytes.
+"""
+
+import os
+from difflib import SequenceMatcher
+from typing import Any, List, Optional as Opt, Tuple, Union
+
+Edit = Union[List[int], str]
+Delta = List[Edit]
+
+
+def _size(delta: Delta) -> int:
+    """Return a rough size of the delta in JSON, to compare it to the value."""
+    return sum(len(edit) + 2 if isinstance(edit, str) else 12 for edit in delta)
+
+
+def _copy(delta: Delta, start: int, end: int) -> None:
+    if start == end:
+        return
+    if delta and isinstance(delta[-1], list) and delta[-1][1] == start:
+        delta[-1][1] = end
+    else:
+        delta.append([start, end])
+
+
+def _insert(delta: Delta, text: str) -> None:
+    if not text:
+        return
+    if delta and isinstance(delta[-1], str):
+        delta[-1] += text
+    else:
+        delta.append(text)
+
+
+def _replace(delta: Delta, base: str, start: int, end: int, text: str) -> None:
+    """Append the edits replacing ``base[start:end]`` with ``text``, copying their common start and end."""
+    old = base[start:end]
+    prefix = len(os.path.commonprefix([old, text]))
+    suffix = len(os.path.commonprefix([old[prefix:][::-1], text[prefix:][::-1]]))
+    _copy(delta, start, start + prefix)
+    _insert(delta, text[prefix:len(text) - suffix])
+    _copy(delta, end - suffix, end)
+
+
+def encode(value: str, base: str) -> Opt[Delta]:
+    """Return the delta rebuilding ``value`` from ``base``, or None if it's not smaller than the value."""
+    (a, b) = (base.splitlines(keepends=True), value.splitlines(keepends=True))
+    starts = [0]
+    for line in a:
+        starts.append(starts[-1] + len(line))
+    delta: Delta = []
+    for (tag, i1, i2, j1, j2) in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == "equal":
+            _copy(delta, starts[i1], starts[i2])
+        else:
+            _replace(delta, base, starts[i1], starts[i2], "".join(b[j1:j2]))
+    # A copy shorter than its pair of offsets is cheaper inserted
+    compact: Delta = []
+    for edit in delta:
+        if isinstance(edit, list) and edit[1] - edit[0] < 8:
+            _insert(compact, base[edit[0]:edit[1]])
+        elif isinstance(edit, list):
+            compact.append(edit)
+        else:
+            _insert(compact, edit)
+    if _size(compact) >= len(value):
+        return None
+    return compact
+
+
+def apply(delta: Delta, base: str) -> str:
+    """Rebuild the value encoded by ``delta`` from ``base``."""
+    return "".join(base[edit[0]:edit[1]] if isinstance(edit, list) else edit for edit in delta)
+
+
+def rebuild(history: List[Tuple[Any, bool]]) -> List[Any]:
+    """Return the values of a whole history, from its stored values and delta flags, ordered by id.
+
+    A delta is rebuilt from the value of the next version, so the history is
+    walked from the newest version, which is never a delta.
+    """
+    values: List[Any] = [None] * len(history)
+    for index in range(len(history) - 1, -1, -1):
+        (stored, is_delta) = history[index]
+        values[index] = apply(stored, values[index + 1]) if is_delta else stored
+    return values
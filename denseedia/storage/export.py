@@ -0,0 +1,237 @@
+"""Export the graph of the edia and the links to files for other tools.
+
+The formats are DOT (Graphviz), GraphML and a tab-separated edge list. The
+nodes then the edges are read from cursors, a chunk of rows at a time, and
+each chunk is formatted and yielded at once : the output starts right away
+and the memory stays bounded, whatever the size of the graph.
+
+The export has its own read-only connection, in a single read transaction,
+so it sees one state of the database and can be consumed from any thread.
+"""
+
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional as Opt, Protocol, Tuple, Type, runtime_checkable
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from .. import exceptions, models
+from ..constants import EXPORT_CHUNK_ROWS
+from .tables import database
+
+NodeRow = Tuple[int, str, Opt[str]]  # id, title, kind
+EdgeRow = Tuple[int, int, int, int, Opt[str]]  # id, start, end, directed, label
+
+
+class Formatter(Protocol):
+    """Format the parts of an export : the header, the edges and the footer."""
+    media_type: str
+    extension: str
+
+    def header(self) -> str:
+        ...
+
+    def edge(self, row: EdgeRow) -> str:
+        ...
+
+    def footer(self) -> str:
+        ...
+
+
+@runtime_checkable
+class NodeFormatter(Formatter, Protocol):
+    """Format the nodes too, between the header and the edges."""
+
+    def node(self, row: NodeRow) -> str:
+        ...
+
+
+def _dot_string(value: str) -> str:
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'"{escaped}"'
+
+
+class DotFormatter:
+    """Format the graph for Graphviz. The undirected links have no arrow."""
+    media_type = "text/vnd.graphviz"
+    extension = "dot"
+
+    def header(self) -> str:
+        return "digraph denseedia {\n"
+
+    def node(self, row: NodeRow) -> str:
+        (id_, title, kind) = row
+        kind_attribute = f", kind={_dot_string(kind)}" if kind else ""
+        return f"  {id_} [label={_dot_string(title)}{kind_attribute}];\n"
+
+    def edge(self, row: EdgeRow) -> str:
+        (_, start, end, directed, label) = row
+        attributes = [] if directed else ["dir=none"]
+        if label:
+            attributes.append(f"label={_dot_string(label)}")
+        return f"  {start} -> {end}{' [' + ', '.join(attributes) + ']' if attributes else ''};\n"
+
+    def footer(self) -> str:
+        return "}\n"
+
+
+class GraphMLFormatter:
+    """Format the graph as GraphML, with the title, the kind and the label as data."""
+    media_type = "application/graphml+xml"
+    extension = "graphml"
+
+    def header(self) -> str:
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+            '  <key id="title" for="node" attr.name="title" attr.type="string"/>\n'
+            '  <key id="kind" for="node" attr.name="kind" attr.type="string"/>\n'
+            '  <key id="label" for="edge" attr.name="label" attr.type="string"/>\n'
+            '  <graph id="denseedia" edgedefault="directed">\n'
+        )
+
+    def node(self, row: NodeRow) -> str:
+        (id_, title, kind) = row
+        kind_data = f'<data key="kind">{escape(kind)}</data>' if kind else ""
+        return f'    <node id="n{id_}"><data key="title">{escape(title)}</data>{kind_data}</node>\n'
+
+    def edge(self, row: EdgeRow) -> str:
+        (id_, start, end, directed, label) = row
+        label_data = f'<data key="label">{escape(label)}</data>' if label else ""
+        return (
+            f'    <edge id="e{id_}" source="n{start}" target="n{end}" '
+            f'directed="{"true" if directed else "false"}">{label_data}</edge>\n'
+        )
+
+    def footer(self) -> str:
+        return "  </graph>\n</graphml>\n"
+
+
+class EdgeListFormatter:
+    """Format the links as tab-separated lines : start, end, directed (0 or 1) and label.
+
+    The edia aren't listed, so the ones without links are left out.
+    """
+    media_type = "text/tab-separated-values"
+    extension = "tsv"
+
+    def header(self) -> str:
+        return "# start\tend\tdirected\tlabel\n"
+
+    def edge(self, row: EdgeRow) -> str:
+        (_, start, end, directed, label) = row
+        clean_label = " ".join((label or "").split())
+        return f"{start}\t{end}\t{int(directed)}\t{clean_label}\n"
+
+    def footer(self) -> str:
+        return ""
+
+
+FORMATTERS: Dict[str, Type[Formatter]] = {
+    models.GraphFormat.DOT: DotFormatter,
+    models.GraphFormat.GRAPHML: GraphMLFormatter,
+    models.GraphFormat.EDGELIST: EdgeListFormatter,
+}
+
+
+def _connect() -> sqlite3.Connection:
+    """Open a read-only connection to the bound database, in a read transaction."""
+    location = database.provider.pool.filename
+    if not location.startswith("file:"):
+        location = f"file:{quote(location)}?mode=ro"
+    connection = sqlite3.connect(location, uri=True, isolation_level=None, check_same_thread=False)
+    # The in-memory database has a shared cache, its locks would fail at once
+    connection.execute("PRAGMA read_uncommitted = true")
+    connection.execute("BEGIN")
+    return connection
+
+
+def _select_neighborhood(connection: sqlite3.Connection, center: int, depth: int, label: Opt[str]) -> None:
+    """Fill a temporary table with the edia up to ``depth`` links away from ``center``.
+
+    The links are followed in both directions.
+    """
+    if connection.execute('SELECT 1 FROM "Edium" WHERE "id" = ?', (center,)).fetchone() is None:
+        raise exceptions.ObjectNotFound("edium", center)
+    connection.execute("CREATE TEMP TABLE export_nodes (id INTEGER PRIMARY KEY)")
+    connection.execute(
+        "INSERT OR IGNORE INTO temp.export_nodes "
+        "WITH RECURSIVE reached(id, distance) AS ("
+        "  SELECT :center, 0 "
+        "  UNION "
+        '  SELECT CASE WHEN l."start" = r.id THEN l."end" ELSE l."start" END, r.distance + 1 '
+        '  FROM reached r JOIN "Link" l ON l."start" = r.id OR l."end" = r.id '
+        '  WHERE r.distance < :depth AND (:label IS NULL OR l."label" = :label)'
+        ") SELECT id FROM reached",
+        {"center": center, "depth": depth, "label": label},
+    )
+
+
+def _rows(connection: sqlite3.Connection, sql: str, params: Dict[str, Any]) -> Iterator[List[Any]]:
+    cursor = connection.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+        if not rows:
+            return
+        yield rows
+
+
+def _stream(
+    connection: sqlite3.Connection,
+    formatter: Formatter,
+    nodes_sql: str,
+    edges_sql: str,
+    params: Dict[str, Any],
+) -> Iterator[str]:
+    """Yield the chunks of the export, then close the connection."""
+    try:
+        yield formatter.header()
+        if isinstance(formatter, NodeFormatter):
+            for rows in _rows(connection, nodes_sql, params):
+                yield "".join(formatter.node(row) for row in rows)
+        for rows in _rows(connection, edges_sql, params):
+            yield "".join(formatter.edge(row) for row in rows)
+        yield formatter.footer()
+    finally:
+        connection.close()
+
+
+def export_graph(
+    graph_format: models.GraphFormat.asType,
+    kind: Opt[str] = None,
+    label: Opt[str] = None,
+    center: Opt[int] = None,
+    depth: int = 1,
+) -> Iterator[str]:
+    """Return an iterator on the chunks of the exported graph.
+
+    The graph may be restricted to the edia of a kind, to the links with a
+    label, and to the edia up to ``depth`` links away from the ``center``
+    edium. The links are kept when both their ends are. An ObjectNotFound is
+    raised at once if the center doesn't exist.
+    """
+    formatter = FORMATTERS[graph_format]()
+    params = {"kind": kind, "label": label}
+    node_conditions = []
+    if kind is not None:
+        node_conditions.append('"kind" = :kind')
+    connection = _connect()
+    try:
+        if center is not None:
+            _select_neighborhood(connection, center, depth, label)
+            node_conditions.append('"id" IN (SELECT id FROM temp.export_nodes)')
+    except BaseException:
+        connection.close()
+        raise
+    edge_conditions = ['"label" = :label'] if label is not None else []
+    if node_conditions:
+        nodes = f'SELECT "id" FROM "Edium" WHERE {" AND ".join(node_conditions)}'
+        edge_conditions += [f'"start" IN ({nodes})', f'"end" IN ({nodes})']
+    nodes_sql = (
+        'SELECT "id", "title", "kind" FROM "Edium" '
+        f'WHERE {" AND ".join(node_conditions) or "1"} ORDER BY "id"'
+    )
+    edges_sql = (
+        'SELECT "id", "start", "end", "directed", "label" FROM "Link" '
+        f'WHERE {" AND ".join(edge_conditions) or "1"} ORDER BY "id"'
+    )
+    return _stream(connection, formatter, nodes_sql, edges_sql, params)
@@ -0,0 +1,177 @@
+"""Query other DenseEdia files next to the bound one, read-only.
+
+Each attached file has a namespace, and its ids are prefixed with it, like
+``team:42``. The ids of the bound database have no prefix. Every file is read
+on its own connection, and the files are queried in parallel : SQLite runs
+the queries without holding the GIL. The results of the files are merged in a
+single order, so the pagination is the same as with a single file.
+"""
+
+import heapq
+import itertools
+import json
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional as Opt, Tuple, TypeVar
+from urllib.parse import quote
+
+from . import snapshots
+from .. import exceptions
+from .rows import timestamp_to_iso
+from .tables import database
+
+T = TypeVar("T")
+
+PRIMARY = ""
+_NAMESPACE_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_-]*$")
+_EDIUM_COLUMNS = '"id", "title", "kind", "creation_date", "updated_at"'
+
+_attached: Dict[str, Path] = {}
+_executor = ThreadPoolExecutor(thread_name_prefix="federation")
+
+
+def attach(namespace: str, file_path: Path) -> None:
+    """Make a database file readable under a namespace."""
+    if not _NAMESPACE_PATTERN.match(namespace):
+        raise ValueError(f"Invalid namespace '{namespace}' : use letters, digits, '_' and '-'")
+    if not file_path.is_file():
+        raise FileNotFoundError(f"Database file not found : {file_path}")
+    _attached[namespace] = file_path
+
+
+def attached() -> Dict[str, Path]:
+    """Return the attached files, by namespace."""
+    return dict(_attached)
+
+
+def namespaced_id(namespace: str, object_id: int) -> str:
+    return f"{namespace}:{object_id}" if namespace else str(object_id)
+
+
+def parse_id(value: str) -> Tuple[str, int]:
+    """Split a namespaced id, like ``team:42``, into its namespace and its id."""
+    (namespace, _, raw_id) = value.rpartition(":")
+    if not raw_id.isdigit() or (namespace and namespace not in _attached):
+        raise exceptions.ObjectNotFound("edium", value)
+    return namespace, int(raw_id)
+
+
+def _locations() -> Dict[str, str]:
+    """Return the SQLite URI of each file, the bound database first."""
+    primary = database.provider.pool.filename
+    if not primary.startswith("file:"):
+        primary = f"file:{quote(primary)}?mode=ro"
+    locations = {PRIMARY: primary}
+    for (namespace, file_path) in _attached.items():
+        locations[namespace] = f"file:{quote(str(file_path))}?mode=ro"
+    return locations
+
+
+def _run(location: str, query: Callable[[sqlite3.Connection], T]) -> T:
+    # The in-memory database has a shared cache, its locks would fail at once :
+    # wait for the current write, like its sessions do
+    in_memory = snapshots.snapshotter is not None and location == database.provider.pool.filename
+    if in_memory:
+        database.provider.acquire_lock()
+    connection = sqlite3.connect(location, uri=True)
+    try:
+        return query(connection)
+    finally:
+        connection.close()
+        if in_memory:
+            database.provider.release_lock()
+
+
+def _run_everywhere(query: Callable[[str, sqlite3.Connection], T]) -> Dict[str, T]:
+    """Run a query on every file in parallel, and return the results by namespace."""
+    futures = {
+        namespace: _executor.submit(_run, location, lambda connection, ns=namespace: query(ns, connection))
+        for (namespace, location) in _locations().items()
+    }
+    return {namespace: future.result() for (namespace, future) in futures.items()}
+
+
+def _edium_dict(namespace: str, row: Tuple[Any, ...]) -> Dict[str, Any]:
+    (id_, title, kind, creation_date, updated_at) = row
+    return {
+        "id": namespaced_id(namespace, id_),
+        "title": title,
+        "kind": kind,
+        "creation_date": timestamp_to_iso(creation_date),
+        "updated_at": timestamp_to_iso(updated_at),
+    }
+
+
+def search_edia(
+    in_title: Opt[str] = None,
+    kind: Opt[str] = None,
+    limit: int = 100,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
+    """Return a page of the edia of every file, oldest first.
+
+    The edia may be filtered by kind, and by a part of their title (case
+    sensitive, like the search of a single file).
+    """
+    conditions = ["1"]
+    params: Dict[str, Any] = {"count": offset + limit}
+    if in_title is not None:
+        conditions.append('instr("title", :in_title) > 0')
+        params["in_title"] = in_title
+    if kind is not None:
+        conditions.append('"kind" = :kind')
+        params["kind"] = kind
+    # Each file returns its first rows, enough to fill the page alone
+    sql = (
+        f'SELECT {_EDIUM_COLUMNS} FROM "Edium" WHERE {" AND ".join(conditions)} '
+        'ORDER BY "creation_date", "id" LIMIT :count'
+    )
+
+    def query(namespace: str, connection: sqlite3.Connection) -> List[Tuple[Any, ...]]:
+        return [(row[3], namespace, row[0], row) for row in connection.execute(sql, params)]
+
+    # Sorted like the SQL, with the namespace to break the ties between files
+    merged: Iterable[Tuple[Any, ...]] = heapq.merge(*_run_everywhere(query).values())
+    return [_edium_dict(namespace, row) for (_, namespace, _, row) in itertools.islice(merged, offset, offset + limit)]
+
+
+def neighbors(edium_id: str, depth: int = 1) -> List[Dict[str, Any]]:
+    """Return the edia linked to an edium, up to ``depth`` links away.
+
+    The links are followed in both directions, inside the file of the edium.
+    Each edium comes with its ``distance``, the closest first.
+    """
+    (namespace, start) = parse_id(edium_id)
+
+    def query(connection: sqlite3.Connection) -> List[Dict[str, Any]]:
+        if connection.execute('SELECT 1 FROM "Edium" WHERE "id" = ?', (start,)).fetchone() is None:
+            raise exceptions.ObjectNotFound("edium", edium_id)
+        distances = {start: 0}
+        frontier = [start]
+        for distance in range(1, depth + 1):
+            if not frontier:
+                break
+            ids = json.dumps(frontier)
+            cursor = connection.execute(
+                'SELECT "start", "end" FROM "Link" '
+                'WHERE "start" IN (SELECT value FROM json_each(:ids)) '
+                'OR "end" IN (SELECT value FROM json_each(:ids))',
+                {"ids": ids},
+            )
+            frontier = []
+            for pair in cursor:
+                for other in pair:
+                    if other not in distances:
+                        distances[other] = distance
+                        frontier.append(other)
+        del distances[start]
+        cursor = connection.execute(
+            f'SELECT {_EDIUM_COLUMNS} FROM "Edium" WHERE "id" IN (SELECT value FROM json_each(:ids))',
+            {"ids": json.dumps(list(distances))},
+        )
+        found = sorted((distances[row[0]], row[0], row) for row in cursor)
+        return [{**_edium_dict(namespace, row), "distance": distance} for (distance, _, row) in found]
+
+    return _run(_locations()[namespace], query)
@@ -0,0 +1,371 @@
+"""Search the edia with a small filter language, compiled to one SQL query.
+
+A query combines predicates with ``and`` (or nothing), ``or``, ``not`` and
+parentheses::
+
+    kind = game and (rating >= 8 or has favorite) and created >= 2021-01-01
+    title ~ zelda linked to 5 label sequel
+
+The predicates are :
+
+- ``title ~ text`` (contains, case sensitive like the search), ``title = text``,
+  ``kind = game``, with ``!=`` for the opposite;
+- ``created`` and ``updated`` compared with ``<``, ``<=``, ``>``, ``>=`` to an
+  ISO date, like ``2021-01-01`` or ``2021-01-01T12:00`` (a day is midnight);
+- ``has rating`` : the edium has an element with this name;
+- ``rating >= 8`` : the last value of an element is comparable and matches.
+  Numbers match the int and float values, texts the str and datetime values
+  (``~`` also works), ``true`` and ``false`` the bool values. A name that is
+  a keyword or has spaces can be quoted, like ``"year of release" > 1990``;
+- ``linked 5`` : the edium has a link with the edium 5, ``linked to 5`` and
+  ``linked from 5`` in one direction only (the undirected links count both
+  ways), with ``label origin`` to only follow the links with this label.
+
+A query is parsed once into a tree of tuples, then compiled to a single
+parameterized WHERE clause on ``"Edium" ed``, where the element and link
+conditions are indexed subqueries.
+"""
+
+import functools
+import re
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional as Opt, Tuple, Union
+
+from . import names
+from .rows import datetime_to_timestamp, edia_from_cursor, EDIUM_COLUMNS
+from .tables import database
+from .. import exceptions, models
+
+_TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+        |(?P<date>\d{4}-\d{2}-\d{2}(?:T\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?)(?![\w-])
+        |(?P<number>-?\d+(?:\.\d+)?)(?![\w.-])
+        |(?P<operator>>=|<=|!=|=|<|>|~)
+        |(?P<paren>[()])
+        |(?P<word>[^\s()"'=<>!~]+)
+    )""",
+    re.VERBOSE,
+)
+_KEYWORDS = {"and", "or", "not", "has", "linked", "to", "from", "label", "true", "false"}
+_FIELDS = {"title", "kind", "created", "updated"}
+_DATE_OPERATORS = {"<", "<=", ">", ">="}
+_COLUMNS = {"title": '"title"', "kind": '"kind"', "created": '"creation_date"', "updated": '"updated_at"'}
+_ORDERS = {"id": '"id"', "title": '"title"', "kind": '"kind"', "created": '"creation_date"', "updated": '"updated_at"'}
+_SQL_OPERATORS = {"=": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+# The string value of a version, decompressed if it's packed ($ is doubled for Pony)
+_STRING_VALUE = "json_extract(COALESCE(unpack_json(v.\"packed\"), v.\"json\"), '$$')"
+
+
+class Token(NamedTuple):
+    kind: str  # string, date, number, operator, paren, word or end
+    text: str
+    position: int
+
+
+class Field(NamedTuple):
+    field: str
+    operator: str
+    value: Union[str, datetime]
+
+
+class ElementValue(NamedTuple):
+    name: str
+    operator: str
+    value: Union[str, int, float, bool]
+
+
+class HasElement(NamedTuple):
+    name: str
+
+
+class Linked(NamedTuple):
+    edium_id: int
+    direction: Opt[str]  # None, "to" or "from"
+    label: Opt[str]
+
+
+class Not(NamedTuple):
+    item: "Node"
+
+
+class And(NamedTuple):
+    items: Tuple["Node", ...]
+
+
+class Or(NamedTuple):
+    items: Tuple["Node", ...]
+
+
+Node = Union[Field, ElementValue, HasElement, Linked, Not, And, Or]
+
+
+def _unquote(text: str) -> str:
+    return re.sub(r"\\(.)", r"\1", text[1:-1])
+
+
+def tokenize(text: str) -> List[Token]:
+    tokens = []
+    position = 0
+    while True:
+        match = _TOKEN.match(text, position)
+        if match is None or match.lastgroup is None:
+            if text[position:].strip():
+                raise exceptions.InvalidQuery("Unexpected character", len(text) - len(text[position:].lstrip()))
+            tokens.append(Token("end", "", len(text)))
+            return tokens
+        tokens.append(Token(match.lastgroup, match.group(match.lastgroup), match.start(match.lastgroup)))
+        position = match.end()
+
+
+class _Parser:
+    """A recursive descent parser, one method per level of precedence."""
+
+    def __init__(self, text: str):
+        self.tokens = tokenize(text)
+        self.index = 0
+
+    @property
+    def current(self) -> Token:
+        return self.tokens[self.index]
+
+    def advance(self) -> Token:
+        token = self.current
+        self.index += 1
+        return token
+
+    def is_keyword(self, *words: str) -> bool:
+        return self.current.kind == "word" and self.current.text.lower() in words
+
+    def fail(self, reason: str) -> exceptions.InvalidQuery:
+        found = f"'{self.current.text}'" if self.current.kind != "end" else "the end"
+        return exceptions.InvalidQuery(f"{reason}, found {found}", self.current.position)
+
+    def parse(self) -> Node:
+        node = self.expression()
+        if self.current.kind != "end":
+            raise self.fail("Expected 'and', 'or' or the end of the query")
+        return node
+
+    def expression(self) -> Node:
+        items = [self.term()]
+        while self.is_keyword("or"):
+            self.advance()
+            items.append(self.term())
+        return items[0] if len(items) == 1 else Or(tuple(items))
+
+    def term(self) -> Node:
+        items = [self.factor()]
+        while self.current.kind != "end" and self.current.text != ")" and not self.is_keyword("or"):
+            if self.is_keyword("and"):
+                self.advance()
+            items.append(self.factor())
+        return items[0] if len(items) == 1 else And(tuple(items))
+
+    def factor(self) -> Node:
+        if self.is_keyword("not"):
+            self.advance()
+            return Not(self.factor())
+        if self.current.text == "(" and self.current.kind == "paren":
+            self.advance()
+            node = self.expression()
+            if self.current.text != ")":
+                raise self.fail("Expected ')'")
+            self.advance()
+            return node
+        if self.is_keyword("has"):
+            self.advance()
+            return HasElement(self.name())
+        if self.is_keyword("linked"):
+            self.advance()
+            return self.linked()
+        if self.current.kind == "word" and self.current.text.lower() in _FIELDS:
+            return self.field(self.advance().text.lower())
+        name = self.name()
+        operator = self.operator()
+        return ElementValue(name, operator, self.element_value(operator))
+
+    def name(self) -> str:
+        if self.current.kind == "string":
+            return _unquote(self.advance().text)
+        if self.current.kind == "word" and self.current.text.lower() not in _KEYWORDS:
+            return self.advance().text
+        raise self.fail("Expected a predicate or an element name")
+
+    def operator(self) -> str:
+        if self.current.kind != "operator":
+            raise self.fail("Expected an operator")
+        return self.advance().text
+
+    def text_value(self) -> str:
+        token = self.advance()
+        if token.kind == "string":
+            return _unquote(token.text)
+        if token.kind in ("word", "number", "date"):
+            return token.text
+        self.index -= 1
+        raise self.fail("Expected a value")
+
+    def field(self, field: str) -> Field:
+        operator_token = self.current
+        operator = self.operator()
+        if field in ("created", "updated"):
+            if operator not in _DATE_OPERATORS:
+                raise exceptions.InvalidQuery("The dates are compared with <, <=, > or >=", operator_token.position)
+            token = self.current
+            try:
+                return Field(field, operator, datetime.fromisoformat(self.text_value()))
+            except ValueError:
+                raise exceptions.InvalidQuery("Expected an ISO date", token.position)
+        allowed = ("=", "!=", "~") if field == "title" else ("=", "!=")
+        if operator not in allowed:
+            raise exceptions.InvalidQuery(f"The {field} is compared with {', '.join(allowed)}", operator_token.position)
+        return Field(field, operator, self.text_value())
+
+    def element_value(self, operator: str) -> Union[str, int, float, bool]:
+        if operator == "~":
+            return self.text_value()
+        token = self.current
+        if token.kind == "number":
+            self.advance()
+            return float(token.text) if "." in token.text else int(token.text)
+        if self.is_keyword("true", "false"):
+            if operator not in ("=", "!="):
+                raise self.fail("The booleans are compared with = or !=")
+            return self.advance().text.lower() == "true"
+        return self.text_value()
+
+    def linked(self) -> Linked:
+        direction = None
+        if self.is_keyword("to", "from"):
+            direction = self.advance().text.lower()
+        if self.current.kind != "number" or not self.current.text.isdigit():
+            raise self.fail("Expected an edium id")
+        edium_id = int(self.advance().text)
+        label = None
+        if self.is_keyword("label"):
+            self.advance()
+            label = self.text_value()
+        return Linked(edium_id, direction, label)
+
+
+@functools.lru_cache(maxsize=256)
+def parse(text: str) -> Node:
+    """Parse a query into a tree, or raise an InvalidQuery."""
+    return _Parser(text).parse()
+
+
+class _Compiler:
+    """Compile a tree to a WHERE clause on ``"Edium" ed``, with numbered parameters."""
+
+    def __init__(self) -> None:
+        self.params: Dict[str, Any] = {}
+
+    def param(self, value: Any) -> str:
+        name = f"p{len(self.params)}"
+        self.params[name] = value
+        return f"${name}"
+
+    def compile(self, node: Node) -> str:
+        if isinstance(node, And):
+            return "(" + " AND ".join(self.compile(item) for item in node.items) + ")"
+        if isinstance(node, Or):
+            return "(" + " OR ".join(self.compile(item) for item in node.items) + ")"
+        if isinstance(node, Not):
+            return f"NOT {self.compile(node.item)}"
+        if isinstance(node, Field):
+            return self.field(node)
+        if isinstance(node, HasElement):
+            return (
+                'EXISTS (SELECT 1 FROM "Element" el '
+                f'WHERE el."edium" = ed."id" AND el."name_ref" = {self.name(node.name)})'
+            )
+        if isinstance(node, ElementValue):
+            return self.element_value(node)
+        if isinstance(node, Linked):
+            return self.linked(node)
+        raise TypeError(f"Unknown node : {node!r}")
+
+    def name(self, name: str) -> str:
+        # An unknown name is NULL, and matches nothing
+        return self.param(names.lookup(name))
+
+    def field(self, node: Field) -> str:
+        column = f"ed.{_COLUMNS[node.field]}"
+        if isinstance(node.value, datetime):
+            return f"{column} {node.operator} {self.param(datetime_to_timestamp(node.value))}"
+        if node.operator == "~":
+            return f"instr({column}, {self.param(node.value)}) > 0"
+        return f"{column} {_SQL_OPERATORS[node.operator]} {self.param(node.value)}"
+
+    def element_value(self, node: ElementValue) -> str:
+        value = node.value
+        types: Tuple[str, ...]
+        if isinstance(value, bool):
+            types = (models.ValueType.BOOL,)
+            condition = f'v."json" {node.operator} {self.param("true" if value else "false")}'
+        elif isinstance(value, (int, float)):
+            types = (models.ValueType.INT, models.ValueType.FLOAT)
+            condition = f'v."json" {_SQL_OPERATORS[node.operator]} {self.param(value)}'
+        elif node.operator == "~":
+            types = (models.ValueType.STR, models.ValueType.DATETIME)
+            condition = f"instr({_STRING_VALUE}, {self.param(value)}) > 0"
+        else:
+            types = (models.ValueType.STR, models.ValueType.DATETIME)
+            condition = f"{_STRING_VALUE} {_SQL_OPERATORS[node.operator]} {self.param(value)}"
+        type_ids = ", ".join(str(models.ValueType.to_id(value_type)) for value_type in types)
+        return (
+            'EXISTS (SELECT 1 FROM "Element" el JOIN "Version" v ON v."element" = el."id" AND v."last" = 1 '
+            f'WHERE el."edium" = ed."id" AND el."name_ref" = {self.name(node.name)} '
+            f'AND v."value_type" IN ({type_ids}) AND {condition})'
+        )
+
+    def linked(self, node: Linked) -> str:
+        other = self.param(node.edium_id)
+        label = f' AND "label" = {self.param(node.label)}' if node.label is not None else ""
+        # The links are found from the other edium, with the indexes on start and end
+        incoming = f'SELECT "start" FROM "Link" WHERE "end" = {other}{label}'
+        outgoing = f'SELECT "end" FROM "Link" WHERE "start" = {other}{label}'
+        if node.direction == "to":
+            outgoing += ' AND NOT "directed"'
+        elif node.direction == "from":
+            incoming += ' AND NOT "directed"'
+        return f'ed."id" IN ({incoming} UNION ALL {outgoing})'
+
+
+class CompiledQuery(NamedTuple):
+    sql: str  # In the Pony syntax : $name for the parameters, $$ for a dollar
+    params: Dict[str, Any]
+
+
+def compile_query(text: str, order: models.EdiumOrder.asType, limit: int, offset: int) -> CompiledQuery:
+    """Parse and compile a query to a page of edia. An unknown name matches nothing."""
+    compiler = _Compiler()
+    where = compiler.compile(parse(text))
+    direction = "DESC" if order.startswith("-") else "ASC"
+    field = order.lstrip("-")
+    # The id breaks the ties, so the pages don't overlap
+    order_by = f'ed."id" {direction}' if field == "id" else f'ed.{_ORDERS[field]} {direction}, ed."id" {direction}'
+    sql = (
+        f'SELECT {EDIUM_COLUMNS} FROM "Edium" ed WHERE {where} '
+        f"ORDER BY {order_by} LIMIT {compiler.param(limit)} OFFSET {compiler.param(offset)}"
+    )
+    return CompiledQuery(sql, compiler.params)
+
+
+def search(text: str, order: models.EdiumOrder.asType = "id", limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+    """Return a page of the edia matching a query, with the fields of an EdiumModel."""
+    compiled = compile_query(text, order, limit, offset)
+    # Pony adds the builtins to the parameters it's given
+    return edia_from_cursor(database.execute(compiled.sql, dict(compiled.params)))
+
+
+def explain(text: str, order: models.EdiumOrder.asType = "id", limit: int = 100, offset: int = 0) -> models.QueryPlanModel:
+    """Return the SQL of a query and the plan of SQLite, to see which indexes it uses."""
+    compiled = compile_query(text, order, limit, offset)
+    depths = {0: -1}
+    plan = []
+    for (node_id, parent, _, detail) in database.execute(f"EXPLAIN QUERY PLAN {compiled.sql}", dict(compiled.params)):
+        depths[node_id] = depths.get(parent, -1) + 1
+        plan.append("  " * depths[node_id] + detail)
+    return models.QueryPlanModel(sql=compiled.sql, params=compiled.params, plan=plan)
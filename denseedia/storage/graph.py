@@ -0,0 +1,183 @@
+"""Analyse the graph of the links with NumPy arrays.
+
+The links are loaded once as arrays of node positions, then the connected
+components, the degrees, the PageRank and the orphans are computed on them
+without Python loops over the links. An undirected link counts as a link in
+each direction.
+
+The analyses are cached by filter, and dropped when the change feed shows a
+write to the edia or the links, whatever the process that made it. The
+functions of this module are meant to be used inside a ``db_session``.
+"""
+
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional as Opt, Tuple
+
+import numpy as np
+
+from . import invalidation
+from .tables import database
+
+PAGERANK_DAMPING = 0.85
+PAGERANK_TOLERANCE = 1e-10
+PAGERANK_MAX_ITERATIONS = 100
+
+
+class GraphArrays(NamedTuple):
+    """The edia and the links, with the links as positions in ``edium_ids``."""
+    edium_ids: np.ndarray  # int64, sorted
+    starts: np.ndarray  # int64, one per direction of each link
+    ends: np.ndarray  # int64
+    links: int
+
+
+class GraphAnalysis(NamedTuple):
+    """The measures of every edium, in the order of ``edium_ids``."""
+    edium_ids: np.ndarray  # int64
+    links: int
+    components: np.ndarray  # int64, the smallest edium id of the component
+    in_degrees: np.ndarray  # int64
+    out_degrees: np.ndarray  # int64
+    pagerank: np.ndarray  # float64, sums to 1
+
+    def ranking(self, values: np.ndarray, limit: int) -> List[Dict[str, Any]]:
+        """Return the edia with the highest values, and the lowest ids first for the ties."""
+        order = np.lexsort((self.edium_ids, -values))[:limit]
+        return [
+            {"edium_id": int(edium_id), "value": value}
+            for (edium_id, value) in zip(self.edium_ids[order].tolist(), values[order].tolist())
+        ]
+
+    def component_sizes(self, limit: int) -> List[Dict[str, int]]:
+        """Return the biggest components, each identified by its smallest edium id."""
+        (ids, sizes) = np.unique(self.components, return_counts=True)
+        order = np.lexsort((ids, -sizes))[:limit]
+        return [{"id": id_, "size": size} for (id_, size) in zip(ids[order].tolist(), sizes[order].tolist())]
+
+    def orphans(self) -> List[int]:
+        return self.edium_ids[(self.in_degrees == 0) & (self.out_degrees == 0)].tolist()
+
+    def to_dict(self, limit: int) -> Dict[str, Any]:
+        return {
+            "edia": len(self.edium_ids),
+            "links": self.links,
+            "component_count": len(np.unique(self.components)),
+            "components": self.component_sizes(limit),
+            "in_degree": self.ranking(self.in_degrees, limit),
+            "out_degree": self.ranking(self.out_degrees, limit),
+            "pagerank": self.ranking(self.pagerank, limit),
+            "orphans": self.orphans(),
+        }
+
+
+def load_arrays(label: Opt[str] = None, kind: Opt[str] = None) -> GraphArrays:
+    """Load the edia of a kind and the links between them with a label, all by default."""
+    params = {"label": label, "kind": kind}
+    edium_ids = np.array(
+        database.select('SELECT "id" FROM "Edium" WHERE $kind IS NULL OR "kind" = $kind ORDER BY "id"', params),
+        dtype=np.int64,
+    )
+    rows = database.execute(
+        'SELECT l."start", l."end", l."directed" FROM "Link" l '
+        'JOIN "Edium" s ON s."id" = l."start" JOIN "Edium" e ON e."id" = l."end" '
+        'WHERE ($label IS NULL OR l."label" = $label) '
+        'AND ($kind IS NULL OR (s."kind" = $kind AND e."kind" = $kind))',
+        params,
+    ).fetchall()
+    links = np.array(rows, dtype=np.int64).reshape(-1, 3)
+    starts = np.searchsorted(edium_ids, links[:, 0])
+    ends = np.searchsorted(edium_ids, links[:, 1])
+    undirected = links[:, 2] == 0
+    return GraphArrays(
+        edium_ids=edium_ids,
+        starts=np.concatenate((starts, ends[undirected])),
+        ends=np.concatenate((ends, starts[undirected])),
+        links=len(links),
+    )
+
+
+def connected_components(size: int, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Return the component of each node, as the smallest node of the component.
+
+    The direction of the links is ignored. Each round hooks the component of
+    every link end to the smaller one, then shortcuts the paths to the roots.
+    """
+    labels = np.arange(size, dtype=np.int64)
+    while True:
+        (first, second) = (labels[starts], labels[ends])
+        if np.array_equal(first, second):
+            return labels
+        lowest = np.minimum(first, second)
+        np.minimum.at(labels, first, lowest)
+        np.minimum.at(labels, second, lowest)
+        while True:
+            shortcut = labels[labels]
+            if np.array_equal(shortcut, labels):
+                break
+            labels = shortcut
+
+
+def pagerank(size: int, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Return the PageRank of each node, by power iteration.
+
+    The rank of the nodes without outgoing links is spread over all nodes.
+    """
+    if size == 0:
+        return np.empty(0, dtype=np.float64)
+    out_degrees = np.bincount(starts, minlength=size).astype(np.float64)
+    dangling = out_degrees == 0
+    weights = 1.0 / np.where(dangling, 1.0, out_degrees)
+    ranks = np.full(size, 1.0 / size)
+    for _ in range(PAGERANK_MAX_ITERATIONS):
+        spread = np.bincount(ends, weights=(ranks * weights)[starts], minlength=size)
+        new_ranks = (1 - PAGERANK_DAMPING) / size + PAGERANK_DAMPING * (spread + ranks[dangling].sum() / size)
+        converged = np.abs(new_ranks - ranks).sum() < PAGERANK_TOLERANCE
+        ranks = new_ranks
+        if converged:
+            break
+    return ranks
+
+
+def analyse(arrays: GraphArrays) -> GraphAnalysis:
+    size = len(arrays.edium_ids)
+    return GraphAnalysis(
+        edium_ids=arrays.edium_ids,
+        links=arrays.links,
+        components=arrays.edium_ids[connected_components(size, arrays.starts, arrays.ends)],
+        in_degrees=np.bincount(arrays.ends, minlength=size),
+        out_degrees=np.bincount(arrays.starts, minlength=size),
+        pagerank=pagerank(size, arrays.starts, arrays.ends),
+    )
+
+
+class AnalysisCache:
+    """Keep the analyses by filter, until the edia or the links change."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.analyses: Dict[Tuple[Opt[str], Opt[str]], GraphAnalysis] = {}
+        # Incremented by each invalidation, so an analysis started before isn't kept
+        self.generation = 0
+
+    def invalidate(self, events: List[invalidation.ChangeEvent]) -> None:
+        if any(event.table in ("edium", "link") for event in events):
+            with self.lock:
+                self.analyses.clear()
+                self.generation += 1
+
+    def get(self, label: Opt[str], kind: Opt[str]) -> GraphAnalysis:
+        invalidation.watcher.poll()
+        key = (label, kind)
+        with self.lock:
+            analysis = self.analyses.get(key)
+            generation = self.generation
+        if analysis is None:
+            analysis = analyse(load_arrays(label, kind))
+            with self.lock:
+                if self.generation == generation:
+                    self.analyses[key] = analysis
+        return analysis
+
+
+cache = AnalysisCache()
+invalidation.watcher.subscribe(cache.invalidate)
@@ -0,0 +1,114 @@
+"""Store the string histories of the elements of a name as deltas, or whole again.
+
+Each string version is stored as a delta from the value of the next one, and
+the newest version of an element is always whole, so the current values are
+read as before. To bound the cost of a read, there are at most
+``delta_interval - 1`` deltas in a row : an old value is rebuilt from the next
+full value, at most that many versions away. The name keeps the interval, so
+the next versions of its elements are encoded as they're written, by
+``Element.encode_as_delta``. The functions of this module are meant to be
+used inside a ``db_session``.
+"""
+
+import json
+from typing import Any, List, Optional as Opt, Tuple
+
+from . import deltas, names, packing
+from .. import exceptions, models
+from ..customtypes import ValueType
+from .tables import database
+
+
+def _layout(history: List[Tuple[int, bool, Any]], interval: int) -> List[Tuple[Any, bool]]:
+    """Return the stored value and delta flag of each version, from their types, last flags and values.
+
+    The last version stays whole, as the filters read its value in SQL.
+    """
+    stored: List[Tuple[Any, bool]] = []
+    run = 0
+    for (index, (value_type, last, value)) in enumerate(history):
+        delta = None
+        if (
+            run + 1 < interval
+            and index + 1 < len(history)
+            and not last
+            and value_type == ValueType.STR
+            and history[index + 1][0] == ValueType.STR
+        ):
+            delta = deltas.encode(value, history[index + 1][2])
+        if delta is None:
+            stored.append((value, False))
+            run = 0
+        else:
+            stored.append((delta, True))
+            run += 1
+    return stored
+
+
+def _columns(stored: Any) -> Tuple[str, Opt[bytes]]:
+    """Return the json and packed columns of a stored value, like ``Version.columns_for``."""
+    json_text = packing.dumps(stored)
+    packed = packing.compress(json_text)
+    return ('""', packed) if packed is not None else (json_text, None)
+
+
+def _stored_size(name_id: int) -> int:
+    return database.select(
+        'SELECT COALESCE(SUM(length(v."json") + COALESCE(length(v."packed"), 0)), 0) '
+        'FROM "Version" v JOIN "Element" e ON v."element" = e."id" '
+        'WHERE e."name_ref" = $name_id',
+        {"name_id": name_id},
+    )[0]
+
+
+def encode_name(name: str, interval: int) -> models.DeltaReportModel:
+    """Store the histories of the elements of a name with a full value every ``interval`` versions.
+
+    An interval below 2 stores all the values whole again, and stops encoding
+    the next versions.
+    """
+    name_id = names.lookup(name)
+    if name_id is None:
+        raise exceptions.ObjectNotFound("element name", name)
+    size_before = _stored_size(name_id)
+    database.execute(
+        'UPDATE "ElementName" SET "delta_interval" = $interval WHERE "id" = $name_id',
+        {"interval": interval, "name_id": name_id},
+    )
+    element_ids = database.select('SELECT "id" FROM "Element" WHERE "name_ref" = $name_id', {"name_id": name_id})
+    (versions, delta_count) = (0, 0)
+    connection = database.get_connection()
+    for element_id in element_ids:
+        rows = database.select(
+            'SELECT "id", "value_type", "last", "json", "packed", "delta" FROM "Version" '
+            'WHERE "element" = $element_id ORDER BY "id"',
+            {"element_id": element_id},
+        )
+        old_layout = [
+            (json.loads(raw_json) if packed is None else packing.unpack(packed), bool(delta))
+            for (_, _, _, raw_json, packed, delta) in rows
+        ]
+        values = deltas.rebuild(old_layout)
+        layout = _layout(
+            [(value_type, bool(last), value) for ((_, value_type, last, _, _, _), value) in zip(rows, values)],
+            interval,
+        )
+        connection.executemany(
+            'UPDATE "Version" SET "json" = ?, "packed" = ?, "delta" = ? WHERE "id" = ?',
+            [
+                (*_columns(stored), is_delta, row[0])
+                for (row, old, (stored, is_delta)) in zip(rows, old_layout, layout)
+                if old != (stored, is_delta)
+            ],
+        )
+        versions += len(rows)
+        delta_count += sum(is_delta for (_, is_delta) in layout)
+    return models.DeltaReportModel(
+        name=name,
+        interval=interval,
+        elements=len(element_ids),
+        versions=versions,
+        deltas=delta_count,
+        size_before=size_before,
+        size_after=_stored_size(name_id),
+    )
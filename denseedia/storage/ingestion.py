@@ -0,0 +1,111 @@
+"""Ingest many versions at once, for backfilling time series.
+
+The points keep their own creation dates. They are inserted with a single
+``executemany``, then the ``last`` flag is fixed once per element : the last
+version is the one with the latest creation date, so points older than the
+current value don't replace it. A version promoted this way may be stored as
+a delta from the next one (see ``storage.histories``) : its full value is
+stored again, as the last versions are read whole. The revision of each
+element is incremented once, and compared first if the series expects one.
+The functions of this module are meant to be used inside a ``db_session``.
+"""
+
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional as Opt, Tuple
+
+from .. import exceptions, helpers, models
+from . import packing, revisions
+from .rows import datetime_to_timestamp
+from .tables import Version, database
+
+# Element id, value type, points, and the expected revision of the element or None
+Series = Tuple[int, models.ValueType.asType, List[Tuple[datetime, Any]], Opt[int]]
+
+
+def _naive(value: datetime) -> datetime:
+    """Convert an aware datetime to the naive local time used by the database."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone().replace(tzinfo=None)
+
+
+def _rows(series: List[Series]) -> Iterator[Tuple[int, int, str, Opt[bytes], str]]:
+    for (element_id, value_type, points, _) in series:
+        type_id = models.ValueType.to_id(value_type)
+        for (creation_date, value_json) in points:
+            # The JSON column doesn't support "null", like in Element.create_version2
+            json_text = json.dumps("" if value_json is None else value_json)
+            packed = packing.compress(json_text)
+            if packed is not None:
+                json_text = '""'
+            yield (element_id, type_id, json_text, packed, datetime_to_timestamp(_naive(creation_date)))
+
+
+def ingest_versions(series: Iterable[Series]) -> models.IngestionResultModel:
+    """Insert the points of each series as versions of its element.
+
+    The values must already be validated against their type. An
+    ObjectNotFound is raised, before any write, if an element doesn't exist,
+    and a RevisionConflict if an element isn't at its expected revision.
+    """
+    series = list(series)
+    if not series:
+        return models.IngestionResultModel(elements=0, versions=0)
+    expected: Dict[int, Opt[int]] = {}
+    for (element_id, _, _, revision) in series:
+        if expected.get(element_id) is None:
+            expected[element_id] = revision
+    unique_ids = sorted(expected)
+    element_ids = json.dumps(unique_ids)
+    missing = database.select(
+        'SELECT e.value FROM json_each($ids) e WHERE NOT EXISTS (SELECT 1 FROM "Element" WHERE "id" = e.value) LIMIT 1',
+        {"ids": element_ids},
+    )
+    if missing:
+        raise exceptions.ObjectNotFound("element", missing[0])
+    for element_id in unique_ids:
+        revisions.bump(element_id, expected[element_id])
+
+    params = {"ids": element_ids, "now": datetime_to_timestamp(helpers.now())}
+    # The ids are autoincremented, the new versions are the ones above
+    params["first_id"] = database.select('SELECT COALESCE(MAX("id"), 0) FROM "Version"')[0]
+    cursor = database.get_connection().executemany(
+        'INSERT INTO "Version" ("element", "value_type", "json", "packed", "last", "delta", "creation_date") '
+        'VALUES (?, ?, ?, ?, 0, 0, ?)',
+        _rows(series),
+    )
+    count = cursor.rowcount
+
+    database.execute(
+        'UPDATE "Version" SET "last" = 0 WHERE "last" = 1 AND "element" IN (SELECT value FROM json_each($ids))',
+        params,
+    )
+    database.execute(
+        'UPDATE "Version" SET "last" = 1 WHERE "id" IN ('
+        '  SELECT (SELECT v."id" FROM "Version" v WHERE v."element" = e.value '
+        '          ORDER BY v."creation_date" DESC, v."id" DESC LIMIT 1) '
+        '  FROM json_each($ids) e'
+        ")",
+        params,
+    )
+    promoted = database.select(
+        'SELECT "id" FROM "Version" WHERE "last" = 1 AND "delta" = 1 '
+        'AND "element" IN (SELECT value FROM json_each($ids))',
+        params,
+    )
+    for version_id in promoted:
+        version = Version.get(id=version_id)
+        version.store(version.get_json())
+        version.delta = False
+    database.execute(
+        'UPDATE "Element" SET "updated_at" = $now WHERE "id" IN (SELECT value FROM json_each($ids))',
+        params,
+    )
+    database.execute(
+        'INSERT INTO "Change" ("table", "object_id", "operation", "creation_date") '
+        'SELECT \'version\', "id", $operation, $now FROM "Version" '
+        'WHERE "id" > $first_id ORDER BY "id"',
+        {**params, "operation": models.ChangeOperation.CREATE},
+    )
+    return models.IngestionResultModel(elements=len(unique_ids), versions=count)
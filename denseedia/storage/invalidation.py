@@ -0,0 +1,58 @@
+"""Tell the per-process caches what changed, whatever the process that wrote it.
+
+Every write is recorded in the change feed, so reading the new changes is
+enough to know what to invalidate, even when several server processes share
+the file. The caches subscribe to the watcher, and call ``poll`` before they
+are read.
+"""
+
+import threading
+from typing import Callable, List, NamedTuple
+
+from .tables import database, orm
+
+
+class ChangeEvent(NamedTuple):
+    table: str
+    object_id: int
+    operation: str
+
+
+Listener = Callable[[List[ChangeEvent]], None]
+
+
+class ChangeWatcher:
+    """Dispatch the new changes of the feed to the listeners."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.listeners: List[Listener] = []
+        self.last_seen = None
+
+    def subscribe(self, listener: Listener) -> None:
+        self.listeners.append(listener)
+
+    def poll(self) -> None:
+        """Read the changes made since the last poll and dispatch them.
+
+        The first poll only reads the current position in the feed, as the
+        caches are empty then.
+        """
+        with self.lock, orm.db_session:
+            if self.last_seen is None:
+                self.last_seen = database.select('SELECT COALESCE(MAX("id"), 0) FROM "Change"')[0]
+                return
+            rows = database.select(
+                'SELECT "id", "table", "object_id", "operation" FROM "Change" '
+                'WHERE "id" > $last_seen ORDER BY "id"',
+                {"last_seen": self.last_seen},
+            )
+            if not rows:
+                return
+            self.last_seen = rows[-1][0]
+            events = [ChangeEvent(table, object_id, operation) for (_, table, object_id, operation) in rows]
+        for listener in self.listeners:
+            listener(events)
+
+
+watcher = ChangeWatcher()
@@ -0,0 +1,82 @@
+"""Keep the links unique, with an optional index.
+
+Two links are duplicates when they have the same start, end, label and
+direction. By default, duplicates are allowed. Once the unique index is
+added, they are refused, and an upsert resolves a link in a single indexed
+statement. The functions of this module are meant to be used inside a
+``db_session``.
+"""
+
+from typing import Any, Dict, Tuple
+
+from .. import exceptions, helpers
+from .rows import datetime_to_timestamp
+from .tables import database
+
+UNIQUE_INDEX = "uniq_link__start_end_label_directed"
+
+
+def has_unique_index() -> bool:
+    return bool(database.select(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name = $name",
+        {"name": UNIQUE_INDEX},
+    )[0])
+
+
+def add_unique_index() -> None:
+    """Refuse the duplicate links from now on. There must be none left."""
+    database.execute(
+        f'CREATE UNIQUE INDEX IF NOT EXISTS "{UNIQUE_INDEX}" ON "Link" ("start", "end", "label", "directed")'
+    )
+
+
+def drop_unique_index() -> None:
+    database.execute(f'DROP INDEX IF EXISTS "{UNIQUE_INDEX}"')
+
+
+def _find(params: Dict[str, Any]) -> int:
+    """Return the id of the link with these values, or 0."""
+    found = database.select(
+        'SELECT "id" FROM "Link" WHERE "start" = $start AND "end" = $end '
+        'AND "label" = $label AND "directed" = $directed LIMIT 1',
+        params,
+    )
+    return found[0] if found else 0
+
+
+def upsert_link(start: int, end: int, directed: bool, label: str) -> Tuple[int, bool]:
+    """Return the id of the link with these values, created if needed, and whether it was created.
+
+    With the unique index, the link is inserted unless it conflicts, in a
+    single statement. Without it, the link is looked for first.
+    """
+    params = {
+        "start": start,
+        "end": end,
+        "directed": int(directed),
+        "label": label,
+        "now": datetime_to_timestamp(helpers.now()),
+    }
+    if has_unique_index():
+        inserted = database.execute(
+            'INSERT INTO "Link" ("start", "end", "directed", "label", "updated_at") '
+            "SELECT $start, $end, $directed, $label, $now "
+            'WHERE EXISTS (SELECT 1 FROM "Edium" WHERE "id" = $start) '
+            'AND EXISTS (SELECT 1 FROM "Edium" WHERE "id" = $end) '
+            'ON CONFLICT ("start", "end", "label", "directed") DO NOTHING RETURNING "id"',
+            params,
+        ).fetchone()
+        if inserted is not None:
+            return inserted[0], True
+    link_id = _find(params)
+    if link_id:
+        return link_id, False
+    for edium_id in (start, end):
+        if not database.exists('SELECT 1 FROM "Edium" WHERE "id" = $edium_id', {"edium_id": edium_id}):
+            raise exceptions.ObjectNotFound("edium", edium_id)
+    cursor = database.execute(
+        'INSERT INTO "Link" ("start", "end", "directed", "label", "updated_at") '
+        "VALUES ($start, $end, $directed, $label, $now)",
+        params,
+    )
+    return cursor.lastrowid, True
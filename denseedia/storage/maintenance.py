@@ -0,0 +1,161 @@
+"""Keep the database file compact, its statistics fresh, and check it.
+
+The tasks use a connection of their own in autocommit mode, as ``VACUUM``
+can't run in a transaction. The incremental vacuum frees the pages in small
+steps, each one in its own short write transaction, so the other writers only
+wait for one step. It needs the ``auto_vacuum`` mode of the file to be
+``INCREMENTAL`` : the new files get it, the older ones once from the CLI with
+``enable_incremental_vacuum``, which rewrites the whole file.
+"""
+
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional as Opt
+
+from . import snapshots
+from .. import exceptions, models
+from ..constants import SQLITE_BUSY_TIMEOUT, VACUUM_PAGES_PER_STEP, VACUUM_STEP_PAUSE
+from ..logger import logger
+from .tables import database
+
+_INCREMENTAL = 2  # The value of PRAGMA auto_vacuum
+
+
+@contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    """Yield a connection to the bound database, in autocommit mode."""
+    snapshotter = snapshots.snapshotter
+    if snapshotter is not None:
+        # The shared cache of the in-memory database fails at once on the
+        # locked tables : run between two writes
+        with snapshotter.lock:
+            database.provider.acquire_lock()
+            try:
+                yield snapshotter.keeper
+            finally:
+                database.provider.release_lock()
+        return
+    connection = sqlite3.connect(database.provider.pool.filename, isolation_level=None)
+    try:
+        connection.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}")
+        yield connection
+    finally:
+        connection.close()
+
+
+def _pragma(connection: sqlite3.Connection, name: str) -> int:
+    return connection.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def analyze(full: bool = False) -> models.AnalyzeReportModel:
+    """Refresh the statistics of the query planner.
+
+    Without ``full``, ``PRAGMA optimize`` only analyses the tables that need
+    it, which is cheap enough to run often.
+    """
+    start = time.perf_counter()
+    with _connect() as connection:
+        connection.execute("ANALYZE" if full else "PRAGMA optimize")
+    return models.AnalyzeReportModel(full=full, duration=time.perf_counter() - start)
+
+
+def incremental_vacuum_enabled() -> bool:
+    with _connect() as connection:
+        return _pragma(connection, "auto_vacuum") == _INCREMENTAL
+
+
+def enable_incremental_vacuum() -> None:
+    """Switch the file to the incremental vacuum mode, and rewrite it with ``VACUUM``.
+
+    The writers are blocked for the whole rewrite.
+    """
+    with _connect() as connection:
+        connection.execute(f"PRAGMA auto_vacuum = {_INCREMENTAL}")
+        connection.execute("VACUUM")
+    logger.info("Enabled the incremental vacuum")
+
+
+def incremental_vacuum(
+    max_pages: Opt[int] = None,
+    keep_going: Callable[[], bool] = lambda: True,
+) -> models.VacuumReportModel:
+    """Free up to ``max_pages`` unused pages (all by default), in small steps.
+
+    ``keep_going`` is called before each step, to stop early. A
+    MaintenanceFailed is raised if the incremental vacuum isn't enabled.
+    """
+    start = time.perf_counter()
+    freed = 0
+    while max_pages is None or freed < max_pages:
+        if freed and not keep_going():
+            break
+        with _connect() as connection:
+            if _pragma(connection, "auto_vacuum") != _INCREMENTAL:
+                raise exceptions.MaintenanceFailed("The incremental vacuum isn't enabled on this file")
+            before = _pragma(connection, "freelist_count")
+            step = VACUUM_PAGES_PER_STEP if max_pages is None else min(VACUUM_PAGES_PER_STEP, max_pages - freed)
+            if before == 0 or step == 0:
+                break
+            # The pragma frees one page per row read
+            connection.execute(f"PRAGMA incremental_vacuum({step})").fetchall()
+            freed += before - _pragma(connection, "freelist_count")
+        time.sleep(VACUUM_STEP_PAUSE)
+    with _connect() as connection:
+        free_pages = _pragma(connection, "freelist_count")
+    logger.info("Freed %s pages with the incremental vacuum, %s are left", freed, free_pages)
+    return models.VacuumReportModel(freed_pages=freed, free_pages=free_pages, duration=time.perf_counter() - start)
+
+
+def check_integrity(full: bool = False, max_problems: int = 100) -> models.IntegrityReportModel:
+    """Look for corruptions, with ``quick_check`` or the slower ``integrity_check`` if ``full``.
+
+    The quick check skips the consistency of the indexes with their tables.
+    """
+    start = time.perf_counter()
+    pragma = "integrity_check" if full else "quick_check"
+    with _connect() as connection:
+        problems = [row[0] for row in connection.execute(f"PRAGMA {pragma}({max_problems})")]
+    if problems == ["ok"]:
+        problems = []
+    else:
+        logger.error("The %s of the database found %s problem(s) : %s", pragma, len(problems), problems[:5])
+    return models.IntegrityReportModel(
+        full=full,
+        ok=not problems,
+        problems=problems,
+        duration=time.perf_counter() - start,
+    )
+
+
+def space_report() -> models.SpaceReportModel:
+    """Return the pages used by each table and index, the biggest first.
+
+    It reads every page of the file with the ``dbstat`` virtual table.
+    """
+    with _connect() as connection:
+        try:
+            usage = connection.execute(
+                "SELECT s.name, COALESCE(m.type, 'table'), COALESCE(m.tbl_name, s.name), "
+                "COUNT(*), SUM(s.pgsize), SUM(s.unused) "
+                "FROM dbstat s LEFT JOIN sqlite_master m ON m.name = s.name "
+                "GROUP BY s.name ORDER BY SUM(s.pgsize) DESC, s.name"
+            ).fetchall()
+        except sqlite3.OperationalError as err:
+            raise exceptions.MaintenanceFailed(f"The dbstat table isn't available : {err}") from err
+        page_size = _pragma(connection, "page_size")
+        page_count = _pragma(connection, "page_count")
+        free_pages = _pragma(connection, "freelist_count")
+        auto_vacuum = _pragma(connection, "auto_vacuum")
+    objects: List[models.SpaceUsageModel] = [
+        models.SpaceUsageModel(name=name, type=type_, table=table, pages=pages, size=size, unused=unused)
+        for (name, type_, table, pages, size, unused) in usage
+    ]
+    return models.SpaceReportModel(
+        page_size=page_size,
+        pages=page_count,
+        free_pages=free_pages,
+        size=page_size * page_count,
+        incremental_vacuum=auto_vacuum == _INCREMENTAL,
+        objects=objects,
+    )
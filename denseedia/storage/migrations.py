@@ -0,0 +1,136 @@
+"""Upgrade the database files made by older versions of DenseEdia.
+
+Pony creates the missing tables and indexes, but not the missing columns of
+the existing tables. The migrations run in order, and the number of the ones
+already applied is stored in the ``user_version`` of the file.
+"""
+
+import sqlite3
+from pathlib import Path
+from typing import Callable, List
+
+from . import packing
+from ..logger import logger
+
+
+def table_exists(connection: sqlite3.Connection, table: str) -> bool:
+    query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+    return connection.execute(query, (table,)).fetchone() is not None
+
+
+def column_exists(connection: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in connection.execute(f'PRAGMA table_info("{table}")'))
+
+
+def _add_updated_at(connection: sqlite3.Connection) -> None:
+    """Add the modification dates, initialized with the creation dates."""
+    for table in ("Edium", "Element", "Link"):
+        if not table_exists(connection, table) or column_exists(connection, table, "updated_at"):
+            continue
+        connection.execute(f'ALTER TABLE "{table}" ADD COLUMN "updated_at" DATETIME')
+        if column_exists(connection, table, "creation_date"):
+            connection.execute(f'UPDATE "{table}" SET "updated_at" = "creation_date"')
+        else:
+            # The links don't have a creation date
+            connection.execute(
+                f'UPDATE "{table}" SET "updated_at" = strftime(\'%Y-%m-%d %H:%M:%S.000000\', \'now\', \'localtime\')'
+            )
+
+
+def _intern_element_names(connection: sqlite3.Connection) -> None:
+    """Move the element names to the ElementName table, referenced by id.
+
+    SQLite can't change the type of a column, so the Element table is rebuilt.
+    The foreign keys are off on this connection, so the versions are kept.
+    """
+    if not table_exists(connection, "Element") or column_exists(connection, "Element", "name_ref"):
+        return
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS "ElementName" (\n'
+        '  "id" INTEGER PRIMARY KEY AUTOINCREMENT,\n'
+        '  "text" TEXT UNIQUE NOT NULL\n'
+        ')'
+    )
+    connection.execute('INSERT OR IGNORE INTO "ElementName" ("text") SELECT DISTINCT "name" FROM "Element" ORDER BY "name"')
+    connection.execute(
+        'CREATE TABLE "Element_new" (\n'
+        '  "id" INTEGER PRIMARY KEY AUTOINCREMENT,\n'
+        '  "edium" INTEGER NOT NULL REFERENCES "Edium" ("id") ON DELETE CASCADE,\n'
+        '  "name_ref" INTEGER NOT NULL REFERENCES "ElementName" ("id") ON DELETE CASCADE,\n'
+        '  "creation_date" DATETIME NOT NULL,\n'
+        '  "updated_at" DATETIME NOT NULL,\n'
+        '  "todo" BOOLEAN NOT NULL\n'
+        ')'
+    )
+    connection.execute(
+        'INSERT INTO "Element_new" ("id", "edium", "name_ref", "creation_date", "updated_at", "todo") '
+        'SELECT e."id", e."edium", n."id", e."creation_date", e."updated_at", e."todo" '
+        'FROM "Element" e JOIN "ElementName" n ON n."text" = e."name"'
+    )
+    # Keep the sequence, so the ids of the deleted elements aren't reused
+    sequence = connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'Element'").fetchone()
+    connection.execute('DROP TABLE "Element"')
+    connection.execute('ALTER TABLE "Element_new" RENAME TO "Element"')
+    if sequence is not None:
+        connection.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'Element'", sequence)
+    # Pony creates the indexes again
+
+
+def _add_element_revision(connection: sqlite3.Connection) -> None:
+    """Add the revision counters of the elements, starting at 0."""
+    if not table_exists(connection, "Element") or column_exists(connection, "Element", "revision"):
+        return
+    connection.execute('ALTER TABLE "Element" ADD COLUMN "revision" INTEGER NOT NULL DEFAULT 0')
+
+
+def _add_version_deltas(connection: sqlite3.Connection) -> None:
+    """Add the delta flags of the versions, and the opt-in interval of the names."""
+    if table_exists(connection, "Version") and not column_exists(connection, "Version", "delta"):
+        connection.execute('ALTER TABLE "Version" ADD COLUMN "delta" BOOLEAN NOT NULL DEFAULT 0')
+    if table_exists(connection, "ElementName") and not column_exists(connection, "ElementName", "delta_interval"):
+        connection.execute('ALTER TABLE "ElementName" ADD COLUMN "delta_interval" INTEGER NOT NULL DEFAULT 0')
+
+
+def _pack_large_values(connection: sqlite3.Connection) -> None:
+    """Add the packed column of the versions, and compress the large values already there.
+
+    The file only shrinks once its free pages are vacuumed.
+    """
+    if not table_exists(connection, "Version") or column_exists(connection, "Version", "packed"):
+        return
+    connection.execute('ALTER TABLE "Version" ADD COLUMN "packed" BLOB')
+    if packing.threshold <= 0:
+        return
+    query = 'SELECT "id" FROM "Version" WHERE length("json") >= ?'
+    for (version_id,) in connection.execute(query, (packing.threshold,)).fetchall():
+        (raw_json,) = connection.execute('SELECT "json" FROM "Version" WHERE "id" = ?', (version_id,)).fetchone()
+        packed = packing.compress(raw_json)
+        if packed is not None:
+            connection.execute('UPDATE "Version" SET "json" = \'""\', "packed" = ? WHERE "id" = ?', (packed, version_id))
+
+
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _add_updated_at,
+    _intern_element_names,
+    _add_element_revision,
+    _add_version_deltas,
+    _pack_large_values,
+]
+
+
+def upgrade(file_path: Path) -> None:
+    """Apply the missing migrations to a database file."""
+    connection = sqlite3.connect(str(file_path), isolation_level=None)
+    try:
+        if connection.execute("PRAGMA page_count").fetchone()[0] == 0:
+            # A new file : the vacuum mode can only be set before anything is written
+            connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        (version,) = connection.execute("PRAGMA user_version").fetchone()
+        for (index, migration) in enumerate(MIGRATIONS[version:], start=version):
+            logger.info("Apply the migration %s (%s)", index + 1, migration.__name__)
+            connection.execute("BEGIN IMMEDIATE")
+            migration(connection)
+            connection.execute(f"PRAGMA user_version = {index + 1}")
+            connection.execute("COMMIT")
+    finally:
+        connection.close()
@@ -0,0 +1,47 @@
+"""Look up the element names, stored once in the ElementName table.
+
+The elements reference their name by id, so the raw SQL queries compare
+integers : a name is resolved to its id once, then the id is cached in the
+process. The names are never renamed nor deleted, and the database is bound
+once per process, so a cached id stays valid. An id read inside a write
+transaction isn't cached : the name may have been added by the transaction,
+and be rolled back. The functions of this module are meant to be used
+inside a ``db_session``.
+"""
+
+from typing import Dict, List, Optional as Opt, Tuple
+
+from .tables import database
+
+_ids: Dict[str, int] = {}
+
+
+def lookup(name: str) -> Opt[int]:
+    """Return the id of an element name, or None if no element ever had it."""
+    name_id = _ids.get(name)
+    if name_id is not None:
+        return name_id
+    found = database.select('SELECT "id" FROM "ElementName" WHERE "text" = $name', {"name": name})
+    if not found:
+        return None
+    if not database._get_cache().in_transaction:
+        _ids[name] = found[0]
+    return found[0]
+
+
+def most_used(kind: str, max_count: int) -> List[Tuple[str, int]]:
+    """Return the most used element names for an edium kind, with their counts.
+
+    The elements are counted by name id, and only the kept ids are resolved.
+    """
+    return [
+        (text, count)
+        for (text, count) in database.select(
+            'SELECT n."text", counts.total FROM ('
+            '  SELECT el."name_ref" AS name_id, COUNT(*) AS total '
+            '  FROM "Element" el JOIN "Edium" ed ON el."edium" = ed."id" '
+            '  WHERE ed."kind" = $kind GROUP BY el."name_ref" ORDER BY total DESC, name_id LIMIT $max_count'
+            ') counts JOIN "ElementName" n ON n."id" = counts.name_id ORDER BY counts.total DESC, counts.name_id',
+            {"kind": kind, "max_count": max_count},
+        )
+    ]
@@ -0,0 +1,80 @@
+"""Compress the large values of the versions, in their ``packed`` column.
+
+A value whose JSON takes at least ``threshold`` bytes is stored compressed,
+and its ``json`` column holds an empty string instead. It's compressed with
+zstd if the ``zstandard`` package is installed, else with zlib. The first
+byte of the packed data names its codec, so a file stays readable whatever
+the settings of its writers. The values are only decompressed when they're
+read : the listings of elements without their versions never are.
+"""
+
+import json
+import zlib
+from typing import Any, Optional as Opt
+
+from .. import exceptions
+from ..constants import VALUE_COMPRESSION_LEVEL, VALUE_COMPRESSION_THRESHOLD
+
+_ZLIB = b"z"
+_ZSTD = b"s"
+
+# Set by configure() : the smallest JSON compressed, in bytes (0 to disable), and the codec
+threshold: int = VALUE_COMPRESSION_THRESHOLD
+codec: str = "zlib"
+
+
+def zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def configure(new_threshold: int, new_codec: Opt[str] = None) -> None:
+    """Compress the JSON of at least ``new_threshold`` bytes, with zstd if available by default."""
+    global threshold, codec
+    if new_codec is None:
+        new_codec = "zstd" if zstd_available() else "zlib"
+    if new_codec == "zstd" and not zstd_available():
+        raise exceptions.CompressionUnavailable("zstd needs the zstandard package")
+    threshold = new_threshold
+    codec = new_codec
+
+
+def dumps(value: Any) -> str:
+    """Encode a value like Pony does for the JSON columns."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def compress(json_text: str) -> Opt[bytes]:
+    """Return the compressed JSON, or None if it's below the threshold."""
+    data = json_text.encode()
+    if threshold <= 0 or len(data) < threshold:
+        return None
+    if codec == "zstd":
+        import zstandard
+        return _ZSTD + zstandard.ZstdCompressor(level=VALUE_COMPRESSION_LEVEL).compress(data)
+    return _ZLIB + zlib.compress(data, VALUE_COMPRESSION_LEVEL)
+
+
+def decompress(packed: bytes) -> str:
+    """Return the JSON of a packed value."""
+    (tag, data) = (packed[:1], packed[1:])
+    if tag == _ZSTD:
+        try:
+            import zstandard
+        except ImportError:
+            raise exceptions.CompressionUnavailable("This file has values compressed with zstd : install zstandard")
+        return zstandard.ZstdDecompressor().decompress(data).decode()
+    return zlib.decompress(data).decode()
+
+
+def pack(value: Any) -> Opt[bytes]:
+    """Return the compressed JSON of a value, or None if it's below the threshold."""
+    return compress(dumps(value))
+
+
+def unpack(packed: bytes) -> Any:
+    """Return the value of a packed value."""
+    return json.loads(decompress(packed))
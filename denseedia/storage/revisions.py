@@ -0,0 +1,47 @@
+"""Compare and swap the revisions of the elements, for the raw SQL writes.
+
+Each write to an element or to its versions increments the revision of the
+element. A write expecting a revision increments it only if it's still the
+same, in a single statement : it's atomic, and it takes the write lock of the
+file, so the rest of the write sees the latest state. The ORM writes get the
+same check from Pony, with ``Element.bump_revision``. The functions of this
+module are meant to be used inside a ``db_session``.
+
+If Pony already holds the element in the session, the revision is bumped
+through it : a raw UPDATE would leave it stale, and its next ORM write would
+fail Pony's optimistic check, like a conflict that didn't happen.
+"""
+
+from typing import Optional as Opt
+
+from pony.orm.core import del_statuses
+
+from .. import exceptions
+from .tables import Element, database
+
+
+def _loaded_element(element_id: int) -> Opt[Element]:
+    """Return the element if Pony holds it in the current session, without loading it."""
+    return database._get_cache().indexes.get(Element._pk_attrs_, {}).get(element_id)
+
+
+def bump(element_id: int, expected: Opt[int] = None) -> None:
+    """Increment the revision of an element, if it's still the ``expected`` one when given."""
+    element = _loaded_element(element_id)
+    if element is not None:
+        if element._status_ in del_statuses:
+            raise exceptions.ObjectNotFound("element", element_id)
+        element.bump_revision(expected)
+        return
+    params = {"element_id": element_id, "expected": expected}
+    condition = ' AND "revision" = $expected' if expected is not None else ""
+    cursor = database.execute(
+        f'UPDATE "Element" SET "revision" = "revision" + 1 WHERE "id" = $element_id{condition}',
+        params,
+    )
+    if cursor.rowcount:
+        return
+    found = database.select('SELECT "revision" FROM "Element" WHERE "id" = $element_id', params)
+    if not found:
+        raise exceptions.ObjectNotFound("element", element_id)
+    raise exceptions.RevisionConflict(element_id, expected, found[0])
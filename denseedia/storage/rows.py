@@ -0,0 +1,233 @@
+"""Read the tables with raw SQL, for the trusted serialization path.
+
+The functions of this module skip the ORM objects and the pydantic models :
+they build plain dicts straight from the SQL rows, with the exact same content
+as the ``to_model()`` methods once encoded in JSON. They are meant to be used
+inside a ``db_session``.
+"""
+
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional as Opt, Tuple
+
+from . import deltas, packing
+from .. import models
+from .tables import database
+
+_EMPTY_MICROSECONDS = ".000000"
+
+
+def timestamp_to_iso(timestamp: str) -> str:
+    """Convert a datetime stored by Pony to the ISO format of ``isoformat()``."""
+    iso = timestamp.replace(" ", "T", 1)
+    if iso.endswith(_EMPTY_MICROSECONDS):
+        return iso[:-len(_EMPTY_MICROSECONDS)]
+    return iso
+
+
+def decode_json_column(raw: Any) -> Any:
+    """Decode a JSON column the same way Pony does."""
+    if isinstance(raw, (int, bool, float, type(None))):
+        return raw
+    return json.loads(raw)
+
+
+def datetime_to_timestamp(value: datetime) -> str:
+    """Convert a datetime to the format stored by Pony, to compare them in SQL."""
+    return value.isoformat(" ", "microseconds")
+
+
+EDIUM_COLUMNS = '"id", "title", "kind", "creation_date", "updated_at"'
+
+
+def edia_from_cursor(cursor: Iterable[Tuple[Any, ...]]) -> List[Dict[str, Any]]:
+    """Return the edia read from the ``EDIUM_COLUMNS``, with the fields of an EdiumModel."""
+    return [
+        {
+            "id": id_,
+            "title": title,
+            "kind": kind,
+            "creation_date": timestamp_to_iso(creation_date),
+            "updated_at": timestamp_to_iso(updated_at),
+        }
+        for (id_, title, kind, creation_date, updated_at) in cursor
+    ]
+
+
+def _edia(where: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Return the edia matching a condition, with the fields of an EdiumModel."""
+    return edia_from_cursor(database.execute(
+        f'SELECT {EDIUM_COLUMNS} FROM "Edium" WHERE {where} ORDER BY "id"',
+        params,
+    ))
+
+
+def edia(since: Opt[datetime] = None) -> List[Dict[str, Any]]:
+    """Return the edia, with the fields of an EdiumModel.
+
+    If ``since`` is given, only the edia updated since this date are returned.
+    """
+    if since is None:
+        return _edia("1", {})
+    return _edia('"updated_at" >= $since', {"since": datetime_to_timestamp(since)})
+
+
+def edia_by_ids(edium_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Return the existing edia among some ids, by id."""
+    found = _edia('"id" IN (SELECT value FROM json_each($ids))', {"ids": json.dumps(edium_ids)})
+    return {edium["id"]: edium for edium in found}
+
+
+def one_edium(edium_id: int) -> Opt[Dict[str, Any]]:
+    """Return an edium with the fields of an EdiumModel, or None."""
+    found = _edia('"id" = $edium_id', {"edium_id": edium_id})
+    return found[0] if found else None
+
+
+def _links(where: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Return the links matching a condition, with the fields of a LinkModel."""
+    cursor = database.execute(
+        'SELECT "id", "start", "end", "directed", "label", "updated_at" FROM "Link" '
+        f'WHERE {where} ORDER BY "id"',
+        params,
+    )
+    return [
+        {
+            "id": id_,
+            "start": start,
+            "end": end,
+            "directed": bool(directed),
+            "label": label,
+            "updated_at": timestamp_to_iso(updated_at),
+        }
+        for (id_, start, end, directed, label, updated_at) in cursor
+    ]
+
+
+def links(since: Opt[datetime] = None) -> List[Dict[str, Any]]:
+    """Return the links, with the fields of a LinkModel.
+
+    If ``since`` is given, only the links updated since this date are returned.
+    """
+    if since is None:
+        return _links("1", {})
+    return _links('"updated_at" >= $since', {"since": datetime_to_timestamp(since)})
+
+
+def one_link(link_id: int) -> Opt[Dict[str, Any]]:
+    """Return a link with the fields of a LinkModel, or None."""
+    found = _links('"id" = $link_id', {"link_id": link_id})
+    return found[0] if found else None
+
+
+def _elements(where: str, params: Dict[str, Any], mode: models.VersionsMode.asType) -> List[Dict[str, Any]]:
+    """Return the elements matching a condition on the Element table ``e``.
+
+    None, one or all of their versions are attached, according to the ``mode``.
+    """
+    cursor = database.execute(
+        'SELECT e."id", e."edium", n."text", e."creation_date", e."updated_at", e."todo", e."revision" '
+        f'FROM "Element" e JOIN "ElementName" n ON n."id" = e."name_ref" WHERE {where} ORDER BY e."id"',
+        params,
+    )
+    content = {
+        id_: {
+            "id": id_,
+            "edium_id": edium_id,
+            "name": name,
+            "creation_date": timestamp_to_iso(creation_date),
+            "updated_at": timestamp_to_iso(updated_at),
+            "todo": bool(todo),
+            "revision": revision,
+            "versions": [],
+        }
+        for (id_, edium_id, name, creation_date, updated_at, todo, revision) in cursor
+    }
+    if mode == models.VersionsMode.NONE:
+        return list(content.values())
+
+    last_filter = 'AND v."last" = 1 ' if mode == models.VersionsMode.SINGLE else ""
+    cursor = database.execute(
+        'SELECT v."id", v."element", v."creation_date", v."last", v."value_type", v."json", v."packed", v."delta" '
+        'FROM "Version" v JOIN "Element" e ON v."element" = e."id" '
+        f'WHERE {where} {last_filter}ORDER BY v."id"',
+        params,
+    )
+    # The ids of the versions stored as a delta, by element : the last versions never are
+    stored_deltas: Dict[int, set] = {}
+    for (id_, element_id, creation_date, last, value_type, raw_json, packed, delta) in cursor:
+        content[element_id]["versions"].append({
+            "id": id_,
+            "element_id": element_id,
+            "creation_date": timestamp_to_iso(creation_date),
+            "last": bool(last),
+            "value_type": models.ValueType.to_alias(value_type),
+            "value_json": decode_json_column(raw_json) if packed is None else packing.unpack(packed),
+        })
+        if delta:
+            stored_deltas.setdefault(element_id, set()).add(id_)
+    for (element_id, delta_ids) in stored_deltas.items():
+        versions = content[element_id]["versions"]
+        values = deltas.rebuild([(version["value_json"], version["id"] in delta_ids) for version in versions])
+        for (version, value) in zip(versions, values):
+            version["value_json"] = value
+    return list(content.values())
+
+
+def elements_of_one_edium(edium_id: int, mode: models.VersionsMode.asType) -> List[Dict[str, Any]]:
+    """Return the elements of an edium, with the fields of an ElementModel.
+
+    None, one or all of their versions are attached, according to the ``mode``.
+    """
+    return _elements('e."edium" = $edium_id', {"edium_id": edium_id}, mode)
+
+
+def one_element(element_id: int, mode: models.VersionsMode.asType) -> Opt[Dict[str, Any]]:
+    """Return an element with the fields of an ElementModel, or None."""
+    found = _elements('e."id" = $element_id', {"element_id": element_id}, mode)
+    return found[0] if found else None
+
+
+def elements_since(since: datetime) -> List[Dict[str, Any]]:
+    """Return the elements updated since a date, with all their versions."""
+    return _elements(
+        'e."updated_at" >= $since',
+        {"since": datetime_to_timestamp(since)},
+        models.VersionsMode.ALL,
+    )
+
+
+def tombstones(since: datetime) -> List[Dict[str, Any]]:
+    """Return the tombstones recorded since a date, with the fields of a TombstoneModel."""
+    cursor = database.execute(
+        'SELECT "table", "object_id", "deletion_date" FROM "Tombstone" '
+        'WHERE "deletion_date" >= $since ORDER BY "id"',
+        {"since": datetime_to_timestamp(since)},
+    )
+    return [
+        {
+            "table": table,
+            "object_id": object_id,
+            "deletion_date": timestamp_to_iso(deletion_date),
+        }
+        for (table, object_id, deletion_date) in cursor
+    ]
+
+
+def changes(since: int, limit: int) -> List[Dict[str, Any]]:
+    """Return the changes after the sequence number ``since``, oldest first."""
+    cursor = database.execute(
+        'SELECT "id", "table", "object_id", "operation", "creation_date" FROM "Change" '
+        'WHERE "id" > $since ORDER BY "id" LIMIT $limit',
+        {"since": since, "limit": limit},
+    )
+    return [
+        {
+            "id": id_,
+            "table": table,
+            "object_id": object_id,
+            "operation": operation,
+            "creation_date": timestamp_to_iso(creation_date),
+        }
+        for (id_, table, object_id, operation, creation_date) in cursor
+    ]
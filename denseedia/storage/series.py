@@ -0,0 +1,184 @@
+"""Extract the history of numeric elements as NumPy arrays.
+
+Only the INT and FLOAT versions are read, the versions of other types are
+skipped. The timestamps are UNIX timestamps in seconds, computed from the naive
+creation dates. The functions of this module are meant to be used inside a
+``db_session``.
+"""
+
+import struct
+from typing import Any, Dict, NamedTuple, Optional as Opt, Tuple
+
+import numpy as np
+
+from . import names
+from .. import models
+from ..customtypes import ValueType
+from .tables import database
+
+_NUMERIC_TYPES = f"({ValueType.INT}, {ValueType.FLOAT})"
+
+
+class Series(NamedTuple):
+    """The history of one element."""
+    timestamps: np.ndarray  # int64
+    values: np.ndarray  # float64
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "timestamps": self.timestamps.tolist(),
+            "values": self.values.tolist(),
+        }
+
+    def pack(self) -> bytes:
+        """Pack the series as little-endian binary.
+
+        Format : count (uint32), then the timestamps (int64) and the values
+        (float64).
+        """
+        return b"".join((
+            struct.pack("<I", len(self.timestamps)),
+            self.timestamps.astype("<i8").tobytes(),
+            self.values.astype("<f8").tobytes(),
+        ))
+
+
+class SeriesMatrix(NamedTuple):
+    """The histories of one element name across many edia, aligned in time.
+
+    There's one row per edium and one column per timestamp. A cell is NaN when
+    there's no value for this edium at this time.
+    """
+    edium_ids: np.ndarray  # int64
+    timestamps: np.ndarray  # int64
+    values: np.ndarray  # float64, shape (len(edium_ids), len(timestamps))
+
+    def to_dict(self) -> Dict[str, Any]:
+        # JSON doesn't support NaN
+        values = self.values.astype(object)
+        values[np.isnan(self.values)] = None
+        return {
+            "edium_ids": self.edium_ids.tolist(),
+            "timestamps": self.timestamps.tolist(),
+            "values": values.tolist(),
+        }
+
+    def pack(self) -> bytes:
+        """Pack the matrix as little-endian binary.
+
+        Format : row count and column count (uint32), then the edium ids
+        (int64), the timestamps (int64) and the values row by row (float64).
+        """
+        return b"".join((
+            struct.pack("<II", len(self.edium_ids), len(self.timestamps)),
+            self.edium_ids.astype("<i8").tobytes(),
+            self.timestamps.astype("<i8").tobytes(),
+            self.values.astype("<f8").tobytes(),
+        ))
+
+
+def _fetch_array(sql: str, params: Dict[str, Any], columns: int) -> np.ndarray:
+    rows = database.execute(sql, params).fetchall()
+    if not rows:
+        return np.empty((0, columns), dtype=np.float64)
+    return np.array(rows, dtype=np.float64)
+
+
+def _aggregate(keys: np.ndarray, values: np.ndarray, how: models.Aggregation.asType) -> Tuple[np.ndarray, np.ndarray]:
+    """Aggregate the values that share the same key.
+
+    The keys must be sorted. Return the unique keys and their aggregated value.
+    """
+    (unique_keys, starts) = np.unique(keys, return_index=True)
+    if len(values) == 0:
+        return unique_keys, values
+    if how == models.Aggregation.MIN:
+        aggregated = np.minimum.reduceat(values, starts)
+    elif how == models.Aggregation.MAX:
+        aggregated = np.maximum.reduceat(values, starts)
+    elif how == models.Aggregation.LAST:
+        ends = np.append(starts[1:], len(values))
+        aggregated = values[ends - 1]
+    else:
+        counts = np.diff(np.append(starts, len(values)))
+        if how == models.Aggregation.COUNT:
+            aggregated = counts.astype(np.float64)
+        else:
+            aggregated = np.add.reduceat(values, starts) / counts
+    return unique_keys, aggregated
+
+
+def resample(series: Series, bucket: int, how: models.Aggregation.asType) -> Series:
+    """Aggregate the values in buckets of ``bucket`` seconds.
+
+    The buckets are aligned on the UNIX epoch, and only the non-empty ones are
+    returned, with the timestamp of their start.
+    """
+    buckets = series.timestamps // bucket * bucket
+    (timestamps, values) = _aggregate(buckets, series.values, how)
+    return Series(timestamps=timestamps, values=values)
+
+
+def element_series(element_id: int) -> Series:
+    """Return the numeric history of an element, sorted by date."""
+    data = _fetch_array(
+        'SELECT CAST(strftime(\'%s\', "creation_date") AS INTEGER), "json" FROM "Version" '
+        f'WHERE "element" = $element_id AND "value_type" IN {_NUMERIC_TYPES} '
+        'ORDER BY "creation_date", "id"',
+        {"element_id": element_id},
+        columns=2,
+    )
+    return Series(timestamps=data[:, 0].astype(np.int64), values=data[:, 1])
+
+
+def kind_matrix(
+    kind: str,
+    element_name: str,
+    bucket: Opt[int] = None,
+    how: models.Aggregation.asType = models.Aggregation.MEAN,
+) -> SeriesMatrix:
+    """Return the numeric history of an element name across the edia of a kind.
+
+    Without ``bucket``, the columns are all the timestamps at which one of the
+    values changed, and each cell holds the last known value of the edium at
+    this time. With ``bucket``, the values are aggregated in buckets of this
+    many seconds, like in ``resample``.
+    """
+    data = _fetch_array(
+        'SELECT el."edium", CAST(strftime(\'%s\', v."creation_date") AS INTEGER), v."json" '
+        'FROM "Version" v '
+        'JOIN "Element" el ON v."element" = el."id" '
+        'JOIN "Edium" ed ON el."edium" = ed."id" '
+        f'WHERE ed."kind" = $kind AND el."name_ref" = $name_id AND v."value_type" IN {_NUMERIC_TYPES} '
+        'ORDER BY el."edium", v."creation_date", v."id"',
+        # An unknown name is NULL, and matches nothing
+        {"kind": kind, "name_id": names.lookup(element_name)},
+        columns=3,
+    )
+    owners = data[:, 0].astype(np.int64)
+    timestamps = data[:, 1].astype(np.int64)
+    values = data[:, 2]
+    (edium_ids, rows) = np.unique(owners, return_inverse=True)
+
+    if bucket is not None:
+        timestamps = timestamps // bucket * bucket
+        columns = np.unique(timestamps)
+        # One key per cell, sorted because the data is sorted by edium then date
+        keys = rows * len(columns) + np.searchsorted(columns, timestamps)
+        (cells, aggregated) = _aggregate(keys, values, how)
+        matrix = np.full(len(edium_ids) * len(columns), np.nan)
+        matrix[cells] = aggregated
+        return SeriesMatrix(edium_ids, columns, matrix.reshape(len(edium_ids), len(columns)))
+
+    columns = np.unique(timestamps)
+    if len(columns) == 0:
+        return SeriesMatrix(edium_ids, columns, np.empty((0, 0)))
+    # Find the last version of each edium at each column, with one search in
+    # keys made of (row, time) that are sorted like the data
+    span = columns[-1] - columns[0] + 1
+    keys = rows * span + (timestamps - columns[0])
+    (grid_rows, grid_columns) = np.meshgrid(np.arange(len(edium_ids)), columns - columns[0], indexing="ij")
+    found = np.searchsorted(keys, grid_rows * span + grid_columns, side="right") - 1
+    valid = (found >= 0) & (rows[np.maximum(found, 0)] == grid_rows)
+    matrix = np.where(valid, values[np.maximum(found, 0)], np.nan)
+    return SeriesMatrix(edium_ids, columns, matrix)
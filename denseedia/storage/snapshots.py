@@ -0,0 +1,134 @@
+"""Serve the database from RAM, and save it back to its file regularly.
+
+The file is copied into a shared in-memory database with the SQLite backup
+API, and every query of the process runs on the copy. A background thread
+copies it back to the file when it changed, every ``interval`` seconds, and
+once more when the server stops.
+
+Whatever was written since the last snapshot is lost if the process is
+killed or crashes. The snapshots themselves are atomic : the file always
+holds a complete, consistent state.
+
+The shared cache of the in-memory database fails at once on the tables locked
+by another connection, instead of waiting like on a file. So every session
+runs in a transaction, holding the lock Pony takes for the writes : the reads
+wait for the current write, and never see what it hasn't committed.
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional as Opt
+
+from . import migrations
+from ..logger import logger
+from .tables import database, install_kind_counts, orm
+
+
+def _memory_filename() -> str:
+    """Return the URI of the shared in-memory database bound by Pony."""
+    return database.provider.pool.filename
+
+
+def _serialize_sessions() -> None:
+    """Start every session with the write lock of Pony, the reads too."""
+    provider = database.provider
+    set_transaction_mode = provider.set_transaction_mode
+
+    def set_immediate_mode(connection, cache) -> None:
+        cache.immediate = True
+        set_transaction_mode(connection, cache)
+
+    provider.set_transaction_mode = set_immediate_mode
+
+
+def _last_change_id() -> int:
+    with orm.db_session:
+        return database.select('SELECT COALESCE(MAX("id"), 0) FROM "Change"')[0]
+
+
+class Snapshotter:
+    """Keep the in-memory database alive and save it to ``file_path``.
+
+    Every write is recorded in the change feed, so the database is dirty when
+    the feed has moved since the last snapshot.
+    """
+
+    def __init__(self, file_path: Path, interval: float):
+        self.file_path = file_path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        # The in-memory database is freed with its last connection
+        self.keeper = sqlite3.connect(_memory_filename(), uri=True, check_same_thread=False)
+        self.saved_change_id = 0
+        self.thread: Opt[threading.Thread] = None
+
+    def load(self) -> None:
+        """Copy the file into the in-memory database."""
+        with self.lock:
+            source = sqlite3.connect(str(self.file_path))
+            try:
+                source.backup(self.keeper)
+            finally:
+                source.close()
+
+    def save(self, force: bool = False) -> bool:
+        """Copy the in-memory database to the file, if it changed.
+
+        Return whether a snapshot was made.
+        """
+        with self.lock:
+            change_id = _last_change_id()
+            if change_id == self.saved_change_id and not force:
+                return False
+            destination = sqlite3.connect(str(self.file_path))
+            # Wait for the current write, the shared cache would fail on it
+            database.provider.acquire_lock()
+            try:
+                # The copy is made in a single transaction of the destination
+                self.keeper.backup(destination)
+            finally:
+                database.provider.release_lock()
+                destination.close()
+            self.saved_change_id = change_id
+        logger.info("Saved a snapshot of the database to %s", self.file_path)
+        return True
+
+    def start(self) -> None:
+        """Save the snapshots in a background thread."""
+        self.saved_change_id = _last_change_id()
+        self.thread = threading.Thread(target=self._work, name="snapshotter", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread, and save a last snapshot."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.save()
+
+    def _work(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                self.save()
+            except Exception:
+                logger.exception("The snapshot of the database failed")
+
+
+snapshotter: Opt[Snapshotter] = None
+
+
+def use_memory_database(file_path: Path, interval: float) -> Snapshotter:
+    """Bind the database to an in-memory copy of a file, saved every ``interval`` seconds."""
+    global snapshotter
+    logger.info("Use an in-memory copy of the database at %s", file_path)
+    migrations.upgrade(file_path)
+    database.bind(provider="sqlite", filename=":sharedmemory:")
+    _serialize_sessions()
+    snapshotter = Snapshotter(file_path, interval)
+    snapshotter.load()
+    database.generate_mapping(create_tables=True)
+    install_kind_counts()
+    snapshotter.start()
+    return snapshotter
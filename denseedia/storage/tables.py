@@ -1,18 +1,44 @@
 """Define ORM classes."""
 
+import json
 from datetime import datetime
 from pathlib import Path
-from typing import Any, List, Optional as Opt
+from typing import Any, Dict, List, Optional as Opt
 
 from pony import orm
 
-from .. import helpers, models
+from . import deltas, migrations, packing
+from .. import exceptions, helpers, models
+from ..constants import SQLITE_BUSY_TIMEOUT
 from ..customtypes import ElementSummary, SupportedValue, ValueType
 from ..logger import logger
 
 database = orm.Database()
 
 
+@database.on_connect(provider="sqlite")
+def _configure_connection(_, connection) -> None:
+    """Let several processes share the file safely.
+
+    In WAL mode, the readers don't block the writer and the other way around,
+    and the busy timeout makes a writer wait for the lock instead of failing.
+    The in-memory databases don't support WAL : their sessions are serialized
+    instead (see ``snapshots``). The queries can read the packed values with
+    ``unpack_json``.
+    """
+    connection.create_function("unpack_json", 1, _unpack_json, deterministic=True)
+    cursor = connection.cursor()
+    (_, _, file_name) = cursor.execute("PRAGMA database_list").fetchone()
+    if not file_name:
+        return
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}")
+
+
+def _unpack_json(packed: Opt[bytes]) -> Opt[str]:
+    return None if packed is None else packing.decompress(packed)
+
+
 def value_to_json(value_type: ValueType, value: SupportedValue):
     if value_type == ValueType.DATETIME:
         return value.isoformat()
@@ -30,8 +56,9 @@ def json_to_value(value_type: ValueType, json) -> SupportedValue:
 class Edium(database.Entity):
     """The main piece of information stored in DenseEdia."""
     title = orm.Required(str)  # Non empty string
-    kind = orm.Optional(str)  # String (may be empty)
+    kind = orm.Optional(str, index=True)  # String (may be empty)
     creation_date = orm.Required(datetime, default=helpers.now)
+    updated_at = orm.Required(datetime, default=helpers.now, index=True)
     elements = orm.Set("Element")
     links_out = orm.Set("Link", reverse="start")
     links_in = orm.Set("Link", reverse="end")
@@ -43,29 +70,42 @@ class Edium(database.Entity):
             title=self.title,
             kind=self.kind,
             creation_date=self.creation_date,
+            updated_at=self.updated_at,
         )
 
+    def bury(self) -> None:
+        """Record the tombstones of the edium, its elements and its links.
+
+        It must be called just before deleting the edium.
+        """
+        for element in self.elements:
+            element.bury()
+        # A link from the edium to itself is in both sets
+        for link in set(self.links_out) | set(self.links_in):
+            link.bury()
+        record_deletion("edium", self.id)
+
     def get_element_by_name(self, element_name: str) -> Opt["Element"]:
         """Get an element by its name."""
-        query = self.elements.filter(lambda el: el.name == element_name)
+        query = self.elements.filter(lambda el: el.name_ref.text == element_name)
         return query.get()
 
     def set_element_value(
         self,
         element_name: str,
         new_value: SupportedValue,
-    ) -> None:
-        """Create the element if needed, then create its version."""
+    ) -> "Version":
+        """Create the element if needed, then create and return its version."""
         # Fetch the element with the right name
         element = self.get_element_by_name(element_name)
         if element is None:
             # Create a new element if it didn't exist
             logger.debug("The element %s doesn't exist yet", element_name)
-            self.create_element(element_name, new_value)
+            element = self.elements.create(name=element_name)
         else:
             # Create a new version if the element already exists
             logger.debug("The element %s exists (%s)", element_name, element.id)
-            element.create_version(new_value)
+        return element.create_version(new_value)
 
     def create_element(self, name: str, value: SupportedValue) -> "Element":
         """Create a new element and its version with the given value."""
@@ -90,7 +130,7 @@ class Edium(database.Entity):
         # Fetch the last version of each of the elements
         query = orm.select(
             (
-                (element.name, version)
+                (element.name_ref.text, version)
                 for element in self.elements
                 for version in element.versions
                 if version.last is True
@@ -107,13 +147,50 @@ class Edium(database.Entity):
         ]
 
 
+class ElementName(database.Entity):
+    """An element name, stored once and referenced by id by the elements.
+
+    The names are never renamed nor deleted, so their ids can be cached. With
+    a ``delta_interval``, the older string versions of the elements with this
+    name are stored as deltas, with a full value every ``delta_interval``
+    versions (see ``storage.histories``).
+    """
+    text = orm.Required(str, unique=True)
+    delta_interval = orm.Required(int, default=0)
+    elements = orm.Set("Element")
+
+    @classmethod
+    def intern(cls, text: str) -> "ElementName":
+        """Return the entry of a name, created if needed."""
+        return cls.get(text=text) or cls(text=text)
+
+
 class Element(database.Entity):
     """A property of an Edium that can have different value types."""
     edium = orm.Required("Edium")
-    name = orm.Required(str)
+    name_ref = orm.Required(ElementName, index=False)
     creation_date = orm.Required(datetime, default=helpers.now)
+    updated_at = orm.Required(datetime, default=helpers.now, index=True)
     todo = orm.Required(bool, default=False)
+    # Incremented by each write to the element or its versions
+    revision = orm.Required(int, default=0)
     versions = orm.Set("Version")
+    # Covers the lookups by name in an edium, and the name counts per edium
+    orm.composite_index(edium, name_ref)
+
+    def __init__(self, *args: Any, name: Opt[str] = None, **kwargs: Any) -> None:
+        """Accept the name as a string, and intern it."""
+        if name is not None:
+            kwargs["name_ref"] = ElementName.intern(name)
+        super().__init__(*args, **kwargs)
+
+    @property
+    def name(self) -> str:
+        return self.name_ref.text
+
+    @name.setter
+    def name(self, value: str) -> None:
+        self.name_ref = ElementName.intern(value)
 
     def to_model(self) -> models.ElementModel:
         """Return an ElementModel made with the element data."""
@@ -122,42 +199,113 @@ class Element(database.Entity):
             edium_id=self.edium.id,
             name=self.name,
             creation_date=self.creation_date,
+            updated_at=self.updated_at,
             todo=self.todo,
+            revision=self.revision,
             versions=[],
         )
 
+    def bury(self) -> None:
+        """Record the tombstone of the element, before deleting it."""
+        record_deletion("element", self.id)
+
+    def bump_revision(self, expected: Opt[int] = None) -> None:
+        """Increment the revision, if it's still the ``expected`` one when given.
+
+        Pony checks the old revision in the WHERE clause of its UPDATE, so it's
+        a compare-and-swap : a write committed in between makes the flush fail.
+        It's flushed at once, so the rest of the write runs with the write lock
+        of the file, on the latest state of the element.
+        """
+        if expected is not None and self.revision != expected:
+            raise exceptions.RevisionConflict(self.id, expected, self.revision)
+        self.revision += 1
+        try:
+            orm.flush()
+        except orm.OptimisticCheckError:
+            raise exceptions.RevisionConflict(self.id, expected)
+
     def get_last_version(self) -> Opt["Version"]:
         """Return the last version of the element."""
         return self.versions.select(lambda v: v.last is True).get()
 
-    def create_version2(self, value_type: models.ValueType.asType, value_json: Any) -> "Version":
-        """Create a new version."""
+    def create_version2(
+        self,
+        value_type: models.ValueType.asType,
+        value_json: Any,
+        expected_revision: Opt[int] = None,
+    ) -> "Version":
+        """Create a new version, if the element is still at the expected revision."""
+        self.bump_revision(expected_revision)
         # Mark all the others versions as "not used"
-        query = self.versions.select(lambda v: v.last is True).for_update()
+        query = self.versions.select(lambda v: v.last is True)
         for version in query:
             version.last = False
         # The database doesn't support "null" in a JSON column.
         # I'll use an empty string for now...
         if value_json is None:
             value_json = ""
+        self.updated_at = helpers.now()
+        previous = self.get_newest_version() if self.name_ref.delta_interval > 1 else None
         # Add the new version
-        return self.versions.create(
+        version = self.versions.create(
             value_type=models.ValueType.to_id(value_type),
-            json=value_json,
+            **Version.columns_for(value_json),
         )
+        self.encode_as_delta(previous, version)
+        return version
 
     def create_version(self, value: SupportedValue) -> "Version":
         """Create a new version with the new value."""
+        self.bump_revision()
         # Mark all the others versions as "not used"
-        query = self.versions.select(lambda ver: ver.last is True).for_update()
+        query = self.versions.select(lambda ver: ver.last is True)
         for version in query:
             version.last = False
+        self.updated_at = helpers.now()
+        previous = self.get_newest_version() if self.name_ref.delta_interval > 1 else None
         # Add the new version
         new_value_type = ValueType.of(value)
-        return self.versions.create(
+        version = self.versions.create(
             value_type=new_value_type,
-            json=value_to_json(new_value_type, value),
+            **Version.columns_for(value_to_json(new_value_type, value)),
         )
+        self.encode_as_delta(previous, version)
+        return version
+
+    def get_newest_version(self) -> Opt["Version"]:
+        """Return the version with the highest id, which is never a delta."""
+        return self.versions.select().order_by(orm.desc(Version.id)).first()
+
+    def encode_as_delta(self, previous: Opt["Version"], version: "Version") -> None:
+        """Store the ``previous`` newest version as a delta from the new ``version``, if it's worth it.
+
+        It's kept whole if the name of the element doesn't opt in, if one of the
+        values isn't a string, or if it would make a run of more than
+        ``delta_interval - 1`` deltas in a row.
+        """
+        interval = self.name_ref.delta_interval
+        if (
+            interval < 2
+            or previous is None
+            or previous.delta
+            or previous.value_type != ValueType.STR
+            or version.value_type != ValueType.STR
+        ):
+            return
+        orm.flush()
+        (run,) = database.select(
+            'SELECT COUNT(*) FROM "Version" WHERE "element" = $element_id AND "id" < $previous_id '
+            'AND "id" > (SELECT COALESCE(MAX("id"), 0) FROM "Version" '
+            '            WHERE "element" = $element_id AND "id" < $previous_id AND NOT "delta")',
+            {"element_id": self.id, "previous_id": previous.id},
+        )
+        if run + 1 >= interval:
+            return
+        delta = deltas.encode(previous.load(), version.load())
+        if delta is not None:
+            previous.store(delta)
+            previous.delta = True
 
     @property
     def last_version(self) -> "Version":
@@ -171,6 +319,10 @@ class Version(database.Entity):
     json = orm.Optional(orm.Json)
     last = orm.Required(bool, default=True)
     creation_date = orm.Required(datetime, default=helpers.now)
+    # The stored value is the delta rebuilding the value from the next version
+    delta = orm.Required(bool, default=False)
+    # The compressed JSON of the large stored values, instead of the json
+    packed = orm.Optional(bytes, nullable=True)
 
     def to_model(self) -> models.VersionModel:
         """Return an VersionModel made with the version data."""
@@ -180,11 +332,64 @@ class Version(database.Entity):
             creation_date=self.creation_date,
             last=self.last,
             value_type=models.ValueType.to_alias(self.value_type),
-            value_json=self.json,
+            value_json=self.get_json(),
+        )
+
+    @staticmethod
+    def columns_for(stored: Any) -> Dict[str, Any]:
+        """Return the json and packed columns storing a value or a delta."""
+        packed = packing.pack(stored)
+        return {"json": "" if packed is not None else stored, "packed": packed}
+
+    def store(self, stored: Any) -> None:
+        """Set the stored value or delta, compressed if it's large."""
+        for (column, value) in self.columns_for(stored).items():
+            setattr(self, column, value)
+
+    def load(self) -> Any:
+        """Return the stored value or delta, decompressed if needed."""
+        return self.json if self.packed is None else packing.unpack(self.packed)
+
+    def get_json(self) -> Any:
+        """Return the JSON value, rebuilt from the next versions if it's stored as a delta.
+
+        The next full value is at most ``delta_interval - 1`` versions away.
+        A BrokenHistory is raised if there is none.
+        """
+        if not self.delta:
+            return self.load()
+        orm.flush()
+        chain = [self.load()]
+        value = None
+        cursor = database.execute(
+            'SELECT "json", "packed", "delta" FROM "Version" '
+            'WHERE "element" = $element_id AND "id" > $version_id ORDER BY "id"',
+            {"element_id": self.element.id, "version_id": self.id},
         )
+        for (raw_json, packed, delta) in cursor:
+            stored = json.loads(raw_json) if packed is None else packing.unpack(packed)
+            if not delta:
+                value = stored
+                break
+            chain.append(stored)
+        else:
+            raise exceptions.BrokenHistory(self.element.id, self.id)
+        for delta in reversed(chain):
+            value = deltas.apply(delta, value)
+        return value
 
     def get_value(self) -> SupportedValue:
-        return json_to_value(self.value_type, self.json)
+        return json_to_value(self.value_type, self.get_json())
+
+    def expand_previous(self) -> None:
+        """Store the full value of the previous version if it's a delta from this one.
+
+        It must be called before this version is modified or deleted.
+        """
+        previous = self.element.versions.select(lambda v: v.id < self.id).order_by(orm.desc(Version.id)).first()
+        if previous is not None and previous.delta:
+            previous.store(previous.get_json())
+            previous.delta = False
 
 
 class Link(database.Entity):
@@ -193,6 +398,7 @@ class Link(database.Entity):
     end = orm.Required(Edium)
     directed = orm.Required(bool)
     label = orm.Optional(str)
+    updated_at = orm.Required(datetime, default=helpers.now, index=True)
 
     def to_model(self) -> models.LinkModel:
         """Return a LinkModel made with the link data."""
@@ -202,11 +408,138 @@ class Link(database.Entity):
             end=self.end.id,
             directed=self.directed,
             label=self.label,
+            updated_at=self.updated_at,
+        )
+
+    def bury(self) -> None:
+        """Record the tombstone of the link, before deleting it."""
+        record_deletion("link", self.id)
+
+
+class Change(database.Entity):
+    """A record of a modification, to let the clients sync incrementally.
+
+    The ids are increasing sequence numbers. The deletion of an edium implies
+    the deletion of its elements and links, and the deletion of an element
+    implies the deletion of its versions. A new version implies that the
+    previous versions of its element aren't the last anymore.
+    """
+    table = orm.Required(str)
+    object_id = orm.Required(int)
+    operation = orm.Required(str)
+    creation_date = orm.Required(datetime, default=helpers.now)
+
+    def to_model(self) -> models.ChangeModel:
+        """Return a ChangeModel made with the change data."""
+        return models.ChangeModel(
+            id=self.id,
+            table=self.table,
+            object_id=self.object_id,
+            operation=self.operation,
+            creation_date=self.creation_date,
+        )
+
+
+def record_change(table: str, object_id: int, operation: models.ChangeOperation.asType) -> None:
+    """Add a change to the feed, in the current transaction."""
+    Change(table=table, object_id=object_id, operation=operation)
+
+
+class Tombstone(database.Entity):
+    """A record of a deleted edium, element or link, for the mirrors."""
+    table = orm.Required(str)
+    object_id = orm.Required(int)
+    deletion_date = orm.Required(datetime, default=helpers.now, index=True)
+
+    def to_model(self) -> models.TombstoneModel:
+        """Return a TombstoneModel made with the tombstone data."""
+        return models.TombstoneModel(
+            table=self.table,
+            object_id=self.object_id,
+            deletion_date=self.deletion_date,
+        )
+
+
+def record_deletion(table: str, object_id: int) -> None:
+    """Add a tombstone, in the current transaction."""
+    Tombstone(table=table, object_id=object_id)
+
+
+class Kind(database.Entity):
+    """The number of edia of each kind.
+
+    The counts are kept by triggers on the Edium table, so every write, from
+    the ORM or in raw SQL, updates them in its own transaction. A kind is
+    removed when its last edium is, and the edia without a kind aren't
+    counted.
+    """
+    name = orm.PrimaryKey(str)
+    size = orm.Required(int)
+
+    def to_model(self) -> models.KindModel:
+        """Return a KindModel made with the kind data."""
+        return models.KindModel(name=self.name, size=self.size)
+
+
+_KIND_TRIGGERS = (
+    'CREATE TRIGGER IF NOT EXISTS "kind_count_insert" AFTER INSERT ON "Edium" WHEN new."kind" != \'\' BEGIN '
+    '  INSERT INTO "Kind" ("name", "size") VALUES (new."kind", 1) '
+    '  ON CONFLICT ("name") DO UPDATE SET "size" = "size" + 1; '
+    "END",
+    'CREATE TRIGGER IF NOT EXISTS "kind_count_delete" AFTER DELETE ON "Edium" WHEN old."kind" != \'\' BEGIN '
+    '  UPDATE "Kind" SET "size" = "size" - 1 WHERE "name" = old."kind"; '
+    '  DELETE FROM "Kind" WHERE "name" = old."kind" AND "size" <= 0; '
+    "END",
+    'CREATE TRIGGER IF NOT EXISTS "kind_count_update" AFTER UPDATE OF "kind" ON "Edium" '
+    'WHEN old."kind" IS NOT new."kind" BEGIN '
+    '  UPDATE "Kind" SET "size" = "size" - 1 WHERE "name" = old."kind"; '
+    '  DELETE FROM "Kind" WHERE "name" = old."kind" AND "size" <= 0; '
+    '  INSERT INTO "Kind" ("name", "size") SELECT new."kind", 1 WHERE new."kind" != \'\' '
+    '  ON CONFLICT ("name") DO UPDATE SET "size" = "size" + 1; '
+    "END",
+)
+
+
+def install_kind_counts() -> None:
+    """Add the triggers counting the edia per kind, once the tables exist.
+
+    The first time, the edia already there are counted.
+    """
+    with orm.db_session:
+        if database.exists(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'kind_count_update'"
+        ):
+            return
+        database.execute('DELETE FROM "Kind"')
+        database.execute(
+            'INSERT INTO "Kind" ("name", "size") SELECT "kind", COUNT(*) FROM "Edium" WHERE "kind" != \'\' GROUP BY "kind"'
         )
+        for trigger in _KIND_TRIGGERS:
+            database.execute(trigger)
+
+
+class TitleTrigram(database.Entity):
+    """A trigram of the title of an edium, for the fuzzy search.
+
+    It's a derived index, kept up to date from the change feed by
+    ``storage.trigrams``. The edium isn't a reference, so deleting edia
+    doesn't need to touch this table.
+    """
+    edium_id = orm.Required(int)
+    trigram = orm.Required(str, index=True)
+    orm.PrimaryKey(edium_id, trigram)
+
+
+class IndexPosition(database.Entity):
+    """The last change applied to a derived index."""
+    name = orm.PrimaryKey(str)
+    change_id = orm.Required(int)
 
 
 def use_database(file_path: Path, debug: bool = False) -> None:
     logger.info("Use the database at %s", file_path)
+    migrations.upgrade(file_path)
     database.bind(provider="sqlite", filename=str(file_path), create_db=True)
     database.generate_mapping(create_tables=True)
+    install_kind_counts()
     orm.set_sql_debug(debug)
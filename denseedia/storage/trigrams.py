@@ -0,0 +1,214 @@
+"""Search the edia by similar titles, with an index of their trigrams.
+
+The titles are lowercased and split in words, and each word padded like
+``"  word "`` gives its trigrams. The similarity of two titles is the Jaccard
+index of their trigram sets.
+
+The index is derived from the titles : ``refresh`` applies the change feed to
+it, and runs in the transaction of each write of the API (see ``api.writes``),
+so every write path keeps it right without knowing about it. The reads never
+write : the edia changed since the last refresh, like by the CLI, are
+compared too, so the results don't depend on the lag of the index. The
+functions of this module are meant to be used inside a ``db_session``.
+
+Both the search and the duplicate detection use prefix filtering : if two
+sets have a similarity of at least ``t``, they share one of the
+``size - ceil(t * size) + 1`` rarest trigrams of each set. Only the edia
+sharing such a trigram are compared. The frequencies come from the index :
+any order of the trigrams is right, the rarest first is only the fastest.
+"""
+
+import json
+import math
+import re
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, Iterable, List, NamedTuple, Optional as Opt, Set, Tuple
+
+from .rows import timestamp_to_iso
+from .tables import database
+
+INDEX_NAME = "title_trigrams"
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+class DuplicatePair(NamedTuple):
+    first_id: int
+    second_id: int
+    similarity: float
+
+
+def trigrams(title: str) -> FrozenSet[str]:
+    """Return the set of trigrams of a title."""
+    found: Set[str] = set()
+    for word in _WORD_PATTERN.findall(title.lower()):
+        padded = f"  {word} "
+        found.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return frozenset(found)
+
+
+def similarity(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    if not first or not second:
+        return 0.0
+    shared = len(first & second)
+    return shared / (len(first) + len(second) - shared)
+
+
+def prefix_length(size: int, threshold: float) -> int:
+    """Return how many of the rarest trigrams of a set a similar set shares at least one of."""
+    return size - math.ceil(threshold * size - 1e-9) + 1
+
+
+def _index_titles(rows: Iterable[Any]) -> None:
+    database.get_connection().executemany(
+        'INSERT INTO "TitleTrigram" ("edium_id", "trigram") VALUES (?, ?)',
+        ((edium_id, trigram) for (edium_id, title) in rows for trigram in trigrams(title)),
+    )
+
+
+def _position() -> Opt[int]:
+    """Return the last change applied to the index, or None if it isn't built."""
+    position = database.select('SELECT "change_id" FROM "IndexPosition" WHERE "name" = $name', {"name": INDEX_NAME})
+    return position[0] if position else None
+
+
+def refresh() -> None:
+    """Apply the changes made to the edia since the last refresh.
+
+    The whole index is built the first time.
+    """
+    position = _position()
+    last_change = database.select('SELECT COALESCE(MAX("id"), 0) FROM "Change"')[0]
+    if position == last_change:
+        return
+    if position is None:
+        database.execute('DELETE FROM "TitleTrigram"')
+        _index_titles(database.execute('SELECT "id", "title" FROM "Edium"'))
+        database.execute(
+            'INSERT INTO "IndexPosition" ("name", "change_id") VALUES ($name, $last_change)',
+            {"name": INDEX_NAME, "last_change": last_change},
+        )
+        return
+    params = {"name": INDEX_NAME, "since": position, "last_change": last_change}
+    changed = 'SELECT "object_id" FROM "Change" WHERE "id" > $since AND "id" <= $last_change AND "table" = \'edium\''
+    database.execute(f'DELETE FROM "TitleTrigram" WHERE "edium_id" IN ({changed})', params)
+    _index_titles(database.execute(f'SELECT "id", "title" FROM "Edium" WHERE "id" IN ({changed})', params))
+    database.execute('UPDATE "IndexPosition" SET "change_id" = $last_change WHERE "name" = $name', params)
+
+
+def _edium_dict(row: Any, score: float) -> Dict[str, Any]:
+    (id_, title, kind, creation_date, updated_at) = row
+    return {
+        "id": id_,
+        "title": title,
+        "kind": kind,
+        "creation_date": timestamp_to_iso(creation_date),
+        "updated_at": timestamp_to_iso(updated_at),
+        "similarity": round(score, 4),
+    }
+
+
+def search(query: str, kind: Opt[str] = None, threshold: float = 0.3, limit: int = 20) -> List[Dict[str, Any]]:
+    """Return the edia with a title similar to ``query``, the most similar first.
+
+    Each edium comes with its ``similarity``, at least ``threshold``.
+    """
+    wanted = trigrams(query)
+    if not wanted:
+        return []
+    frequencies = dict(database.select(
+        'SELECT "trigram", COUNT(*) FROM "TitleTrigram" '
+        'WHERE "trigram" IN (SELECT value FROM json_each($wanted)) GROUP BY "trigram"',
+        {"wanted": json.dumps(sorted(wanted))},
+    ))
+    # A trigram missing from the index is the rarest : no edium has it
+    rarest = sorted(wanted, key=lambda trigram: (frequencies.get(trigram, 0), trigram))
+    prefix = rarest[:prefix_length(len(wanted), threshold)]
+    position = _position()
+    if position is None:
+        # Without the index, every edium is a candidate
+        candidates = "1"
+    else:
+        # The edia changed since the last refresh may have new trigrams
+        candidates = (
+            '("id" IN (SELECT "edium_id" FROM "TitleTrigram" WHERE "trigram" IN (SELECT value FROM json_each($prefix))) '
+            'OR "id" IN (SELECT "object_id" FROM "Change" WHERE "id" > $since AND "table" = \'edium\'))'
+        )
+    kind_filter = 'AND "kind" = $kind ' if kind is not None else ""
+    cursor = database.execute(
+        f'SELECT "id", "title", "kind", "creation_date", "updated_at" FROM "Edium" WHERE {candidates} {kind_filter}',
+        {"prefix": json.dumps(prefix), "since": position, "kind": kind},
+    )
+    scored = [(similarity(wanted, trigrams(row[1])), row) for row in cursor]
+    matches = sorted(
+        ((score, row) for (score, row) in scored if score >= threshold),
+        key=lambda pair: (-pair[0], pair[1][0]),
+    )
+    return [_edium_dict(row, score) for (score, row) in matches[:limit]]
+
+
+def _frequencies() -> Dict[str, int]:
+    return dict(database.select('SELECT "trigram", COUNT(*) FROM "TitleTrigram" GROUP BY "trigram"'))
+
+
+def duplicates(kind: str, threshold: float = 0.6) -> List[DuplicatePair]:
+    """Return the pairs of edia of a kind with similar titles, the most similar first.
+
+    The edia are visited from the smallest trigram set, and each one is
+    compared to the previous ones sharing a trigram of its prefix (PPJoin).
+    """
+    titles = [
+        (row[0], trigrams(row[1]))
+        for row in database.execute('SELECT "id", "title" FROM "Edium" WHERE "kind" = $kind', {"kind": kind})
+    ]
+    # The trigrams are numbered from the rarest. The ones missing from the
+    # index, of titles changed since its last refresh, come first.
+    frequencies = _frequencies()
+    every: Set[str] = set().union(*(found for (_, found) in titles))
+    ranks = {trigram: rank for (rank, trigram) in enumerate(sorted(every, key=lambda key: (frequencies.get(key, 0), key)))}
+    entries = sorted(
+        (len(found), edium_id, frozenset(ranks[trigram] for trigram in found))
+        for (edium_id, found) in titles
+        if found
+    )
+    # For each trigram, the previous edia having it in their indexed prefix,
+    # with its position there. As they come by size, the ones too small for
+    # the current edium are skipped for good.
+    seen: Dict[int, List[Tuple[int, int]]] = defaultdict(list)
+    starts: Dict[int, int] = defaultdict(int)
+    pairs = []
+    for (position, (size, edium_id, found)) in enumerate(entries):
+        ordered = sorted(found)
+        minimum_size = threshold * size - 1e-9
+        # The trigrams shared with each candidate so far, or -1 once it can't
+        # share enough of them anymore
+        overlaps: Dict[int, int] = {}
+        for (rank, trigram) in enumerate(ordered[:prefix_length(size, threshold)]):
+            others = seen.get(trigram)
+            if not others:
+                continue
+            start = starts[trigram]
+            while start < len(others) and entries[others[start][0]][0] < minimum_size:
+                start += 1
+            starts[trigram] = start
+            for (other, other_rank) in others[start:]:
+                overlap = overlaps.get(other, 0)
+                if overlap < 0:
+                    continue
+                other_size = entries[other][0]
+                needed = math.ceil(threshold / (1 + threshold) * (size + other_size) - 1e-9)
+                if overlap + 1 + min(size - rank - 1, other_size - other_rank - 1) >= needed:
+                    overlaps[other] = overlap + 1
+                else:
+                    overlaps[other] = -1
+        for (other, overlap) in overlaps.items():
+            if overlap > 0:
+                other_found = entries[other][2]
+                shared = len(found & other_found)
+                score = shared / (size + len(other_found) - shared)
+                if score >= threshold:
+                    (first_id, second_id) = sorted((edium_id, entries[other][1]))
+                    pairs.append(DuplicatePair(first_id, second_id, round(score, 4)))
+        # The next edia are as big, so a similar one shares a shorter prefix
+        for (rank, trigram) in enumerate(ordered[:prefix_length(size, 2 * threshold / (1 + threshold))]):
+            seen[trigram].append((position, rank))
+    return sorted(pairs, key=lambda pair: (-pair.similarity, pair.first_id, pair.second_id))
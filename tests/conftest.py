@@ -0,0 +1,10 @@
+import pytest
+
+from denseedia.storage import tables
+
+
+@pytest.fixture(scope="session")
+def database(tmp_path_factory):
+    """Bind the database to a temporary file, once for the whole session."""
+    tables.use_database(tmp_path_factory.mktemp("db") / "test.db")
+    return tables.database
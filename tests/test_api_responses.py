@@ -0,0 +1,59 @@
+from fastapi.testclient import TestClient
+
+from denseedia import models
+from denseedia.api import operations
+from denseedia.api.app import app
+from denseedia.api.compression import choose_encoder_class, GzipEncoder
+from denseedia.api.responses import COLUMNAR_MEDIA_TYPE, parse_quality_header, parse_refused_values, to_columnar
+
+
+def test_parse_quality_header():
+    assert parse_quality_header(None) == []
+    assert parse_quality_header("gzip, br") == ["gzip", "br"]
+    assert parse_quality_header("gzip;q=0.5, br") == ["br", "gzip"]
+    assert parse_quality_header("text/html, application/json;q=0") == ["text/html"]
+    assert parse_quality_header("Application/JSON ; q=0.9 , */*;q=0.1") == ["application/json", "*/*"]
+    assert parse_refused_values("gzip;q=0, *, br;q=0.0") == {"gzip", "br"}
+
+
+def test_choose_encoder_class():
+    assert choose_encoder_class("identity") is None
+    assert choose_encoder_class("*") is GzipEncoder
+    assert choose_encoder_class("gzip;q=0.5") is GzipEncoder
+    assert choose_encoder_class("gzip;q=0, *") is None
+    assert choose_encoder_class("*, gzip;q=0") is None
+
+
+def test_to_columnar():
+    assert to_columnar([]) == {"columns": [], "rows": []}
+    rows = [
+        {"id": 1, "versions": [{"id": 3, "last": True}]},
+        {"id": 2, "versions": []},
+    ]
+    assert to_columnar(rows) == {
+        "columns": ["id", "versions"],
+        "rows": [
+            [1, {"columns": ["id", "last"], "rows": [[3, True]]}],
+            [2, {"columns": [], "rows": []}],
+        ],
+    }
+
+
+def test_negotiation(database):
+    for index in range(50):
+        operations.create_one_edium(models.CreateEdiumModel(title=f"Negotiated {index}", kind="test"))
+    client = TestClient(app)
+
+    plain = client.get("/edium", headers={"Accept-Encoding": "identity"})
+    assert plain.headers["content-type"] == "application/json"
+    assert "content-encoding" not in plain.headers
+
+    columnar = client.get("/edium", headers={"Accept": COLUMNAR_MEDIA_TYPE, "Accept-Encoding": "identity"})
+    assert columnar.headers["content-type"] == COLUMNAR_MEDIA_TYPE
+    content = columnar.json()
+    assert [dict(zip(content["columns"], row)) for row in content["rows"]] == plain.json()
+
+    compressed = client.get("/edium", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert int(compressed.headers["content-length"]) < len(plain.content)
+    assert compressed.json() == plain.json()
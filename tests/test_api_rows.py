@@ -0,0 +1,52 @@
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import parse_obj_as
+
+from denseedia import models
+from denseedia.api import operations
+from denseedia.api.responses import TrustedJSONResponse
+
+
+def _validated_body(model_type, content) -> bytes:
+    """Encode the content like FastAPI does with a response_model."""
+    validated = parse_obj_as(model_type, content)
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def test_rows_are_byte_identical(database):
+    edium = operations.create_one_edium(models.CreateEdiumModel(title="Portal é", kind="game"))
+    other = operations.create_one_edium(models.CreateEdiumModel(title="Portal 2"))
+    operations.create_one_link(
+        models.CreateLinkModel(start=edium.id, end=other.id, directed=True, label="sequel")
+    )
+    values = [
+        ("str", "Lyrics ♪"),
+        ("int", 10),
+        ("float", 9.5),
+        ("float", 2.0),
+        ("bool", True),
+        ("none", None),
+        ("datetime", "2022-01-02T03:04:05"),
+    ]
+    for (index, (value_type, value_json)) in enumerate(values):
+        element = operations.create_one_element(edium.id, models.CreateElementModel(
+            name=f"element{index}",
+            version=models.CreateVersionModel(value_type=value_type, value_json=value_json),
+        ))
+        operations.create_one_version(
+            element.id,
+            models.CreateVersionModel(value_type=value_type, value_json=value_json),
+        )
+
+    assert TrustedJSONResponse(operations.get_all_edia_rows()).body == _validated_body(
+        List[models.EdiumModel], operations.get_all_edia()
+    )
+    assert TrustedJSONResponse(operations.get_all_links_rows()).body == _validated_body(
+        List[models.LinkModel], operations.get_all_links()
+    )
+    for mode in ("none", "single", "all"):
+        fast = operations.get_elements_of_one_edium_rows(edium.id, mode)
+        slow = operations.get_elements_of_one_edium(edium.id, mode)
+        assert TrustedJSONResponse(fast).body == _validated_body(List[models.ElementModel], slow)
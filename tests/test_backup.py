@@ -0,0 +1,57 @@
+import gzip
+import sqlite3
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from denseedia import models
+from denseedia.api import operations
+from denseedia.api.app import app
+from denseedia.storage import backup
+
+
+@pytest.fixture
+def backup_directory(tmp_path):
+    backup.configure(tmp_path)
+    yield tmp_path
+    backup.configure(None)
+
+
+def test_backup_while_open(database, backup_directory):
+    edium = operations.create_one_edium(models.CreateEdiumModel(title="Saved"))
+
+    report = operations.backup_database(models.BackupModel(destination="copy.db.gz", compress=True))
+    destination = backup_directory / "copy.db.gz"
+    assert report.destination == str(destination)
+    assert report.verified and report.compressed
+    assert report.pages > 0
+    assert not (backup_directory / "copy.db.gz.partial").exists()
+
+    restored = backup_directory / "restored.db"
+    restored.write_bytes(gzip.decompress(destination.read_bytes()))
+    connection = sqlite3.connect(str(restored))
+    try:
+        titles = [title for (title,) in connection.execute('SELECT "title" FROM "Edium" WHERE "id" = ?', (edium.id,))]
+    finally:
+        connection.close()
+    assert titles == ["Saved"]
+
+
+def test_backups_stay_in_their_folder(database, backup_directory):
+    client = TestClient(app)
+    outside = backup_directory.parent / "outside.db"
+    for destination in ["../outside.db", str(outside)]:
+        response = client.post("/admin/backup", json={"destination": destination})
+        assert response.status_code == 403
+    assert not outside.exists()
+    (backup_directory / "daily").mkdir()
+    assert client.post("/admin/backup", json={"destination": "daily/copy.db"}).status_code == 200
+
+    database_file = Path(database.provider.pool.filename)
+    backup.configure(database_file.parent)
+    for suffix in ["", "-wal"]:
+        response = client.post("/admin/backup", json={"destination": database_file.name + suffix})
+        assert response.status_code == 403
+    backup.configure(None)
+    assert client.post("/admin/backup", json={"destination": "copy.db"}).status_code == 403
@@ -0,0 +1,40 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from denseedia import exceptions, models
+from denseedia.api import operations
+from denseedia.api.app import app
+
+
+def test_bulk_modify_and_delete_edia(database):
+    for index in range(3):
+        operations.create_one_edium(models.CreateEdiumModel(title=f"Bulk {index}", kind="bulk-old"))
+    since = operations.get_changes_rows(0, 100000)[-1]["id"]
+
+    rename = models.ModifyEdiumModel(kind="bulk-new")
+    assert operations.modify_edia_by_filter("bulk-old", None, rename, dry_run=True).count == 3
+    assert operations.modify_edia_by_filter("bulk-old", None, rename, dry_run=False).count == 3
+    assert operations.modify_edia_by_filter("bulk-old", None, rename, dry_run=True).count == 0
+
+    assert operations.delete_edia_by_filter("bulk-new", "Bulk 1", dry_run=False).count == 1
+    assert sorted(edium["title"] for edium in operations.get_all_edia_rows() if edium["kind"] == "bulk-new") == [
+        "Bulk 0",
+        "Bulk 2",
+    ]
+    operations_recorded = [change["operation"] for change in operations.get_changes_rows(since, 100)]
+    assert operations_recorded == ["modify"] * 3 + ["delete"]
+
+    with pytest.raises(exceptions.MissingFilter):
+        operations.delete_edia_by_filter(None, None, dry_run=True)
+
+
+def test_bulk_modifications_need_a_new_value(database):
+    client = TestClient(app)
+    operations.create_one_edium(models.CreateEdiumModel(title="Untouched", kind="bulk-empty"))
+    since = operations.get_changes_rows(0, 100000)[-1]["id"]
+
+    assert client.patch("/edium?kind=bulk-empty", json={}).status_code == 400
+    assert client.patch("/link?label=bulk-empty", json={}).status_code == 400
+    with pytest.raises(exceptions.MissingModification):
+        operations.modify_edia_by_filter("bulk-empty", None, models.ModifyEdiumModel(), dry_run=True)
+    assert operations.get_changes_rows(since, 100) == []
@@ -0,0 +1,85 @@
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from denseedia import models
+from denseedia.api import operations
+from denseedia.api.app import app
+from denseedia.api.cache import ResponseCache
+from denseedia.storage import bulk
+from denseedia.storage.tables import orm
+
+
+def _validated_body(model) -> bytes:
+    return JSONResponse(jsonable_encoder(model)).body
+
+
+def _create_element(edium_id: int, name: str, value: int) -> models.ElementModel:
+    return operations.create_one_element(edium_id, models.CreateElementModel(
+        name=name,
+        version=models.CreateVersionModel(value_type="int", value_json=value),
+    ))
+
+
+def test_cached_bodies_are_byte_identical(database):
+    edium = operations.create_one_edium(models.CreateEdiumModel(title="Cached é", kind="book"))
+    other = operations.create_one_edium(models.CreateEdiumModel(title="Other"))
+    element = _create_element(edium.id, "pages", 300)
+    link = operations.create_one_link(models.CreateLinkModel(start=edium.id, end=other.id, directed=False, label="see"))
+
+    for _ in range(2):  # A miss, then a hit
+        assert operations.get_one_edium_body(edium.id) == _validated_body(operations.get_one_edium(edium.id))
+        assert operations.get_one_link_body(link.id) == _validated_body(operations.get_one_link(link.id))
+        for mode in ("none", "single", "all"):
+            assert operations.get_one_element_body(element.id, mode) == _validated_body(
+                operations.get_one_element(element.id, mode)
+            )
+
+
+def test_writes_invalidate_the_cache(database):
+    client = TestClient(app)
+    edium = operations.create_one_edium(models.CreateEdiumModel(title="Before"))
+    other = operations.create_one_edium(models.CreateEdiumModel(title="Cache target"))
+    element = _create_element(edium.id, "rating", 5)
+    link = operations.create_one_link(models.CreateLinkModel(start=edium.id, end=other.id, directed=True, label="a"))
+
+    before = client.get("/stats/cache").json()
+    assert client.get(f"/element/{element.id}?versions=single").json()["versions"][0]["value_json"] == 5
+    assert client.get(f"/element/{element.id}?versions=single").json()["versions"][0]["value_json"] == 5
+    stats = client.get("/stats/cache").json()
+    assert (stats["hits"] - before["hits"], stats["misses"] - before["misses"]) == (1, 1)
+
+    # By the write operations
+    operations.create_one_version(element.id, models.CreateVersionModel(value_type="int", value_json=8))
+    assert client.get(f"/element/{element.id}?versions=single").json()["versions"][0]["value_json"] == 8
+    assert client.get(f"/edium/{edium.id}").json()["title"] == "Before"
+    operations.modify_one_edium(edium.id, models.ModifyEdiumModel(title="After"))
+    assert client.get(f"/edium/{edium.id}").json()["title"] == "After"
+
+    # By the change feed, for the bulk writes made outside of the operations
+    assert client.get(f"/link/{link.id}").json()["label"] == "a"
+    with orm.db_session:
+        bulk.modify_links("a", "b")
+    assert client.get(f"/link/{link.id}").json()["label"] == "b"
+    with orm.db_session:
+        bulk.delete_edia(None, "Cache target")
+    assert client.get(f"/link/{link.id}").status_code == 404
+    assert client.get(f"/edium/{other.id}").status_code == 404
+
+
+def test_least_recently_used_objects_are_evicted(database):
+    cache = ResponseCache(2 * len(b'{"id":1}'))
+
+    def fetch(object_id):
+        return cache.fetch("edium", object_id, "", lambda: {"id": object_id})
+
+    fetch(0)
+    fetch(1)
+    fetch(0)
+    fetch(2)  # Evicts the edium 1
+    fetch(0)
+    stats = cache.stats()
+    assert (stats.entries, stats.hits, stats.misses, stats.evictions) == (2, 2, 3, 1)
+    assert stats.size <= stats.max_size
+    cache.resize(0)
+    assert (cache.stats().entries, cache.stats().size) == (0, 0)
@@ -0,0 +1,95 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from denseedia import models
+from denseedia.api import events, operations
+from denseedia.storage.tables import Edium, Element, Link, orm
+
+
+def _changes_since(since: int):
+    return [
+        (change["table"], change["object_id"], change["operation"])
+        for change in operations.get_changes_rows(since, 1000)
+    ]
+
+
+def test_change_feed(database):
+    changes = operations.get_changes_rows(0, 1000)
+    since = changes[-1]["id"] if changes else 0
+
+    edium = operations.create_one_edium(models.CreateEdiumModel(title="Feed"))
+    other = operations.create_one_edium(models.CreateEdiumModel(title="Feed 2"))
+    operations.modify_one_edium(edium.id, models.ModifyEdiumModel(kind="test"))
+    element = operations.create_one_element(edium.id, models.CreateElementModel(
+        name="rating",
+        version=models.CreateVersionModel(value_type="int", value_json=1),
+    ))
+    version = operations.create_one_version(element.id, models.CreateVersionModel(value_type="int", value_json=2))
+    link = operations.create_one_link(models.CreateLinkModel(start=edium.id, end=other.id, directed=True, label=""))
+    operations.delete_one_version(version.id)
+    operations.delete_one_edium(edium.id)
+
+    assert _changes_since(since) == [
+        ("edium", edium.id, "create"),
+        ("edium", other.id, "create"),
+        ("edium", edium.id, "modify"),
+        ("element", element.id, "create"),
+        ("version", element.versions[0].id, "create"),
+        ("version", version.id, "create"),
+        ("link", link.id, "create"),
+        ("version", version.id, "delete"),
+        ("edium", edium.id, "delete"),
+    ]
+    # Catching up with pages
+    first_page = operations.get_changes_rows(since, 4)
+    assert len(first_page) == 4
+    assert operations.get_changes_rows(first_page[-1]["id"], 1000)[0]["id"] == first_page[-1]["id"] + 1
+
+
+def test_change_events(database):
+    operations.create_one_edium(models.CreateEdiumModel(title="Streamed"))
+    last = operations.get_changes_rows(0, 1000)[-1]
+
+    async def first_event():
+        stream = events.change_events(last["id"] - 1)
+        event = await stream.__anext__()
+        await stream.aclose()
+        return event
+
+    event = asyncio.run(first_event())
+    (id_line, event_line, data_line, _, _) = event.split("\n")
+    assert id_line == f"id: {last['id']}"
+    assert event_line == "event: change"
+    assert json.loads(data_line[len("data: "):]) == last
+
+
+def test_sync(database):
+    old = operations.create_one_edium(models.CreateEdiumModel(title="Old"))
+    other = operations.create_one_edium(models.CreateEdiumModel(title="Other"))
+    link = operations.create_one_link(models.CreateLinkModel(start=old.id, end=other.id, directed=True, label=""))
+    element = operations.create_one_element(other.id, models.CreateElementModel(
+        name="rating",
+        version=models.CreateVersionModel(value_type="int", value_json=1),
+    ))
+    since = operations.get_sync_rows(old.creation_date)["until"]
+    # Make sure the next modifications are at least one second later
+    with orm.db_session:
+        for table in (Edium, Element, Link):
+            for obj in table.select():
+                obj.updated_at -= timedelta(seconds=1)
+
+    operations.modify_one_edium(other.id, models.ModifyEdiumModel(kind="test"))
+    operations.create_one_version(element.id, models.CreateVersionModel(value_type="int", value_json=2))
+    operations.delete_one_edium(old.id)
+
+    content = operations.get_sync_rows(datetime.fromisoformat(since))
+    assert [edium["id"] for edium in content["edia"]] == [other.id]
+    assert [element["id"] for element in content["elements"]] == [element.id]
+    assert [version["value_json"] for version in content["elements"][0]["versions"]] == [1, 2]
+    assert content["links"] == []
+    # The tombstones of the previous tests may be there too
+    assert [(tomb["table"], tomb["object_id"]) for tomb in content["tombstones"]][-2:] == [
+        ("link", link.id),
+        ("edium", old.id),
+    ]
@@ -0,0 +1,82 @@
+from denseedia import models
+from denseedia.api import operations
+from denseedia.storage.tables import database, Edium, Element, orm, record_change
+
+
+def _make_edium(title: str) -> int:
+    """Create an edium with versioned elements, and links in, out and to itself."""
+    edium = operations.create_one_edium(models.CreateEdiumModel(title=title))
+    other = operations.create_one_edium(models.CreateEdiumModel(title=f"{title} other"))
+    for name in ("rating", "comment"):
+        element = operations.create_one_element(edium.id, models.CreateElementModel(
+            name=name,
+            version=models.CreateVersionModel(value_type="int", value_json=0),
+        ))
+        for value in range(1, 4):
+            operations.create_one_version(element.id, models.CreateVersionModel(value_type="int", value_json=value))
+    for (start, end) in ((edium.id, other.id), (other.id, edium.id), (edium.id, edium.id)):
+        operations.create_one_link(models.CreateLinkModel(start=start, end=end, directed=True, label=""))
+    return edium.id
+
+
+def _snapshot(edium_id: int):
+    """Return the model of an edium, with the ids of its related rows."""
+    with orm.db_session:
+        edium = Edium[edium_id]
+        return (
+            edium.to_model(),
+            [element.to_model() for element in edium.elements.order_by(Element.id)],
+            {link.id for link in set(edium.links_out) | set(edium.links_in)},
+        )
+
+
+def _state_after(edium_id: int, element_ids, link_ids, since: int):
+    """Describe what's left of the edium, in the same terms for both paths."""
+    ids = {"edium": {edium_id}, "element": set(element_ids), "link": set(link_ids)}
+    with orm.db_session:
+        tombstones = database.select('SELECT "table", "object_id" FROM "Tombstone" WHERE "id" > $since', {"since": since})
+        left = database.select(
+            'SELECT COUNT(*) FROM "Version" WHERE "element" IN (SELECT value FROM json_each($ids))',
+            {"ids": str(sorted(element_ids))},
+        )[0]
+        changes = database.select('SELECT "table", "operation" FROM "Change" ORDER BY "id" DESC LIMIT 1')
+    return (
+        sorted(table for (table, _) in tombstones),
+        all(object_id in ids[table] for (table, object_id) in tombstones),
+        left,
+        changes,
+    )
+
+
+def _last_tombstone() -> int:
+    with orm.db_session:
+        return database.select('SELECT COALESCE(MAX("id"), 0) FROM "Tombstone"')[0]
+
+
+def test_set_based_edium_deletion_matches_orm(database):
+    # Reference : the ORM deletion
+    reference_id = _make_edium("Reference")
+    (reference_model, reference_elements, reference_links) = _snapshot(reference_id)
+    since = _last_tombstone()
+    with orm.db_session:
+        edium = Edium[reference_id]
+        edium.bury()
+        edium.delete()
+        record_change("edium", reference_id, operations.DELETE)
+    expected = _state_after(reference_id, [e.id for e in reference_elements], reference_links, since)
+
+    edium_id = _make_edium("Set-based")
+    (model, elements, links) = _snapshot(edium_id)
+    since = _last_tombstone()
+    assert operations.delete_one_edium(edium_id) == model
+    assert _state_after(edium_id, [e.id for e in elements], links, since) == expected
+    assert expected[0] == ["edium", "element", "element", "link", "link", "link"]
+
+
+def test_set_based_element_deletion(database):
+    edium_id = _make_edium("Element deletion")
+    (_, elements, _) = _snapshot(edium_id)
+    assert operations.delete_one_element(elements[0].id) == elements[0]
+    with orm.db_session:
+        assert not Element.exists(id=elements[0].id)
+        assert [element.id for element in Edium[edium_id].elements] == [elements[1].id]
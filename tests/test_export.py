@@ -0,0 +1,33 @@
+import xml.etree.ElementTree as ElementTree
+
+import pytest
+
+from denseedia import exceptions, models
+from denseedia.api import operations
+from denseedia.storage import export
+
+
+def test_export_neighborhood(database):
+    ids = [
+        operations.create_one_edium(models.CreateEdiumModel(title=title, kind="export")).id
+        for title in ('Say "hi"', "Middle", "Far")
+    ]
+    for (start, end, directed) in ((ids[0], ids[1], True), (ids[1], ids[2], False)):
+        operations.create_one_link(models.CreateLinkModel(start=start, end=end, directed=directed, label="export"))
+
+    dot = "".join(export.export_graph("dot", kind="export", center=ids[0], depth=1))
+    assert f'  {ids[0]} [label="Say \\"hi\\"", kind="export"];\n' in dot
+    assert f"  {ids[0]} -> {ids[1]} [label=\"export\"];\n" in dot
+    assert str(ids[2]) not in dot
+
+    graphml = "".join(export.export_graph("graphml", kind="export", center=ids[2], depth=2))
+    root = ElementTree.fromstring(graphml)
+    namespace = "{http://graphml.graphdrawing.org/xmlns}"
+    assert len(root.findall(f"{namespace}graph/{namespace}node")) == 3
+    assert [edge.get("directed") for edge in root.findall(f"{namespace}graph/{namespace}edge")] == ["true", "false"]
+
+    edges = "".join(export.export_graph("edgelist", label="export")).splitlines()
+    assert edges[1:] == [f"{ids[0]}\t{ids[1]}\t1\texport", f"{ids[1]}\t{ids[2]}\t0\texport"]
+
+    with pytest.raises(exceptions.ObjectNotFound):
+        export.export_graph("dot", center=10 ** 9)
@@ -0,0 +1,23 @@
+from pathlib import Path
+
+from denseedia import models
+from denseedia.api import operations
+from denseedia.storage import backup, federation
+
+
+def test_federated_search_and_neighbors(database, tmp_path):
+    first = operations.create_one_edium(models.CreateEdiumModel(title="Federated first"))
+    second = operations.create_one_edium(models.CreateEdiumModel(title="Federated second"))
+    operations.create_one_link(models.CreateLinkModel(start=first.id, end=second.id, directed=True, label=""))
+    # The attached file is a copy of the bound one
+    team_file = tmp_path / "team.db"
+    backup.backup(team_file)
+    federation.attach("team", Path(team_file))
+
+    ids = [edium["id"] for edium in operations.search_federated_edia("Federated", None, limit=10, offset=0)]
+    assert sorted(ids) == sorted([str(first.id), str(second.id), f"team:{first.id}", f"team:{second.id}"])
+    page = operations.search_federated_edia("Federated", None, limit=2, offset=1)
+    assert [edium["id"] for edium in page] == ids[1:3]
+
+    neighbors = operations.get_federated_neighbors(f"team:{second.id}", depth=2)
+    assert [(edium["id"], edium["distance"]) for edium in neighbors] == [(f"team:{first.id}", 1)]
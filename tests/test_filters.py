@@ -0,0 +1,39 @@
+import pytest
+
+from denseedia import exceptions, models
+from denseedia.api import operations
+from denseedia.storage import filters
+
+
+def titles(text, order="id"):
+    return [edium["title"] for edium in operations.search_edia_by_filter(text, order, 100, 0)]
+
+
+def test_filter_edia(database):
+    ids = {}
+    for (title, kind, rating) in (("Filter Ocarina", "filter-game", 10), ("Filter Majora", "filter-game", 8),
+                                  ("Filter Artbook", "filter-book", None)):
+        ids[title] = operations.create_one_edium(models.CreateEdiumModel(title=title, kind=kind)).id
+        if rating is not None:
+            version = models.CreateVersionModel(value_type="int", value_json=rating)
+            operations.create_one_element(ids[title], models.CreateElementModel(name="filter rating", version=version))
+    operations.create_one_link(models.CreateLinkModel(
+        start=ids["Filter Ocarina"], end=ids["Filter Majora"], directed=True, label="filter-sequel",
+    ))
+
+    assert titles("kind = filter-game", "-title") == ["Filter Ocarina", "Filter Majora"]
+    assert titles("kind = filter-game and \"filter rating\" >= 9") == ["Filter Ocarina"]
+    assert titles("title ~ 'Filter ' not has 'filter rating'") == ["Filter Artbook"]
+    assert titles(f"linked to {ids['Filter Majora']} label filter-sequel") == ["Filter Ocarina"]
+    assert titles(f"linked from {ids['Filter Majora']}") == []
+    assert titles(f"linked {ids['Filter Ocarina']} or (kind = filter-book and created >= 2000-01-01)") == [
+        "Filter Majora", "Filter Artbook",
+    ]
+    # Values of another type never match, nor unknown names
+    assert titles("'filter rating' ~ 1 or unknown = 3") == []
+
+    plan = operations.explain_filter("kind = filter-game", "id", 10, 0)
+    assert any("idx_edium__kind" in step for step in plan.plan)
+
+    with pytest.raises(exceptions.InvalidQuery, match="character 15"):
+        filters.parse("kind = game or")
@@ -0,0 +1,36 @@
+import numpy as np
+
+from denseedia import models
+from denseedia.api import operations
+from denseedia.storage import graph
+
+
+def test_components_and_pagerank():
+    # 0 -> 1 -> 2 -> 0 is a cycle, 3 <- 4 hangs apart, 5 is alone
+    starts = np.array([0, 1, 2, 4])
+    ends = np.array([1, 2, 0, 3])
+    assert graph.connected_components(6, starts, ends).tolist() == [0, 0, 0, 3, 3, 5]
+
+    ranks = graph.pagerank(6, starts, ends)
+    assert abs(ranks.sum() - 1) < 1e-9
+    assert ranks[0] == ranks[1] == ranks[2]
+    assert ranks[3] > ranks[4] == ranks[5]
+
+
+def test_graph_stats_follow_the_writes(database):
+    ids = [operations.create_one_edium(models.CreateEdiumModel(title=f"Node {index}", kind="graph")).id for index in range(3)]
+    link = models.CreateLinkModel(start=ids[0], end=ids[1], directed=False, label="graph")
+    operations.create_one_link(link)
+
+    stats = operations.get_graph_stats("graph", "graph", limit=5)
+    assert (stats["edia"], stats["links"], stats["component_count"]) == (3, 1, 2)
+    assert stats["components"][0] == {"id": ids[0], "size": 2}
+    # An undirected link goes both ways
+    assert [rank["value"] for rank in stats["in_degree"]] == [1, 1, 0]
+    assert stats["orphans"] == [ids[2]]
+    assert ("graph", "graph") in graph.cache.analyses
+
+    operations.create_one_link(models.CreateLinkModel(start=ids[2], end=ids[1], directed=True, label="graph"))
+    stats = operations.get_graph_stats("graph", "graph", limit=5)
+    assert (stats["links"], stats["component_count"], stats["orphans"]) == (2, 1, [])
+    assert stats["in_degree"][0] == {"edium_id": ids[1], "value": 2}
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from denseedia import exceptions, models
+from denseedia.api import operations
+from denseedia.api.app import app
+from denseedia.storage.tables import database, orm, Version
+
+PARAGRAPH = "A long note, edited many times, whose lines mostly stay the same.\n" * 20
+
+
+def _stored(element_id: int):
+    with orm.db_session:
+        return database.select(
+            'SELECT "delta", "last" FROM "Version" WHERE "element" = $element_id ORDER BY "id"',
+            {"element_id": element_id},
+        )
+
+
+def _values(client: TestClient, element_id: int):
+    versions = client.get(f"/element/{element_id}?versions=all").json()["versions"]
+    orm_versions = sorted(operations.get_one_element(element_id, "all").versions, key=lambda version: version.id)
+    assert [version["value_json"] for version in versions] == [version.value_json for version in orm_versions]
+    return [version["value_json"] for version in versions]
+
+
+def test_string_histories_are_stored_as_deltas(database):
+    client = TestClient(app)
+    edium = operations.create_one_edium(models.CreateEdiumModel(title="Delta history"))
+    texts = [f"Version {n}\n{PARAGRAPH}" for n in range(10)]
+    element = operations.create_one_element(edium.id, models.CreateElementModel(
+        name="delta note",
+        version=models.CreateVersionModel(value_type="str", value_json=texts[0]),
+    ))
+    for text in texts[1:5]:
+        operations.create_one_version(element.id, models.CreateVersionModel(value_type="str", value_json=text))
+    assert not any(delta for (delta, _) in _stored(element.id))
+
+    response = client.post("/admin/compact-history?name=delta%20note&interval=4")
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["elements"], report["versions"], report["deltas"]) == (1, 5, 3)
+    assert report["size_after"] < report["size_before"] / 2
+    for text in texts[5:]:
+        operations.create_one_version(element.id, models.CreateVersionModel(value_type="str", value_json=text))
+    stored = _stored(element.id)
+    # A full value every 4 versions, and the last one is whole
+    assert [bool(delta) for (delta, _) in stored] == [1, 1, 1, 0, 1, 1, 1, 0, 1, 0]
+    assert _values(client, element.id) == texts
+    with orm.db_session:
+        assert Version.select(lambda v: v.element.id == element.id).order_by(Version.id).first().get_value() == texts[0]
+
+    versions = client.get(f"/element/{element.id}?versions=all").json()["versions"]
+    operations.modify_one_version(versions[2]["id"], models.CreateVersionModel(value_type="str", value_json="Changed"))
+    operations.delete_one_version(versions[5]["id"])
+    expected = texts[:2] + ["Changed"] + texts[3:5] + texts[6:]
+    assert _values(client, element.id) == expected
+
+    assert client.post("/admin/compact-history?name=delta%20note&interval=0").json()["deltas"] == 0
+    assert not any(delta for (delta, _) in _stored(element.id))
+    assert _values(client, element.id) == expected
+    assert client.post("/admin/compact-history?name=unknown%20name").status_code == 404
+
+
+def test_ingestion_expands_the_delta_it_makes_last(database):
+    client = TestClient(app)
+    edium = operations.create_one_edium(models.CreateEdiumModel(title="Ingested delta history"))
+    element = operations.create_one_element(edium.id, models.CreateElementModel(
+        name="ingested note",
+        version=models.CreateVersionModel(value_type="str", value_json=f"First\n{PARAGRAPH}"),
+    ))
+    assert client.post("/admin/compact-history?name=ingested%20note&interval=4").status_code == 200
+
+    def ingest(creation_date, text):
+        operations.ingest_versions([models.ElementVersionSeriesModel(
+            element_id=element.id, value_type="str", points=[(creation_date, text)],
+        )])
+
+    future = f"Planned\n{PARAGRAPH}"
+    ingest(datetime.now() + timedelta(days=1), future)
+    operations.create_one_version(element.id, models.CreateVersionModel(value_type="str", value_json=f"Now\n{PARAGRAPH}"))
+    # The future point is stored as a delta from the new version
+    assert [tuple(map(bool, row)) for row in _stored(element.id)[1:]] == [(True, False), (False, True)]
+    ingest(datetime(2020, 1, 1), f"Old\n{PARAGRAPH}")
+
+    # It's the last version again, by its date, and stored whole
+    assert [tuple(map(bool, row)) for row in _stored(element.id)[1:]] == [(False, True), (False, False), (False, False)]
+    (version,) = client.get(f"/element/{element.id}?versions=single").json()["versions"]
+    assert version["value_json"] == future
+    found = operations.search_edia_by_filter("'ingested note' ~ 'Planned'", "id", 10, 0)
+    assert [row["id"] for row in found] == [edium.id]
+
+
+def test_broken_delta_chain(database):
+    edium = operations.create_one_edium(models.CreateEdiumModel(title="Broken delta history"))
+    element = operations.create_one_element(edium.id, models.CreateElementModel(
+        name="broken note",
+        version=models.CreateVersionModel(value_type="str", value_json=f"First\n{PARAGRAPH}"),
+    ))
+    operations.create_one_version(element.id, models.CreateVersionModel(value_type="str", value_json=f"Next\n{PARAGRAPH}"))
+    operations.encode_histories("broken note", 4)
+    # The full value is deleted behind the back of the delta before it
+    with orm.db_session:
+        (first_id, next_id) = database.select(
+            'SELECT "id" FROM "Version" WHERE "element" = $element_id ORDER BY "id"', {"element_id": element.id},
+        )
+        assert Version[first_id].delta
+        database.execute('DELETE FROM "Version" WHERE "id" = $next_id', {"next_id": next_id})
+    with orm.db_session:
+        with pytest.raises(exceptions.BrokenHistory, match=f"version {first_id} of the element {element.id}"):
+            Version[first_id].get_json()
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+import pytest
+from pydantic import ValidationError
+
+from denseedia import exceptions, models
+from denseedia.api import operations
+from denseedia.storage import ingestion
+from denseedia.storage.tables import orm
+
+
+def last_value(element_id):
+    (version,) = operations.get_one_element(element_id, mode="single").versions
+    return version.value_json
+
+
+def test_ingest_versions(database):
+    element = operations.create_one_element(
+        operations.create_one_edium(models.CreateEdiumModel(title="Sensor")).id,
+        models.CreateElementModel(
+            name="temperature", version=models.CreateVersionModel(value_type="float", value_json=20.5),
+        ),
+    )
+    start = datetime(2020, 1, 1)
+    points = [(start + timedelta(hours=hour), 10.0 + hour) for hour in range(48)]
+    series = models.ElementVersionSeriesModel(element_id=element.id, value_type="float", points=points[::-1])
+
+    result = operations.ingest_versions([series])
+    assert (result.elements, result.versions) == (1, 48)
+    # The backfilled points are older than the current value
+    assert last_value(element.id) == 20.5
+
+    later = datetime.now() + timedelta(days=1)
+    operations.ingest_versions([series.copy(update={"points": [(later, 0), (later, 1.5)]})])
+    assert last_value(element.id) == 1.5
+    assert len(operations.get_one_element(element.id, mode="all").versions) == 51
+
+    with pytest.raises(ValidationError, match="Point 1"):
+        models.CreateVersionSeriesModel(value_type="int", points=[(start, 1), (start, "two")])
+    with pytest.raises(exceptions.ObjectNotFound):
+        operations.ingest_versions([series.copy(update={"element_id": 10 ** 9})])
+
+
+def test_ingestion_checks_the_series_without_points(database):
+    element = operations.create_one_element(
+        operations.create_one_edium(models.CreateEdiumModel(title="Idle sensor")).id,
+        models.CreateElementModel(
+            name="humidity", version=models.CreateVersionModel(value_type="float", value_json=40.0),
+        ),
+    )
+    with pytest.raises(ValidationError, match="at least 1 item"):
+        models.ElementVersionSeriesModel(element_id=element.id, value_type="float", points=[])
+
+    # The storage checks the elements even without points
+    with orm.db_session:
+        with pytest.raises(exceptions.ObjectNotFound):
+            ingestion.ingest_versions([(10 ** 9, "float", [], None)])
+    with orm.db_session:
+        with pytest.raises(exceptions.RevisionConflict):
+            ingestion.ingest_versions([(element.id, "float", [], element.revision + 1)])
+    assert operations.get_one_element(element.id, mode="none").revision == element.revision
@@ -0,0 +1,46 @@
+import json
+import subprocess
+import sys
+
+from denseedia import models
+from denseedia.api import operations
+from denseedia.api.cache import response_cache
+from denseedia.storage.invalidation import ChangeWatcher
+
+# Another server process : it has its own caches, and only shares the file
+OTHER_WORKER = """
+import sys
+from denseedia import models
+from denseedia.api import operations
+from denseedia.storage import tables
+tables.use_database(sys.argv[1])
+operations.modify_one_edium(int(sys.argv[2]), models.ModifyEdiumModel(title="Renamed by another worker"))
+"""
+
+
+def test_watcher_dispatches_new_changes(database):
+    watcher = ChangeWatcher()
+    received = []
+    watcher.subscribe(received.extend)
+    watcher.poll()
+    assert received == []
+
+    edium = operations.create_one_edium(models.CreateEdiumModel(title="Watched"))
+    watcher.poll()
+    assert [(event.table, event.object_id, event.operation) for event in received] == [
+        ("edium", edium.id, "create"),
+    ]
+    watcher.poll()
+    assert len(received) == 1
+
+
+def test_writes_of_another_process_invalidate_the_cache(database):
+    edium = operations.create_one_edium(models.CreateEdiumModel(title="Cached here"))
+    operations.get_one_edium_body(edium.id)
+    hits = response_cache.stats().hits
+    assert json.loads(operations.get_one_edium_body(edium.id))["title"] == "Cached here"
+    assert response_cache.stats().hits == hits + 1
+
+    file_path = database.provider.pool.filename
+    subprocess.run([sys.executable, "-c", OTHER_WORKER, file_path, str(edium.id)], check=True)
+    assert json.loads(operations.get_one_edium_body(edium.id))["title"] == "Renamed by another worker"
@@ -0,0 +1,27 @@
+from denseedia import models
+from denseedia.api import operations
+
+
+def sizes():
+    return {kind.name: kind.size for kind in operations.get_kinds() if kind.name.startswith("kinds-")}
+
+
+def test_kind_counts(database):
+    ids = [
+        operations.create_one_edium(models.CreateEdiumModel(title=f"Counted {index}", kind=kind)).id
+        for (index, kind) in enumerate(["kinds-a", "kinds-a", "kinds-a", "kinds-b"])
+    ]
+    assert sizes() == {"kinds-a": 3, "kinds-b": 1}
+
+    operations.modify_one_edium(ids[3], models.ModifyEdiumModel(kind="kinds-a"))
+    operations.delete_one_edium(ids[0])
+    assert sizes() == {"kinds-a": 3}
+
+    # The set-based writes go through the same triggers
+    operations.modify_edia_by_filter("kinds-a", "Counted 1", models.ModifyEdiumModel(kind="kinds-c"), dry_run=False)
+    operations.delete_edia_by_filter("kinds-a", None, dry_run=False)
+    assert sizes() == {"kinds-c": 1}
+
+    operations.modify_one_edium(ids[1], models.ModifyEdiumModel(kind=""))
+    assert sizes() == {}
+    assert "" not in {kind.name for kind in operations.get_kinds()}
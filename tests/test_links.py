@@ -0,0 +1,31 @@
+import pytest
+
+from denseedia import exceptions, models
+from denseedia.api import operations
+
+
+def test_merge_duplicates_and_upsert(database):
+    (first, second) = (operations.create_one_edium(models.CreateEdiumModel(title=f"Linked {index}")).id for index in range(2))
+    data = models.CreateLinkModel(start=first, end=second, directed=True, label="twice")
+    kept = operations.create_one_link(data)
+    operations.create_one_link(data)
+    operations.create_one_link(data)
+
+    assert operations.merge_duplicate_links(dry_run=True, unique_index=None).count == 2
+    assert operations.merge_duplicate_links(dry_run=False, unique_index=True).count == 2
+    try:
+        assert [link.id for link in operations.get_links_of_one_edium(first)] == [kept.id]
+        with pytest.raises(exceptions.DuplicateLink):
+            operations.create_one_link(data)
+
+        assert operations.upsert_one_link(data) == (kept, False)
+        (created, is_new) = operations.upsert_one_link(data.copy(update={"directed": False}))
+        assert is_new and created.id != kept.id
+        assert operations.upsert_one_link(data.copy(update={"directed": False})) == (created, False)
+        with pytest.raises(exceptions.ObjectNotFound):
+            operations.upsert_one_link(data.copy(update={"end": 10 ** 9}))
+    finally:
+        operations.merge_duplicate_links(dry_run=False, unique_index=False)
+
+    # Without the index, the upsert still finds the link
+    assert operations.upsert_one_link(data) == (kept, False)
@@ -0,0 +1,48 @@
+from fastapi.testclient import TestClient
+
+from denseedia import models
+from denseedia.api import idle, operations
+from denseedia.api.app import app
+
+
+def test_maintenance_frees_the_deleted_pages(database):
+    client = TestClient(app)
+    edium_ids = [
+        operations.create_one_edium(models.CreateEdiumModel(title=f"Bulky {n} " + "x" * 4000)).id
+        for n in range(200)
+    ]
+    for edium_id in edium_ids:
+        operations.delete_one_edium(edium_id)
+
+    space = client.get("/admin/maintenance/space").json()
+    assert space["incremental_vacuum"]
+    assert space["free_pages"] >= 150
+    assert "Edium" in {usage["name"] for usage in space["objects"]}
+
+    report = client.post("/admin/maintenance/vacuum?max_pages=10").json()
+    assert report["freed_pages"] == 10
+    report = client.post("/admin/maintenance/vacuum").json()
+    assert report["free_pages"] == 0
+    assert client.get("/admin/maintenance/space").json()["pages"] <= space["pages"] - space["free_pages"]
+
+    assert client.post("/admin/maintenance/check?full=true").json()["ok"]
+    assert client.post("/admin/maintenance/analyze").status_code == 200
+
+
+def test_idle_maintenance_stops_the_vacuum_on_a_request(database):
+    edium_ids = [
+        operations.create_one_edium(models.CreateEdiumModel(title=f"Idle {n} " + "x" * 4000)).id
+        for n in range(600)
+    ]
+    for edium_id in edium_ids:
+        operations.delete_one_edium(edium_id)
+    scheduler = idle.IdleMaintenance(interval=3600, idle_delay=0)
+    assert scheduler.is_idle()
+    scheduler.idle_delay = 3600
+    idle.activity.touch()
+    scheduler.run()
+    # A single step ran, as the server wasn't idle
+    assert operations.get_space_report().free_pages > 0
+    scheduler.idle_delay = 0
+    scheduler.run()
+    assert operations.get_space_report().free_pages == 0
@@ -0,0 +1,34 @@
+import sqlite3
+
+from denseedia import models
+from denseedia.api import operations
+from denseedia.storage import migrations
+
+
+def test_most_used_elements(database):
+    for index in range(3):
+        edium = operations.create_one_edium(models.CreateEdiumModel(title=f"Named {index}", kind="names"))
+        for name in ("url", "rating")[:index]:
+            version = models.CreateVersionModel(value_type="int", value_json=index)
+            operations.create_one_element(edium.id, models.CreateElementModel(name=name, version=version))
+    assert operations.most_used_elements("names", 5) == [("url", 2), ("rating", 1)]
+    assert operations.most_used_elements("names", 1) == [("url", 2)]
+
+
+def test_migrate_element_names(tmp_path):
+    file_path = tmp_path / "old.db"
+    connection = sqlite3.connect(str(file_path), isolation_level=None)
+    connection.executescript(
+        'CREATE TABLE "Element" ("id" INTEGER PRIMARY KEY AUTOINCREMENT, "edium" INTEGER NOT NULL, '
+        '"name" TEXT NOT NULL, "creation_date" DATETIME NOT NULL, "updated_at" DATETIME NOT NULL, "todo" BOOLEAN NOT NULL);'
+        "INSERT INTO \"Element\" VALUES (1, 1, 'url', '2021-01-01', '2021-01-01', 0), (2, 2, 'url', '2021-01-01', "
+        "'2021-01-01', 1), (5, 2, 'year', '2021-01-01', '2021-01-01', 0);"
+        "UPDATE sqlite_sequence SET seq = 7 WHERE name = 'Element';"
+        "PRAGMA user_version = 1;"
+    )
+    migrations.upgrade(file_path)
+    assert connection.execute(
+        'SELECT e."id", n."text", e."todo" FROM "Element" e JOIN "ElementName" n ON n."id" = e."name_ref"'
+    ).fetchall() == [(1, "url", 0), (2, "url", 1), (5, "year", 0)]
+    assert connection.execute("SELECT seq FROM sqlite_sequence WHERE name = 'Element'").fetchone() == (7,)
+    connection.close()
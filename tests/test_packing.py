@@ -0,0 +1,73 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from denseedia import models
+from denseedia.api import operations
+from denseedia.api.app import app
+from denseedia.storage import migrations, packing
+from denseedia.storage.tables import database, orm
+
+LYRICS = "Here comes the chorus, again and again.\n" * 100
+
+
+@pytest.fixture
+def small_threshold():
+    (threshold, codec) = (packing.threshold, packing.codec)
+    packing.configure(256)
+    yield
+    packing.configure(threshold, codec)
+
+
+def _packed(element_id: int):
+    with orm.db_session:
+        return database.select(
+            'SELECT "packed" IS NOT NULL, length("json") FROM "Version" WHERE "element" = $element_id ORDER BY "id"',
+            {"element_id": element_id},
+        )
+
+
+def test_large_values_are_stored_compressed(database, small_threshold):
+    client = TestClient(app)
+    edium = operations.create_one_edium(models.CreateEdiumModel(title="Packed song"))
+    element = operations.create_one_element(edium.id, models.CreateElementModel(
+        name="packed lyrics",
+        version=models.CreateVersionModel(value_type="str", value_json=LYRICS),
+    ))
+    operations.create_one_version(element.id, models.CreateVersionModel(value_type="str", value_json="Short"))
+    operations.ingest_versions([models.ElementVersionSeriesModel(
+        element_id=element.id, value_type="str", points=[(datetime(2000, 1, 1), LYRICS + "Outro")],
+    )])
+    assert _packed(element.id) == [(1, 2), (0, 7), (1, 2)]
+
+    versions = client.get(f"/element/{element.id}?versions=all").json()["versions"]
+    assert [version["value_json"] for version in versions] == [LYRICS, "Short", LYRICS + "Outro"]
+    assert client.get(f"/element/{element.id}").json()["versions"] == []
+    orm_versions = sorted(operations.get_one_element(element.id, "all").versions, key=lambda version: version.id)
+    assert [version.value_json for version in orm_versions] == [LYRICS, "Short", LYRICS + "Outro"]
+
+    operations.modify_one_version(versions[1]["id"], models.CreateVersionModel(value_type="str", value_json=LYRICS))
+    operations.modify_one_version(versions[0]["id"], models.CreateVersionModel(value_type="str", value_json="None"))
+    assert _packed(element.id) == [(0, 6), (1, 2), (1, 2)]
+    # The filters read the compressed last values too
+    titles = [edium["title"] for edium in operations.search_edia_by_filter("'packed lyrics' ~ chorus", "id", 10, 0)]
+    assert titles == ["Packed song"]
+
+    # The deltas of a packed history are small, and rebuilt from the packed values
+    operations.create_one_version(element.id, models.CreateVersionModel(value_type="str", value_json=LYRICS + "!"))
+    report = operations.encode_histories("packed lyrics", 8)
+    assert report.deltas == 2
+    versions = client.get(f"/element/{element.id}?versions=all").json()["versions"]
+    assert [version["value_json"] for version in versions] == ["None", LYRICS, LYRICS + "Outro", LYRICS + "!"]
+
+
+def test_the_migration_compresses_the_values_already_there(small_threshold):
+    connection = sqlite3.connect(":memory:", isolation_level=None)
+    connection.execute('CREATE TABLE "Version" ("id" INTEGER PRIMARY KEY, "json" JSON NOT NULL)')
+    connection.executemany('INSERT INTO "Version" ("json") VALUES (?)', [(packing.dumps(LYRICS),), ('"Short"',)])
+    migrations._pack_large_values(connection)
+    ((json_text, packed), short) = connection.execute('SELECT "json", "packed" FROM "Version" ORDER BY "id"')
+    assert json_text == '""' and packing.unpack(packed) == LYRICS
+    assert short == ('"Short"', None)
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from denseedia import exceptions, models
+from denseedia.api import operations
+from denseedia.api.app import app
+from denseedia.storage import revisions
+from denseedia.storage.tables import database, Element, orm
+
+
+def _create_element(name: str) -> models.ElementModel:
+    edium = operations.create_one_edium(models.CreateEdiumModel(title=f"Revised {name}"))
+    return operations.create_one_element(edium.id, models.CreateElementModel(
+        name=name,
+        version=models.CreateVersionModel(value_type="int", value_json=0),
+    ))
+
+
+def test_writes_compare_the_revision(database):
+    client = TestClient(app)
+    element = _create_element("compared")
+    assert element.revision == 1
+    url = f"/element/{element.id}"
+    body = {"value_type": "int", "value_json": 1}
+
+    assert client.post(f"{url}/version", json=body, headers={"If-Match": '"1"'}).status_code == 200
+    response = client.post(f"{url}/version", json=body, headers={"If-Match": '"1"'})
+    assert response.status_code == 409
+    assert response.json()["detail"] == f"Element '{element.id}' is at revision 2, not 1"
+    assert client.post(f"{url}/version?expected_revision=2", json=body).status_code == 200
+    assert client.post(f"{url}/version", json=body).status_code == 200
+    assert client.get(url).json()["revision"] == 4
+
+    assert client.patch(url, json={"name": "renamed"}, headers={"If-Match": "3"}).status_code == 409
+    assert client.patch(url, json={"name": "renamed"}, headers={"If-Match": "*"}).status_code == 200
+    assert client.patch(url, json={"name": "renamed"}, headers={"If-Match": "five"}).status_code == 400
+    points = {"value_type": "int", "points": [["2022-01-01T00:00:00", 5]]}
+    assert client.post(f"{url}/versions", json=points, headers={"If-Match": "4"}).status_code == 409
+    assert client.post(f"{url}/versions", json=points, headers={"If-Match": "5"}).status_code == 200
+    versions = client.get(f"{url}?versions=all").json()["versions"]
+    assert len(versions) == 5
+    assert client.delete(f"/version/{versions[0]['id']}", headers={"If-Match": "5"}).status_code == 409
+    assert client.delete(url, headers={"If-Match": "6"}).status_code == 200
+
+
+def test_concurrent_writes_keep_a_single_last_version(database):
+    element = _create_element("raced")
+    read = threading.Event()
+    written = threading.Event()
+    errors = []
+
+    def slow_writer():
+        try:
+            with orm.db_session:
+                slow = Element[element.id]
+                assert slow.revision == 1
+                read.set()
+                written.wait()
+                slow.create_version2("int", 1)
+        except exceptions.RevisionConflict as exc:
+            errors.append(exc)
+
+    thread = threading.Thread(target=slow_writer)
+    thread.start()
+    read.wait()
+    operations.create_one_version(element.id, models.CreateVersionModel(value_type="int", value_json=2))
+    written.set()
+    thread.join()
+
+    assert len(errors) == 1
+    with orm.db_session:
+        assert database.select(
+            'SELECT COUNT(*) FROM "Version" WHERE "element" = $element_id AND "last" = 1',
+            {"element_id": element.id},
+        ) == [1]
+        assert Element[element.id].revision == 2
+    with pytest.raises(exceptions.RevisionConflict):
+        operations.modify_one_element(element.id, models.ModifyElementModel(name="late"), expected_revision=1)
+
+
+def test_raw_bump_of_a_loaded_element(database):
+    element = _create_element("loaded")
+    with orm.db_session:
+        loaded = Element[element.id]
+        revisions.bump(element.id, expected=1)
+        # Pony's optimistic check still sees the right revision
+        loaded.todo = True
+        orm.flush()
+        assert loaded.revision == 2
+        with pytest.raises(exceptions.RevisionConflict):
+            revisions.bump(element.id, expected=1)
+    with orm.db_session:
+        assert Element[element.id].revision == 2
+        assert Element[element.id].todo
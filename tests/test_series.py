@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import numpy as np
+
+from denseedia.api import operations
+from denseedia.storage import series
+from denseedia.storage.tables import Edium, orm, Version
+
+
+def _add_history(edium: Edium, name: str, points) -> int:
+    element = edium.elements.create(name=name)
+    for (index, (date, value_type, value)) in enumerate(points):
+        Version(element=element, value_type=value_type, json=value, creation_date=date, last=index == len(points) - 1)
+    orm.flush()
+    return element.id
+
+
+def test_series(database):
+    day = 24 * 3600
+    with orm.db_session:
+        first = Edium(title="Sensor 1", kind="series-test")
+        second = Edium(title="Sensor 2", kind="series-test")
+        element_id = _add_history(first, "temperature", [
+            (datetime(1970, 1, 1, 12), 2, 10),
+            (datetime(1970, 1, 1, 18), 3, 20.5),
+            (datetime(1970, 1, 2, 6), 4, "broken"),  # Skipped
+            (datetime(1970, 1, 3, 6), 3, 4.0),
+        ])
+        _add_history(second, "temperature", [
+            (datetime(1970, 1, 2, 0), 2, 7),
+        ])
+        (first_id, second_id) = (first.id, second.id)
+
+    content = operations.get_element_series(element_id)
+    assert content.timestamps.tolist() == [12 * 3600, 18 * 3600, 2 * day + 6 * 3600]
+    assert content.values.tolist() == [10, 20.5, 4]
+
+    by_day = operations.get_element_series(element_id, bucket=day, how="mean")
+    assert by_day.timestamps.tolist() == [0, 2 * day]
+    assert by_day.values.tolist() == [15.25, 4]
+    assert operations.get_element_series(element_id, bucket=day, how="max").values.tolist() == [20.5, 4]
+    assert operations.get_element_series(element_id, bucket=day, how="count").values.tolist() == [2, 1]
+
+    matrix = operations.get_kind_series("series-test", "temperature")
+    assert matrix.edium_ids.tolist() == [first_id, second_id]
+    assert matrix.timestamps.tolist() == [12 * 3600, 18 * 3600, day, 2 * day + 6 * 3600]
+    np.testing.assert_equal(matrix.values, [
+        [10, 20.5, 20.5, 4],
+        [np.nan, np.nan, 7, 7],
+    ])
+
+    matrix = operations.get_kind_series("series-test", "temperature", bucket=day, how="last")
+    assert matrix.timestamps.tolist() == [0, day, 2 * day]
+    np.testing.assert_equal(matrix.values, [
+        [20.5, np.nan, 4],
+        [np.nan, 7, np.nan],
+    ])
+    assert matrix.to_dict()["values"][1] == [None, 7.0, None]
+
+    empty = operations.get_kind_series("series-test", "unknown")
+    assert empty.values.shape == (0, 0)
+    assert len(series.Series(np.array([], dtype=np.int64), np.array([])).pack()) == 4
@@ -0,0 +1,49 @@
+import subprocess
+import sys
+
+# The in-memory mode binds the database, so it runs in its own process
+UNCOMMITTED_WRITE = """
+import sys
+import threading
+import time
+from pathlib import Path
+from denseedia.storage import snapshots
+from denseedia.storage.tables import Edium, orm
+
+snapshotter = snapshots.use_memory_database(Path(sys.argv[1]), 3600)
+flushed = threading.Event()
+counts = []
+
+def write_then_roll_back():
+    try:
+        with orm.db_session:
+            Edium(title="Never committed", kind="test")
+            orm.flush()
+            flushed.set()
+            # Let the reader run while the write is pending
+            time.sleep(0.3)
+            raise RuntimeError
+    except RuntimeError:
+        pass
+
+def read():
+    flushed.wait()
+    with orm.db_session:
+        counts.append(orm.count(edium for edium in Edium))
+
+threads = [threading.Thread(target=write_then_roll_back), threading.Thread(target=read)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+snapshotter.stop()
+print(counts[0])
+"""
+
+
+def test_in_memory_reads_wait_for_the_current_write(tmp_path):
+    result = subprocess.run(
+        [sys.executable, "-c", UNCOMMITTED_WRITE, str(tmp_path / "memory.db")],
+        check=True, capture_output=True, text=True, timeout=60,
+    )
+    assert result.stdout.split() == ["0"]
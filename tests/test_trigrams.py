@@ -0,0 +1,49 @@
+from denseedia import models
+from denseedia.api import operations, writes
+from denseedia.storage import trigrams
+from denseedia.storage.tables import orm
+
+
+def _index_position():
+    with orm.db_session:
+        return trigrams._position()
+
+
+def test_fuzzy_search_and_duplicates(database):
+    titles = ["The Legend of Zelda", "The Legend of Zelda II", "Legend of Zeldda", "Super Mario Bros", "Metroid"]
+    ids = [
+        writes.run(operations.create_one_edium, models.CreateEdiumModel(title=title, kind="trigram")).id
+        for title in titles
+    ]
+    # The writes keep the index up to date
+    position = _index_position()
+    assert position is not None
+
+    found = operations.search_similar_edia("legend zelda", "trigram", threshold=0.3, limit=10)
+    assert {edium["id"] for edium in found[:3]} == {ids[0], ids[1], ids[2]}
+    assert all(first["similarity"] >= second["similarity"] for (first, second) in zip(found, found[1:]))
+    assert ids[3] not in {edium["id"] for edium in found}
+
+    pairs = operations.find_duplicates("trigram", threshold=0.6)
+    assert {(pair["first"]["id"], pair["second"]["id"]) for pair in pairs} == {
+        (ids[0], ids[1]),
+        (ids[0], ids[2]),
+        (ids[1], ids[2]),
+    }
+
+    # A change that isn't in the index yet is found all the same, and the
+    # reads don't write it there
+    operations.modify_one_edium(ids[3], models.ModifyEdiumModel(title="The Legend of Zelda"))
+    found = operations.search_similar_edia("the legend of zelda", "trigram", threshold=0.99, limit=10)
+    assert {edium["id"] for edium in found} == {ids[0], ids[3]}
+    pairs = operations.find_duplicates("trigram", threshold=0.99)
+    assert [(pair["first"]["id"], pair["second"]["id"], pair["similarity"]) for pair in pairs] == [
+        (ids[0], ids[3], 1.0),
+    ]
+    assert _index_position() == position
+
+    # Until the next write
+    writes.run(operations.modify_one_edium, ids[4], models.ModifyEdiumModel(title="Metroid Prime"))
+    assert _index_position() > position
+    found = operations.search_similar_edia("the legend of zelda", "trigram", threshold=0.99, limit=10)
+    assert {edium["id"] for edium in found} == {ids[0], ids[3]}
@@ -0,0 +1,109 @@
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from denseedia import exceptions, models
+from denseedia.api import operations
+from denseedia.api.writes import WriteCoordinator
+from denseedia.storage.tables import Edium, orm
+
+
+def _create_then_fail(title: str) -> None:
+    """A write that fails after modifying the database."""
+    with orm.db_session:
+        Edium(title=title)
+        orm.flush()
+        raise ValueError(title)
+
+
+def test_group_commit(database):
+    coordinator = WriteCoordinator(window=0.2)
+    calls = [
+        (operations.create_one_edium, models.CreateEdiumModel(title="Grouped 1")),
+        (operations.delete_one_edium, 10 ** 9),
+        (operations.create_one_edium, models.CreateEdiumModel(title="Grouped 2")),
+        (_create_then_fail, "Grouped 3"),
+        (operations.create_one_edium, models.CreateEdiumModel(title="Grouped 4")),
+    ]
+    with ThreadPoolExecutor(len(calls)) as executor:
+        futures = [executor.submit(coordinator.submit, func, arg) for (func, arg) in calls]
+
+    assert futures[0].result().title == "Grouped 1"
+    with pytest.raises(exceptions.ObjectNotFound):
+        futures[1].result()
+    assert futures[2].result().title == "Grouped 2"
+    with pytest.raises(ValueError):
+        futures[3].result()
+    assert futures[4].result().title == "Grouped 4"
+
+    with orm.db_session:
+        titles = set(orm.select(e.title for e in Edium if e.title.startswith("Grouped")))
+    assert titles == {"Grouped 1", "Grouped 2", "Grouped 4"}
+
+
+def _submit_in_order(coordinator: WriteCoordinator, calls):
+    """Submit the writes one after the other, in the same group."""
+    with ThreadPoolExecutor(len(calls)) as executor:
+        futures = []
+        for (func, *args) in calls:
+            futures.append(executor.submit(coordinator.submit, func, *args))
+            time.sleep(0.02)
+    return futures
+
+
+def test_group_commit_around_set_based_writes(database):
+    edium = operations.create_one_edium(models.CreateEdiumModel(title="Loaded then deleted"))
+    element = operations.create_one_element(edium.id, models.CreateElementModel(
+        name="grouped note",
+        version=models.CreateVersionModel(value_type="int", value_json=1),
+    ))
+    coordinator = WriteCoordinator(window=0.5)
+    futures = _submit_in_order(coordinator, [
+        (operations.modify_one_edium, edium.id, models.ModifyEdiumModel(title="Renamed")),
+        (operations.get_one_element, element.id, models.VersionsMode.ALL),
+        (operations.delete_one_edium, edium.id),
+        (operations.modify_one_edium, edium.id, models.ModifyEdiumModel(title="Renamed again")),
+        (operations.create_one_version, element.id, models.CreateVersionModel(value_type="int", value_json=2)),
+    ])
+
+    assert futures[0].result().title == "Renamed"
+    assert futures[2].result().title == "Renamed"
+    # The objects loaded before the deletion aren't reused after it
+    for future in futures[3:]:
+        with pytest.raises(exceptions.ObjectNotFound):
+            future.result()
+
+
+def test_group_commit_around_revision_bumps(database):
+    edium = operations.create_one_edium(models.CreateEdiumModel(title="Bumped in a group"))
+    element = operations.create_one_element(edium.id, models.CreateElementModel(
+        name="grouped series",
+        version=models.CreateVersionModel(value_type="int", value_json=1),
+    ))
+    point = models.ElementVersionSeriesModel(
+        element_id=element.id,
+        value_type="int",
+        points=[(datetime(2020, 1, 1), 0)],
+        expected_revision=3,
+    )
+    coordinator = WriteCoordinator(window=0.5)
+    futures = _submit_in_order(coordinator, [
+        (operations.create_one_version, element.id, models.CreateVersionModel(value_type="int", value_json=2), 1),
+        (operations.modify_one_element, element.id, models.ModifyElementModel(name="renamed series"), 2),
+        (operations.ingest_versions, [point]),
+        (operations.modify_one_element, element.id, models.ModifyElementModel(name="stale series"), 3),
+        (operations.modify_one_element, element.id, models.ModifyElementModel(name="renamed again"), 4),
+        (operations.delete_one_element, element.id, 5),
+    ])
+
+    assert futures[0].result().value_json == 2
+    assert (futures[1].result().name, futures[1].result().revision) == ("renamed series", 3)
+    assert (futures[2].result().elements, futures[2].result().versions) == (1, 1)
+    with pytest.raises(exceptions.RevisionConflict, match="at revision 4, not 3"):
+        futures[3].result()
+    assert (futures[4].result().name, futures[4].result().revision) == ("renamed again", 5)
+    assert futures[5].result().revision == 6
+    with pytest.raises(exceptions.ObjectNotFound):
+        operations.get_one_element(element.id, models.VersionsMode.NONE)